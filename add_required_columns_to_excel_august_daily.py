@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import glob
 import json
+from order_book import load_order_book, normalize_order_id
+from transcript_store import get_transcript
 
 def add_required_columns_for_date(date_str):
     """
@@ -63,12 +65,12 @@ def add_required_columns_for_date(date_str):
         return None
     
     # Load order data
-    try:
-        order_df = pd.read_csv(order_file_path)
-        print(f"Loaded order file with {len(order_df)} records")
-    except Exception as e:
-        print(f"Error loading order file: {e}")
+    order_book = load_order_book(date_str, order_file=order_file_path)
+    if order_book is None:
+        print(f"Error loading order file: {order_file_path}")
         return None
+    order_df = order_book.orders
+    print(f"Loaded order file with {len(order_df)} records")
     
     # Load audio validation data if available
     audio_validation_df = None
@@ -260,14 +262,13 @@ def add_required_columns_for_date(date_str):
     
     # 8. Order Executed (Y/N) - from order files
     # Create a proper mapping from order file
+    # ExchOrderID is a normalized string in the loaded OrderBook; take first occurrence if duplicates
     order_status_map = {}
-    for _, row in order_df.iterrows():
-        order_id = row['ExchOrderID']
-        status = row['Status']
-        if order_id not in order_status_map:  # Take first occurrence if duplicates
+    for order_id, status in zip(order_df['ExchOrderID'], order_df['Status'].astype(str)):
+        if order_id and order_id not in order_status_map:
             order_status_map[order_id] = status
     
-    df['Order Executed (Y/N)'] = df['order_id'].map(lambda x: 'Y' if order_status_map.get(x) == 'Complete' else 'N')
+    df['Order Executed (Y/N)'] = df['order_id'].map(lambda x: 'Y' if order_status_map.get(normalize_order_id(x)) == 'Complete' else 'N')
     
     # 9. Call Extract - from transcripts
     df['Call Extract'] = ''
@@ -283,29 +284,27 @@ def add_required_columns_for_date(date_str):
             individual_files = [f.strip() for f in audio_file.split(',')]
             combined_transcript = ""
             for individual_file in individual_files:
-                transcript_file = os.path.join(transcripts_path, individual_file + ".txt")
-                if os.path.exists(transcript_file):
-                    try:
-                        with open(transcript_file, 'r', encoding='utf-8') as f:
-                            transcript = f.read()
-                        if combined_transcript:
-                            combined_transcript += f"\n\n=== {individual_file} ===\n"
-                        combined_transcript += transcript
-                    except Exception as e:
-                        print(f"Error reading transcript for {individual_file}: {e}")
+                try:
+                    transcript = get_transcript(individual_file, transcripts_path)
+                except Exception as e:
+                    print(f"Error reading transcript for {individual_file}: {e}")
+                    continue
+                if transcript:
+                    if combined_transcript:
+                        combined_transcript += f"\n\n=== {individual_file} ===\n"
+                    combined_transcript += transcript
             
             if combined_transcript:
                 df.at[idx, 'Call Extract'] = combined_transcript[:1000] + "..." if len(combined_transcript) > 1000 else combined_transcript
         else:
             # Single audio file
-            transcript_file = os.path.join(transcripts_path, audio_file + ".txt")
-            if os.path.exists(transcript_file):
-                try:
-                    with open(transcript_file, 'r', encoding='utf-8') as f:
-                        transcript = f.read()
-                    df.at[idx, 'Call Extract'] = transcript[:1000] + "..." if len(transcript) > 1000 else transcript
-                except Exception as e:
-                    print(f"Error reading transcript for {audio_file}: {e}")
+            try:
+                transcript = get_transcript(audio_file, transcripts_path)
+            except Exception as e:
+                print(f"Error reading transcript for {audio_file}: {e}")
+                transcript = None
+            if transcript:
+                df.at[idx, 'Call Extract'] = transcript[:1000] + "..." if len(transcript) > 1000 else transcript
     
     # 10. Call File Name - already present
     df['Call File Name'] = df['audio_file']
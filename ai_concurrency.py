@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Bounded concurrency and retry/backoff for AI matching calls.
+
+The email and OMS validation steps issue one LLM matching call per residual
+instruction group / OMS order. run_keyed_concurrently() runs them on a
+thread pool with at most AI_MATCH_CONCURRENCY calls in flight. Items with
+the same key (client code) run serially on one worker, in input order, and
+results come back in input order, so callers can do their conflict
+resolution / merging in a deterministic reduce pass that gives the same
+output as a serial run.
+"""
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+AI_MATCH_CONCURRENCY = int(os.getenv('AI_MATCH_CONCURRENCY', '4'))
+AI_MATCH_MAX_RETRIES = int(os.getenv('AI_MATCH_MAX_RETRIES', '3'))
+AI_MATCH_BACKOFF_SECONDS = float(os.getenv('AI_MATCH_BACKOFF_SECONDS', '2'))
+
+
+def call_with_retry(fn: Callable, *args, max_retries: int = None, backoff_seconds: float = None,
+                    description: str = 'AI call', **kwargs) -> Any:
+    """
+    Call fn, retrying on exceptions with exponential backoff (plus jitter).
+
+    Args:
+        fn: Callable to invoke (e.g. client.chat.completions.create)
+        max_retries: Attempts in total (defaults to AI_MATCH_MAX_RETRIES)
+        backoff_seconds: Base delay, doubled after every failed attempt
+        description: Label for log messages
+
+    Returns:
+        fn's return value; the last exception is re-raised when all attempts fail
+    """
+    max_retries = AI_MATCH_MAX_RETRIES if max_retries is None else max_retries
+    backoff_seconds = AI_MATCH_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+    for attempt in range(1, max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_seconds * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+            logger.warning(f"{description} failed (attempt {attempt}/{max_retries}): {e} - retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_keyed_concurrently(items: Sequence[Tuple[Any, Any]], worker: Callable[[Any], Any],
+                           max_workers: int = None) -> List[Any]:
+    """
+    Run worker(item) for (key, item) pairs with bounded concurrency.
+
+    Items sharing a key run serially in input order; different keys run in parallel.
+    An exception from worker is returned in place of that item's result.
+
+    Args:
+        items: (key, item) pairs
+        worker: Function applied to each item
+        max_workers: Concurrency limit (defaults to AI_MATCH_CONCURRENCY)
+
+    Returns:
+        Results in the same order as items
+    """
+    max_workers = AI_MATCH_CONCURRENCY if max_workers is None else max_workers
+    results: List[Any] = [None] * len(items)
+
+    by_key: Dict[Any, List[int]] = {}
+    for index, (key, _item) in enumerate(items):
+        by_key.setdefault(key, []).append(index)
+
+    def run_key(indices: List[int]):
+        for index in indices:
+            try:
+                results[index] = worker(items[index][1])
+            except Exception as e:
+                logger.error(f"AI matching task {index} failed: {e}")
+                results[index] = e
+
+    if max_workers <= 1 or len(by_key) <= 1:
+        for indices in by_key.values():
+            run_key(indices)
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(by_key))) as executor:
+        for future in [executor.submit(run_key, indices) for indices in by_key.values()]:
+            future.result()
+    return results
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Persistent catalog of call recordings.
+
+One row per recording under {Month}/Call Records/Call_{date}/ with its
+logical path (also the S3 key suffix), date, mobile number and call start
+parsed from the filename (call_filenames grammars), timestamp format, source
+system, size, content hash and duration.
+The catalog lives in AUDIO_CATALOG_FILE (SQLite) and is updated incrementally:
+
+- FileDiscoveryMapper and the dashboard upload route add files as they land,
+- scan_directory() re-stats one Call_{date} directory and only hashes/measures
+  files that are new or changed (size/mtime), dropping rows for deleted files.
+
+Call-info extraction, transcription, the daily runner's data check, the
+dashboard's file discovery verification and audio playback read recordings
+from here instead of globbing/walking the Call Records trees.
+
+    python audio_catalog.py scan [--month August]
+"""
+import os
+import glob
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from audio_metadata import audio_duration, AUDIO_METADATA_WORKERS
+from audio_utils import file_content_hash
+from call_filenames import parse_call_filename
+
+logger = logging.getLogger(__name__)
+
+# Paths in the catalog are relative to this directory (the surveillance base directory)
+AUDIO_CATALOG_BASE_DIR = os.getenv('AUDIO_CATALOG_BASE_DIR', os.path.dirname(os.path.abspath(__file__)))
+AUDIO_CATALOG_FILE = os.getenv('AUDIO_CATALOG_FILE', os.path.join(AUDIO_CATALOG_BASE_DIR, 'audio_catalog.sqlite'))
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.729')
+
+MONTH_NAMES = {
+    1: "January", 2: "February", 3: "March", 4: "April",
+    5: "May", 6: "June", 7: "July", 8: "August",
+    9: "September", 10: "October", 11: "November", 12: "December"
+}
+
+_COLUMNS = ('path', 's3_key', 'filename', 'date', 'month', 'call_date', 'extension', 'mobile_number',
+            'timestamp_format', 'source_system', 'call_start', 'size', 'mtime', 'content_hash',
+            'duration_seconds', 'updated')
+
+
+def call_records_dir(date_str: str, base_dir: str = None) -> str:
+    """{base}/{Month}/Call Records/Call_{date} for a DDMMYYYY date"""
+    month_name = MONTH_NAMES[int(date_str[2:4])]
+    return os.path.join(base_dir or AUDIO_CATALOG_BASE_DIR, month_name, "Call Records", f"Call_{date_str}")
+
+
+def _date_of_directory(directory: str) -> Optional[str]:
+    name = os.path.basename(os.path.normpath(directory))
+    return name[len('Call_'):] if name.startswith('Call_') else None
+
+
+def _call_date(date_str: Optional[str]) -> Optional[str]:
+    try:
+        return datetime.strptime(date_str, '%d%m%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def filename_candidates(filename: str) -> List[str]:
+    """Report columns sometimes drop the audio extension"""
+    if filename.lower().endswith(AUDIO_EXTENSIONS):
+        return [filename]
+    return [filename, f"{filename}.mp3", f"{filename}.wav"]
+
+
+def _measure(local_path: str):
+    """(content hash, duration) - the expensive part of cataloguing a file"""
+    return file_content_hash(local_path), audio_duration(local_path)
+
+
+class AudioCatalog:
+    """Recording catalog; one connection per process shared across threads"""
+
+    def __init__(self, path: str = None, base_dir: str = None):
+        self.path = path or AUDIO_CATALOG_FILE
+        self.base_dir = os.path.abspath(base_dir or AUDIO_CATALOG_BASE_DIR)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recordings ("
+                "path TEXT PRIMARY KEY, s3_key TEXT, filename TEXT NOT NULL, date TEXT, month TEXT, "
+                "call_date TEXT, extension TEXT, mobile_number TEXT, timestamp_format TEXT, source_system TEXT, "
+                "call_start TEXT, size INTEGER, mtime REAL, content_hash TEXT, duration_seconds REAL, updated TEXT)"
+            )
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(recordings)")}
+            if 'source_system' not in columns:
+                # Catalogs created before the filename grammar registry
+                self._conn.execute("ALTER TABLE recordings ADD COLUMN source_system TEXT")
+                updates = []
+                for row in self._conn.execute("SELECT path, filename FROM recordings"):
+                    parsed = parse_call_filename(row['filename'])
+                    updates.append((parsed.mobile_number, parsed.timestamp_format, parsed.source_system,
+                                    parsed.call_start.isoformat() if parsed.call_start else None, row['path']))
+                self._conn.executemany(
+                    "UPDATE recordings SET mobile_number = ?, timestamp_format = ?, source_system = ?, "
+                    "call_start = ? WHERE path = ?", updates
+                )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS recordings_date ON recordings (date)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS recordings_filename ON recordings (filename)")
+
+    def close(self):
+        self._conn.close()
+
+    def relative_path(self, local_path: str) -> str:
+        """Catalog key for a file: its path relative to the base directory, with '/' separators"""
+        return os.path.relpath(os.path.abspath(local_path), self.base_dir).replace(os.sep, '/')
+
+    def _record(self, row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record['local_path'] = os.path.join(self.base_dir, *record['path'].split('/'))
+        return record
+
+    def _upsert(self, rows: List[tuple]):
+        placeholders = ', '.join('?' for _ in _COLUMNS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO recordings ({', '.join(_COLUMNS)}) VALUES ({placeholders})", rows
+            )
+
+    @staticmethod
+    def _row_values(relative_path: str, date_str: Optional[str], stat: os.stat_result,
+                    content_hash: str, duration: Optional[float], s3_key: Optional[str] = None) -> tuple:
+        parsed = parse_call_filename(relative_path.rsplit('/', 1)[-1])
+        month = relative_path.split('/', 1)[0] if '/' in relative_path else None
+        return (
+            relative_path, s3_key, parsed.filename, date_str, month, _call_date(date_str),
+            os.path.splitext(parsed.filename)[1].lower(), parsed.mobile_number, parsed.timestamp_format,
+            parsed.source_system, parsed.call_start.isoformat() if parsed.call_start else None,
+            stat.st_size, stat.st_mtime, content_hash, duration, datetime.now().isoformat()
+        )
+
+    def add_file(self, local_path: str, date_str: Optional[str] = None, relative_path: Optional[str] = None,
+                 s3_key: Optional[str] = None) -> Dict:
+        """
+        Catalog one recording (after an upload or copy).
+
+        Args:
+            local_path: File to measure (may be a temp file for S3 uploads)
+            date_str: DDMMYYYY date (defaults to the Call_{date} directory name)
+            relative_path: Catalog path when local_path is not under the base directory
+            s3_key: S3 key the file was uploaded to
+
+        Returns:
+            The catalog record
+        """
+        relative_path = relative_path or self.relative_path(local_path)
+        if date_str is None:
+            date_str = _date_of_directory(os.path.dirname(relative_path))
+        content_hash, duration = _measure(local_path)
+        values = self._row_values(relative_path, date_str, os.stat(local_path), content_hash, duration, s3_key)
+        self._upsert([values])
+        return dict(zip(_COLUMNS, values))
+
+    def scan_directory(self, directory: str, date_str: Optional[str] = None) -> Dict[str, int]:
+        """
+        Bring one Call_{date} directory up to date: new/changed files are hashed and
+        measured (in parallel), unchanged files are only stat'ed, missing files are removed.
+
+        Returns:
+            {'added': n, 'updated': n, 'removed': n, 'unchanged': n}
+        """
+        date_str = date_str or _date_of_directory(directory)
+        prefix = self.relative_path(directory) + '/'
+        with self._lock:
+            known = {row['path']: row for row in self._conn.execute(
+                "SELECT path, size, mtime, s3_key FROM recordings WHERE path LIKE ? ESCAPE '\\'",
+                (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',)
+            )}
+        # Only direct children of this directory
+        known = {path: row for path, row in known.items() if '/' not in path[len(prefix):]}
+
+        changed = []
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        seen = set()
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if not entry.is_file() or not entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                relative_path = prefix + entry.name
+                seen.add(relative_path)
+                stat = entry.stat()
+                row = known.get(relative_path)
+                if row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                    counts['unchanged'] += 1
+                    continue
+                counts['updated' if row is not None else 'added'] += 1
+                changed.append((entry.path, relative_path, stat, row['s3_key'] if row is not None else None))
+
+        if changed:
+            workers = max(1, min(AUDIO_METADATA_WORKERS, len(changed)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                measured = list(executor.map(lambda item: _measure(item[0]), changed))
+            self._upsert([
+                self._row_values(relative_path, date_str, stat, content_hash, duration, s3_key)
+                for (_, relative_path, stat, s3_key), (content_hash, duration) in zip(changed, measured)
+            ])
+
+        # Rows of S3-only uploads have no local file to see
+        removed = [path for path, row in known.items() if path not in seen and not row['s3_key']]
+        if removed:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM recordings WHERE path = ?", [(path,) for path in removed])
+            counts['removed'] = len(removed)
+        if changed or removed:
+            logger.info(f"Audio catalog {prefix}: {counts}")
+        return counts
+
+    def recordings(self, date_str: str, local_only: bool = False) -> List[Dict]:
+        """
+        Catalogued recordings of one date, by filename.
+
+        Args:
+            date_str: DDMMYYYY date
+            local_only: Skip recordings catalogued from S3 uploads whose local file does not exist
+
+        Returns:
+            Catalog records (with 'local_path')
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM recordings WHERE date = ? ORDER BY filename", (date_str,)
+            ).fetchall()
+        records = [self._record(row) for row in rows]
+        if local_only:
+            records = [record for record in records if os.path.exists(record['local_path'])]
+        return records
+
+    def find(self, filename: str) -> Optional[Dict]:
+        """Most recent recording with this filename (extension optional), or None"""
+        with self._lock:
+            for candidate in filename_candidates(filename):
+                row = self._conn.execute(
+                    "SELECT * FROM recordings WHERE filename = ? ORDER BY call_date DESC LIMIT 1", (candidate,)
+                ).fetchone()
+                if row is not None:
+                    return self._record(row)
+        return None
+
+    def scan_tree(self, call_records_root: str) -> Dict[str, int]:
+        """scan_directory() for every Call_{date} directory under a {Month}/Call Records folder"""
+        totals = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        for directory in sorted(glob.glob(os.path.join(call_records_root, 'Call_*'))):
+            for key, value in self.scan_directory(directory).items():
+                totals[key] += value
+        return totals
+
+
+_catalogs: Dict[tuple, AudioCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def open_catalog(path: str = None, base_dir: str = None) -> AudioCatalog:
+    """Process-wide catalog (defaults to AUDIO_CATALOG_FILE / AUDIO_CATALOG_BASE_DIR)"""
+    key = (path or AUDIO_CATALOG_FILE, os.path.abspath(base_dir or AUDIO_CATALOG_BASE_DIR))
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = AudioCatalog(*key)
+        return _catalogs[key]
+
+
+def recordings_for_date(date_str: str, base_dir: str = None, local_only: bool = False) -> List[Dict]:
+    """
+    Recordings of one date, after an incremental refresh of its Call_{date} directory.
+
+    Args:
+        date_str: DDMMYYYY date
+        base_dir: Surveillance base directory (defaults to AUDIO_CATALOG_BASE_DIR)
+        local_only: Only recordings whose file exists locally (S3-only uploads are skipped)
+
+    Returns:
+        Catalog records (with 'local_path') sorted by filename
+    """
+    catalog = open_catalog(base_dir=base_dir)
+    catalog.scan_directory(call_records_dir(date_str, catalog.base_dir), date_str)
+    return catalog.recordings(date_str, local_only=local_only)
+
+
+def scan_months(months: Optional[Iterable[str]] = None, base_dir: str = None) -> Dict[str, int]:
+    """Catalog every Call_{date} directory of the given (default: all) month folders"""
+    catalog = open_catalog(base_dir=base_dir)
+    totals = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    for month in months or MONTH_NAMES.values():
+        root = os.path.join(catalog.base_dir, month, "Call Records")
+        if os.path.isdir(root):
+            for key, value in catalog.scan_tree(root).items():
+                totals[key] += value
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Audio catalog maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    scan_parser = subparsers.add_parser('scan', help="Catalog the Call Records folders")
+    scan_parser.add_argument('--month', action='append', help="Month folder to scan (repeatable, default all)")
+    scan_parser.add_argument('--base-dir', help="Surveillance base directory")
+    args = parser.parse_args()
+
+    totals = scan_months(args.month, args.base_dir)
+    print(f"Audio catalog updated: {totals} ({AUDIO_CATALOG_FILE})")
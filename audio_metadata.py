@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Fast call-recording duration reader.
+
+Durations are computed from container/frame headers without decoding audio:
+
+- WAV (RIFF): data chunk size / byte rate from the fmt chunk (covers PCM,
+  mu-law/A-law and G.729-in-WAV recordings)
+- MP3: Xing/Info or VBRI frame count when present (VBR), otherwise
+  audio bytes * 8 / bitrate of the first frame (CBR)
+- G.729 (.729): raw 8 kbit/s bitstream (10 bytes per 10 ms frame), or the
+  ITU test-vector format (sync word + 80 16-bit words per frame)
+
+Only a few KB are read per file, and files are read across a thread pool.
+"""
+import os
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+AUDIO_METADATA_WORKERS = int(os.getenv('AUDIO_METADATA_WORKERS', '16'))
+
+# Used when a file's header cannot be read (the historical fixed window)
+DEFAULT_CALL_DURATION_SECONDS = 300
+
+_HEADER_READ_BYTES = 64 * 1024
+
+# MPEG audio tables: bitrates (kbit/s) by [version][layer][index], sample rates by [version][index]
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+# G.729: 8 kbit/s -> 1000 bytes per second of raw bitstream
+G729_BYTES_PER_SECOND = 1000
+# ITU bitstream format: sync word, length word, 80 bit-words per 10 ms frame
+_G729_ITU_SYNC = b'\x21\x6b'
+_G729_ITU_FRAME_BYTES = 2 * (2 + 80)
+
+
+def wav_duration(path: str) -> Optional[float]:
+    """Duration of a RIFF/WAVE file from its fmt and data chunks"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        byte_rate = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if len(fmt) < 16:
+                    return None
+                _format_tag, _channels, _sample_rate, byte_rate = struct.unpack('<HHII', fmt[:12])
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if not byte_rate:
+                    return None
+                # Recorders that never finalised the header leave 0 or 0xFFFFFFFF here
+                available = file_size - f.tell()
+                data_size = chunk_size if 0 < chunk_size <= available else available
+                return data_size / byte_rate
+            else:
+                f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+
+def _skip_id3v2(data: bytes) -> int:
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _parse_mp3_frame_header(header: bytes) -> Optional[Dict]:
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and version != 1:
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+    channel_mode = header[3] >> 6
+    return {
+        'version': version, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'samples_per_frame': samples_per_frame, 'mono': channel_mode == 3
+    }
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    """Duration of an MP3 file from its Xing/Info/VBRI header, or CBR bitrate"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = _skip_id3v2(f.read(10))
+        f.seek(start)
+        data = f.read(_HEADER_READ_BYTES)
+        id3v1 = 0
+        if file_size >= 128:
+            f.seek(-128, os.SEEK_END)
+            id3v1 = 128 if f.read(3) == b'TAG' else 0
+
+    # Find the first valid frame header (skip padding/garbage before it)
+    frame = None
+    offset = 0
+    while offset + 4 <= len(data):
+        frame = _parse_mp3_frame_header(data[offset:offset + 4])
+        if frame:
+            break
+        offset += 1
+    if not frame:
+        return None
+
+    # Xing/Info (VBR) header sits after the side information
+    if frame['version'] == 1:
+        side_info = 17 if frame['mono'] else 32
+    else:
+        side_info = 9 if frame['mono'] else 17
+    xing_offset = offset + 4 + side_info
+    tag = data[xing_offset:xing_offset + 4]
+    if tag in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack('>I', data[xing_offset + 8:xing_offset + 12])[0]
+            return frames * frame['samples_per_frame'] / frame['sample_rate']
+    vbri_offset = offset + 4 + 32
+    if data[vbri_offset:vbri_offset + 4] == b'VBRI':
+        frames = struct.unpack('>I', data[vbri_offset + 14:vbri_offset + 18])[0]
+        return frames * frame['samples_per_frame'] / frame['sample_rate']
+
+    audio_bytes = file_size - (start + offset) - id3v1
+    return audio_bytes * 8 / frame['bitrate']
+
+
+def g729_duration(path: str) -> Optional[float]:
+    """Duration of a .729 recording (raw bitstream, ITU format, or G.729-in-WAV)"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head[:4] == b'RIFF':
+        return wav_duration(path)
+    file_size = os.path.getsize(path)
+    if head[:2] == _G729_ITU_SYNC:
+        return file_size / _G729_ITU_FRAME_BYTES * 0.01
+    return file_size / G729_BYTES_PER_SECOND
+
+
+def audio_duration(path: str) -> Optional[float]:
+    """
+    Duration of a call recording in seconds, read from headers only.
+
+    Args:
+        path: WAV, MP3 or .729 file
+
+    Returns:
+        Duration in seconds, or None if it cannot be determined
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+        extension = os.path.splitext(path)[1].lower()
+        if magic == b'RIFF':
+            return wav_duration(path)
+        if extension == '.729':
+            return g729_duration(path)
+        if magic[:3] == b'ID3' or (len(magic) >= 2 and magic[0] == 0xFF and (magic[1] & 0xE0) == 0xE0) \
+                or extension == '.mp3':
+            return mp3_duration(path)
+        return None
+    except (OSError, struct.error) as e:
+        logger.warning(f"Could not read audio header of {path}: {e}")
+        return None
+
+
+def audio_durations(paths: Iterable[str], max_workers: int = None) -> Dict[str, Optional[float]]:
+    """
+    Durations for many files, read concurrently (header reads are I/O bound).
+
+    Args:
+        paths: Audio file paths
+        max_workers: Thread count (defaults to AUDIO_METADATA_WORKERS)
+
+    Returns:
+        {path: duration in seconds or None}
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    max_workers = AUDIO_METADATA_WORKERS if max_workers is None else max_workers
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+        return dict(zip(paths, executor.map(audio_duration, paths)))
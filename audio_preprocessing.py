@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Silence trimming and compact re-encoding of call recordings before transcription.
+
+Recordings are decoded to mono PCM (8-16 kHz), an energy-based voice activity
+detector marks speech frames, and non-speech runs longer than
+VAD_MIN_SILENCE_MS (ringing gaps, silent hold, dead air) are cut down to a
+short pause. The result is re-encoded (FLAC by default, Opus optional) and
+sent with its real mime type. Calls that are still longer than
+TRANSCRIBE_SEGMENT_MAX_SECONDS are split into segments at removed-silence
+boundaries (or the quietest frame) so each fits in one model request.
+
+Every kept span is recorded in a timestamp map, so offsets in a transcript
+of the trimmed audio can be mapped back to the original recording with
+to_original_time().
+"""
+import os
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_utils import decode_to_pcm, encode_pcm, load_audio_for_processing, PYAV_AVAILABLE, ffmpeg_available
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_SAMPLE_RATE = int(os.getenv('AUDIO_PREPROCESS_SAMPLE_RATE', '8000'))
+AUDIO_UPLOAD_CODEC = os.getenv('AUDIO_UPLOAD_CODEC', 'flac')
+
+VAD_FRAME_MS = 30
+# Frames this far above the noise floor (and above the absolute floor) count as speech
+VAD_MARGIN_DB = float(os.getenv('VAD_MARGIN_DB', '10'))
+VAD_ABSOLUTE_FLOOR_DBFS = float(os.getenv('VAD_ABSOLUTE_FLOOR_DBFS', '-50'))
+# Only non-speech runs longer than this are trimmed ...
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '1000'))
+# ... and this much of the gap is kept on each side so turn boundaries survive
+VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '250'))
+
+# Calls longer than this (after trimming) are split into segments of about
+# TRANSCRIBE_SEGMENT_TARGET_SECONDS, cut at silence boundaries
+TRANSCRIBE_SEGMENT_MAX_SECONDS = int(os.getenv('TRANSCRIBE_SEGMENT_MAX_SECONDS', '600'))
+TRANSCRIBE_SEGMENT_TARGET_SECONDS = int(os.getenv('TRANSCRIBE_SEGMENT_TARGET_SECONDS', '420'))
+
+
+def frame_energies_db(samples: np.ndarray, sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """RMS energy per frame in dBFS"""
+    frame_length = max(1, sample_rate * frame_ms // 1000)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.zeros(0)
+    frames = samples[:frame_count * frame_length].astype(np.float64).reshape(frame_count, frame_length) / 32768.0
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def detect_speech_spans(samples: np.ndarray, sample_rate: int) -> List[List[int]]:
+    """
+    Sample ranges to keep: speech plus padding, with short gaps left intact.
+
+    Args:
+        samples: Mono int16 samples
+        sample_rate: Sample rate
+
+    Returns:
+        [[start_sample, end_sample], ...] in ascending order
+    """
+    energies = frame_energies_db(samples, sample_rate)
+    if len(energies) == 0:
+        return [[0, len(samples)]]
+    frame_length = sample_rate * VAD_FRAME_MS // 1000
+    noise_floor = np.percentile(energies, 10)
+    threshold = max(noise_floor + VAD_MARGIN_DB, VAD_ABSOLUTE_FLOOR_DBFS)
+    speech = energies > threshold
+    if not speech.any():
+        return []
+
+    min_silence_frames = max(1, VAD_MIN_SILENCE_MS // VAD_FRAME_MS)
+    padding = VAD_PADDING_MS * sample_rate // 1000
+
+    spans: List[List[int]] = []
+    speech_frames = np.flatnonzero(speech)
+    run_start = previous = speech_frames[0]
+    for frame in list(speech_frames[1:]) + [None]:
+        # A gap shorter than the minimum silence is kept as part of the speech run
+        if frame is not None and frame - previous <= min_silence_frames:
+            previous = frame
+            continue
+        start = max(0, run_start * frame_length - padding)
+        end = min(len(samples), (previous + 1) * frame_length + padding)
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+        if frame is not None:
+            run_start = previous = frame
+    return spans
+
+
+def build_timestamp_map(spans: List[List[int]], sample_rate: int) -> List[Dict[str, float]]:
+    """Kept spans as {'trimmed_start', 'original_start', 'duration'} in seconds"""
+    timestamp_map = []
+    trimmed_position = 0
+    for start, end in spans:
+        timestamp_map.append({
+            'trimmed_start': round(trimmed_position / sample_rate, 3),
+            'original_start': round(start / sample_rate, 3),
+            'duration': round((end - start) / sample_rate, 3)
+        })
+        trimmed_position += end - start
+    return timestamp_map
+
+
+def plan_segments(samples: np.ndarray, sample_rate: int, boundaries: List[int],
+                  max_seconds: int = None, target_seconds: int = None) -> List[List[int]]:
+    """
+    Split points for long audio, preferring silence boundaries.
+
+    Args:
+        samples: Mono int16 samples (already trimmed)
+        sample_rate: Sample rate
+        boundaries: Candidate cut positions (sample offsets where silence was removed)
+        max_seconds: Longest allowed segment
+        target_seconds: Preferred segment length
+
+    Returns:
+        [[start_sample, end_sample], ...] covering all samples
+    """
+    max_length = (max_seconds or TRANSCRIBE_SEGMENT_MAX_SECONDS) * sample_rate
+    target_length = min((target_seconds or TRANSCRIBE_SEGMENT_TARGET_SECONDS) * sample_rate, max_length)
+    total = len(samples)
+    if total <= max_length:
+        return [[0, total]]
+
+    frame_length = sample_rate * VAD_FRAME_MS // 1000
+    segments = []
+    start = 0
+    while total - start > max_length:
+        window_start = start + target_length // 2
+        window_end = start + max_length
+        candidates = [b for b in boundaries if window_start < b <= window_end]
+        if candidates:
+            # Removed silence closest to the target length
+            cut = min(candidates, key=lambda b: abs(b - (start + target_length)))
+        else:
+            # One long stretch of speech: cut at the quietest frame in the window
+            energies = frame_energies_db(samples[window_start:window_end], sample_rate)
+            cut = window_start + int(np.argmin(energies)) * frame_length if len(energies) else window_end
+        segments.append([start, cut])
+        start = cut
+    segments.append([start, total])
+    return segments
+
+
+def to_original_time(seconds: float, timestamp_map: List[Dict[str, float]]) -> float:
+    """Map an offset in the trimmed audio to the offset in the original recording"""
+    for span in reversed(timestamp_map):
+        if seconds >= span['trimmed_start']:
+            return span['original_start'] + min(seconds - span['trimmed_start'], span['duration'])
+    return seconds
+
+
+def _content_key(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def preprocess_audio(file_path: str, codec: str = None, sample_rate: int = None,
+                     max_segment_seconds: int = None) -> Dict:
+    """
+    Trim silence from a recording, split long calls, and re-encode for upload.
+
+    Falls back to the untrimmed file bytes (with the right mime type) as a
+    single segment when no decoder is available or the file cannot be decoded.
+
+    Args:
+        file_path: WAV, MP3 or .729 recording
+        codec: 'flac', 'opus' or 'wav' (defaults to AUDIO_UPLOAD_CODEC)
+        sample_rate: Output sample rate (defaults to AUDIO_PREPROCESS_SAMPLE_RATE)
+        max_segment_seconds: Split threshold (defaults to TRANSCRIBE_SEGMENT_MAX_SECONDS)
+
+    Returns:
+        Dict with 'segments' (each with 'data', 'mime_type', 'start', 'end' in
+        trimmed seconds and 'content_key', a hash of the audio before encoding -
+        stable across runs, unlike the encoded bytes), 'timestamp_map', 'original_seconds', 'kept_seconds',
+        'original_bytes', 'encoded_bytes' and 'trimmed'
+    """
+    codec = codec or AUDIO_UPLOAD_CODEC
+    sample_rate = sample_rate or PREPROCESS_SAMPLE_RATE
+    original_bytes = os.path.getsize(file_path)
+
+    pcm: Optional[bytes] = None
+    if PYAV_AVAILABLE or ffmpeg_available():
+        try:
+            pcm = decode_to_pcm(file_path, sample_rate, 1)
+        except Exception as e:
+            logger.warning(f"Could not decode {file_path} for trimming: {e}")
+    if not pcm:
+        data, mime_type = load_audio_for_processing(file_path)
+        return {
+            'segments': [{'data': data, 'mime_type': mime_type, 'start': 0.0, 'end': None,
+                          'content_key': _content_key(data)}],
+            'timestamp_map': None, 'original_seconds': None, 'kept_seconds': None,
+            'original_bytes': original_bytes, 'encoded_bytes': len(data), 'trimmed': False
+        }
+
+    samples = np.frombuffer(pcm, dtype='<i2')
+    spans = detect_speech_spans(samples, sample_rate)
+    if not spans:
+        # Nothing above the threshold (very quiet line) - send everything rather than nothing
+        spans = [[0, len(samples)]]
+    kept = np.concatenate([samples[start:end] for start, end in spans]).astype('<i2')
+
+    # Joins between kept spans are where silence was removed - the natural cut points
+    boundaries = list(np.cumsum([end - start for start, end in spans])[:-1])
+    segments = []
+    for start, end in plan_segments(kept, sample_rate, boundaries, max_segment_seconds):
+        segment_pcm = kept[start:end].tobytes()
+        data, mime_type = encode_pcm(segment_pcm, sample_rate, 1, codec)
+        segments.append({
+            'data': data,
+            'mime_type': mime_type,
+            'start': round(start / sample_rate, 3),
+            'end': round(end / sample_rate, 3),
+            'content_key': _content_key(segment_pcm)
+        })
+
+    return {
+        'segments': segments,
+        'timestamp_map': build_timestamp_map(spans, sample_rate),
+        'original_seconds': round(len(samples) / sample_rate, 2),
+        'kept_seconds': round(len(kept) / sample_rate, 2),
+        'original_bytes': original_bytes,
+        'encoded_bytes': sum(len(segment['data']) for segment in segments),
+        'trimmed': True
+    }
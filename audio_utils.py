@@ -1,101 +1,343 @@
 #!/usr/bin/env python3
 """
 Audio utility functions for handling various audio formats
-Supports conversion of G.729 files to WAV format for processing
+Supports decoding of G.729 (.729) telephony recordings to WAV for processing
+
+Decoding happens in memory: with PyAV (libav bindings) installed the file is
+decoded in-process, otherwise a single ffmpeg process per file streams raw PCM
+over a pipe. ffmpeg availability is checked once per process. Decoded audio is
+cached by content hash under AUDIO_CACHE_DIR, so re-runs do not decode again,
+and nothing is written into the call-records tree. evict_audio_cache() keeps
+the cache within AUDIO_CACHE_MAX_MB / AUDIO_CACHE_MAX_AGE_DAYS (least recently
+used first).
 """
 import os
+import io
+import wave
+import hashlib
 import subprocess
 import tempfile
+import time
 import logging
+import threading
+from functools import lru_cache
 from pathlib import Path
+from typing import Tuple
 
 logger = logging.getLogger(__name__)
 
+# Optional in-process decoder (pip install av)
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    PYAV_AVAILABLE = False
 
-def convert_729_to_wav(input_path: str, output_path: str = None) -> str:
-    """
-    Convert G.729 (.729) audio file to WAV format using ffmpeg.
-    
-    Args:
-        input_path: Path to the .729 audio file
-        output_path: Optional output path. If not provided, creates a temporary WAV file.
-    
-    Returns:
-        Path to the converted WAV file
-    
-    Raises:
-        FileNotFoundError: If ffmpeg is not installed
-        subprocess.CalledProcessError: If conversion fails
-    """
-    if not os.path.exists(input_path):
-        raise FileNotFoundError(f"Input file not found: {input_path}")
-    
-    # Check if file is actually .729 format
-    if not input_path.lower().endswith('.729'):
-        raise ValueError(f"File is not a .729 file: {input_path}")
-    
-    # Determine output path
-    if output_path is None:
-        # Create temporary WAV file in same directory as input
-        base_name = os.path.splitext(input_path)[0]
-        output_path = f"{base_name}_converted.wav"
-    
-    # Check if ffmpeg is available
+# G.729 is 8kHz mono; decoded to 16-bit signed PCM
+TELEPHONY_SAMPLE_RATE = 8000
+TELEPHONY_CHANNELS = 1
+
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.audio_cache'))
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', '2048'))
+AUDIO_CACHE_MAX_AGE_DAYS = int(os.getenv('AUDIO_CACHE_MAX_AGE_DAYS', '14'))
+
+MIME_TYPES = {
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mpeg',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.m4a': 'audio/mp4'
+}
+
+_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_available() -> bool:
+    """True if an ffmpeg binary can be run (checked once per process)"""
     try:
-        subprocess.run(['ffmpeg', '-version'], 
-                      stdout=subprocess.DEVNULL, 
-                      stderr=subprocess.DEVNULL, 
-                      check=True)
+        subprocess.run(['ffmpeg', '-version'],
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL,
+                       check=True)
+        return True
     except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+
+def _require_decoder():
+    if not PYAV_AVAILABLE and not ffmpeg_available():
         raise FileNotFoundError(
-            "ffmpeg is not installed. Please install ffmpeg to convert .729 files.\n"
+            "ffmpeg is not installed. Please install ffmpeg (or PyAV) to convert .729 files.\n"
             "Install: brew install ffmpeg (macOS) or apt-get install ffmpeg (Linux)"
         )
-    
-    logger.info(f"Converting .729 file to WAV: {input_path} -> {output_path}")
-    
-    # Convert using ffmpeg
-    # G.729 files are typically 8kHz, mono, 8-bit
-    # We'll let ffmpeg auto-detect and convert to standard WAV format
+
+
+def file_content_hash(path: str) -> str:
+    """SHA-256 of a file's contents (cache key for decoded audio)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _decode_with_pyav(input_path: str, sample_rate: int, channels: int) -> bytes:
+    layout = 'mono' if channels == 1 else 'stereo'
+    resampler = av.AudioResampler(format='s16', layout=layout, rate=sample_rate)
+    pcm = bytearray()
+    with av.open(input_path) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                pcm += resampled.planes[0].to_bytes()[:resampled.samples * 2 * channels]
+        for resampled in resampler.resample(None):
+            pcm += resampled.planes[0].to_bytes()[:resampled.samples * 2 * channels]
+    return bytes(pcm)
+
+
+def _decode_with_ffmpeg(input_path: str, sample_rate: int, channels: int) -> bytes:
     try:
-        subprocess.run([
+        completed = subprocess.run([
             'ffmpeg',
+            '-v', 'error',
             '-i', input_path,
-            '-ar', '8000',  # Sample rate (G.729 is typically 8kHz)
-            '-ac', '1',     # Mono channel
-            '-sample_fmt', 's16',  # 16-bit signed PCM
-            '-y',           # Overwrite output file if it exists
-            output_path
-        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-        
-        logger.info(f"Successfully converted to: {output_path}")
-        return output_path
-        
+            '-f', 's16le',            # Raw 16-bit signed PCM on stdout
+            '-ar', str(sample_rate),
+            '-ac', str(channels),
+            'pipe:1'
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.decode() if e.stderr else str(e)
+        error_msg = e.stderr.decode(errors='replace') if e.stderr else str(e)
         logger.error(f"ffmpeg conversion failed: {error_msg}")
         raise RuntimeError(f"Failed to convert .729 file: {error_msg}")
+    return completed.stdout
+
+
+def decode_to_pcm(input_path: str, sample_rate: int = TELEPHONY_SAMPLE_RATE,
+                  channels: int = TELEPHONY_CHANNELS) -> bytes:
+    """
+    Decode any ffmpeg-readable audio file to raw 16-bit PCM in memory.
+
+    Args:
+        input_path: Audio file path
+        sample_rate: Output sample rate
+        channels: Output channel count
+
+    Returns:
+        Little-endian s16 PCM bytes
+    """
+    _require_decoder()
+    if PYAV_AVAILABLE:
+        try:
+            return _decode_with_pyav(input_path, sample_rate, channels)
+        except Exception as e:
+            if not ffmpeg_available():
+                raise RuntimeError(f"Failed to convert .729 file: {e}")
+            logger.warning(f"PyAV could not decode {input_path} ({e}), falling back to ffmpeg")
+    return _decode_with_ffmpeg(input_path, sample_rate, channels)
+
+
+def pcm_to_wav_bytes(pcm: bytes, sample_rate: int = TELEPHONY_SAMPLE_RATE,
+                     channels: int = TELEPHONY_CHANNELS) -> bytes:
+    """Wrap raw s16 PCM in a WAV container"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+# Upload codecs: ffmpeg output arguments and mime type
+ENCODERS = {
+    'flac': (['-c:a', 'flac', '-f', 'flac'], 'audio/flac'),
+    'opus': (['-c:a', 'libopus', '-b:a', '16k', '-application', 'voip', '-f', 'ogg'], 'audio/ogg'),
+}
+
+
+def encode_pcm(pcm: bytes, sample_rate: int = TELEPHONY_SAMPLE_RATE, channels: int = TELEPHONY_CHANNELS,
+               codec: str = 'flac') -> Tuple[bytes, str]:
+    """
+    Encode raw s16 PCM to a compact upload codec through an ffmpeg pipe.
+    Falls back to WAV when ffmpeg (or the codec) is unavailable.
+
+    Args:
+        pcm: Little-endian s16 PCM
+        sample_rate: PCM sample rate
+        channels: PCM channel count
+        codec: 'flac', 'opus' or 'wav'
+
+    Returns:
+        (encoded bytes, mime type)
+    """
+    if codec in ENCODERS and ffmpeg_available():
+        output_args, mime_type = ENCODERS[codec]
+        completed = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels),
+             '-i', 'pipe:0'] + output_args + ['pipe:1'],
+            input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if completed.returncode == 0 and completed.stdout:
+            return completed.stdout, mime_type
+        logger.warning(f"{codec} encoding failed, sending WAV: {completed.stderr.decode(errors='replace')[:200]}")
+    return pcm_to_wav_bytes(pcm, sample_rate, channels), 'audio/wav'
+
+
+def _cache_path(content_hash: str, sample_rate: int, channels: int) -> str:
+    return os.path.join(AUDIO_CACHE_DIR, content_hash[:2], f"{content_hash}_{sample_rate}_{channels}.wav")
+
+
+def _decode_729_cached(input_path: str, sample_rate: int, channels: int) -> Tuple[str, bytes]:
+    """(cache file path, WAV bytes) for a .729 file, decoding only on a cache miss"""
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+    if not input_path.lower().endswith('.729'):
+        raise ValueError(f"File is not a .729 file: {input_path}")
+
+    cache_file = _cache_path(file_content_hash(input_path), sample_rate, channels)
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                wav_bytes = f.read()
+            os.utime(cache_file)  # mtime marks the last use for eviction
+            return cache_file, wav_bytes
+        except FileNotFoundError:
+            pass  # evicted in between - decode again
+
+    logger.info(f"Decoding .729 file in memory: {input_path}")
+    wav_bytes = pcm_to_wav_bytes(decode_to_pcm(input_path, sample_rate, channels), sample_rate, channels)
+
+    # Atomic write so concurrent transcribers never read a partial cache file
+    with _cache_lock:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(wav_bytes)
+        os.replace(temp_path, cache_file)
+    return cache_file, wav_bytes
+
+
+def evict_audio_cache(max_mb: int = None, max_age_days: int = None) -> int:
+    """
+    Remove least recently used decoded WAVs until the cache fits the size/age limits.
+
+    Args:
+        max_mb: Size limit (defaults to AUDIO_CACHE_MAX_MB)
+        max_age_days: Files unused for longer are removed (defaults to AUDIO_CACHE_MAX_AGE_DAYS)
+
+    Returns:
+        Number of files removed
+    """
+    max_mb = AUDIO_CACHE_MAX_MB if max_mb is None else max_mb
+    max_age_days = AUDIO_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.isdir(AUDIO_CACHE_DIR):
+        return 0
+
+    entries = []
+    for path in Path(AUDIO_CACHE_DIR).glob('*/*.wav'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    # Oldest first so the size pass drops the least recently used files
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    cutoff = time.time() - max_age_days * 86400
+    max_bytes = max_mb * 1024 * 1024
+
+    evicted = 0
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total_bytes <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove cached audio {path}: {e}")
+            continue
+        total_bytes -= size
+        evicted += 1
+    if evicted:
+        logger.info(f"Evicted {evicted} decoded audio files from cache ({total_bytes / (1024 * 1024):.1f} MB kept)")
+    return evicted
+
+
+def decode_729_to_wav_bytes(input_path: str, sample_rate: int = TELEPHONY_SAMPLE_RATE,
+                            channels: int = TELEPHONY_CHANNELS) -> bytes:
+    """
+    Decode a G.729 file to WAV bytes, using the content-hash cache.
+
+    Args:
+        input_path: Path to the .729 audio file
+
+    Returns:
+        WAV file contents
+    """
+    return _decode_729_cached(input_path, sample_rate, channels)[1]
+
+
+def load_audio_for_processing(file_path: str) -> Tuple[bytes, str]:
+    """
+    Audio bytes ready to send to a transcription model.
+    .729 files are decoded to WAV in memory; other formats are read as-is.
+
+    Args:
+        file_path: Path to the audio file (can be .wav, .mp3, .729, etc.)
+
+    Returns:
+        (audio bytes, mime type)
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext == '.729':
+        return decode_729_to_wav_bytes(file_path), 'audio/wav'
+    with open(file_path, 'rb') as f:
+        return f.read(), MIME_TYPES.get(file_ext, 'audio/wav')
+
+
+def convert_729_to_wav(input_path: str, output_path: str = None) -> str:
+    """
+    Convert G.729 (.729) audio file to a WAV file.
+
+    Args:
+        input_path: Path to the .729 audio file
+        output_path: Optional output path. If not provided, the cached WAV under
+            AUDIO_CACHE_DIR is returned (never a file next to the recording).
+
+    Returns:
+        Path to the converted WAV file
+
+    Raises:
+        FileNotFoundError: If neither ffmpeg nor PyAV is installed
+        RuntimeError: If conversion fails
+    """
+    cache_file, wav_bytes = _decode_729_cached(input_path, TELEPHONY_SAMPLE_RATE, TELEPHONY_CHANNELS)
+    if output_path is None:
+        return cache_file
+    with open(output_path, 'wb') as f:
+        f.write(wav_bytes)
+    logger.info(f"Successfully converted to: {output_path}")
+    return output_path
 
 
 def get_audio_file_for_processing(file_path: str, convert_to_wav: bool = True) -> str:
     """
     Get the path to an audio file ready for processing.
-    If the file is .729 format, converts it to WAV first.
-    
+    If the file is .729 format, returns the cached WAV conversion.
+
     Args:
         file_path: Path to the audio file (can be .wav, .mp3, .729, etc.)
         convert_to_wav: If True, convert .729 files to WAV. If False, return original.
-    
+
     Returns:
         Path to the audio file ready for processing (may be converted file)
     """
     file_ext = os.path.splitext(file_path)[1].lower()
-    
+
     if file_ext == '.729' and convert_to_wav:
-        # Convert .729 to WAV
-        converted_path = convert_729_to_wav(file_path)
-        return converted_path
-    
+        return convert_729_to_wav(file_path)
+
     # For other formats, return as-is
     return file_path
 
@@ -103,14 +345,17 @@ def get_audio_file_for_processing(file_path: str, convert_to_wav: bool = True) -
 def cleanup_converted_file(converted_path: str):
     """
     Clean up a temporarily converted audio file.
-    
+    Cached conversions under AUDIO_CACHE_DIR are kept for re-runs; only legacy
+    *_converted.wav files written next to recordings are deleted.
+
     Args:
         converted_path: Path to the converted file to delete
     """
+    if os.path.abspath(converted_path).startswith(os.path.abspath(AUDIO_CACHE_DIR) + os.sep):
+        return
     if os.path.exists(converted_path) and '_converted.wav' in converted_path:
         try:
             os.remove(converted_path)
             logger.info(f"Cleaned up converted file: {converted_path}")
         except Exception as e:
             logger.warning(f"Failed to cleanup converted file {converted_path}: {e}")
-
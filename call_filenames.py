@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Call recording filename grammars.
+
+Recorder exports encode the caller's mobile number and the call start time in
+the filename, in a different layout per source system:
+
+- October recorder:   g-YYYYMMDD-HHMMSS-<mobile>-....wav
+- September recorder: <ext>-<0/00 + mobile>-...-YYYYMMDDHHMMSS.wav (also .mp3/.729,
+  and ' (1)' style duplicate suffixes)
+- Unix-epoch export:  ...-<UNIX SECONDS>.<fraction>-YYYYMMDDHHMMSS...
+
+FILENAME_GRAMMARS holds one compiled pattern per layout, tried in order (the
+first grammar that matches wins, as in the original if/else chain). Names are
+parsed once into a CallFilename record; parse_call_filenames() parses a whole
+directory listing with vectorized pandas str.extract.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+# Mobile number: 0/00-prefixed 10 digits at a field boundary (602-009..., 616-009..., 09...),
+# else the last 10 digits of the first 10-12 digit run
+MOBILE_PATTERN = re.compile(r'(?:^|[-_])0{1,2}(?P<mobile>\d{10})')
+MOBILE_FALLBACK_PATTERN = re.compile(r'(?P<mobile>\d{10,12})')
+
+STAMP_FORMAT = '%Y%m%d%H%M%S'
+
+
+class FilenameGrammar(NamedTuple):
+    name: str                   # timestamp format name stored with each record
+    source_system: str          # recorder that produces this layout
+    pattern: re.Pattern         # named groups feed `stamp`
+    stamp: Callable[[Dict[str, str]], Optional[datetime]]
+    # Groups joined into a STAMP_FORMAT string for vectorized parsing (None: use `stamp` per row)
+    stamp_groups: Optional[tuple] = None
+
+
+def _stamp_from_groups(*groups: str) -> Callable[[Dict[str, str]], Optional[datetime]]:
+    def stamp(parts: Dict[str, str]) -> Optional[datetime]:
+        try:
+            return datetime.strptime(''.join(parts[group] for group in groups), STAMP_FORMAT)
+        except ValueError:
+            return None
+    return stamp
+
+
+def _stamp_from_epoch(parts: Dict[str, str]) -> Optional[datetime]:
+    return datetime.fromtimestamp(int(parts['epoch']))
+
+
+FILENAME_GRAMMARS = [
+    FilenameGrammar('g_prefix', 'october_recorder',
+                    re.compile(r'g-(?P<date>\d{8})-(?P<time>\d{6})'),
+                    _stamp_from_groups('date', 'time'), ('date', 'time')),
+    FilenameGrammar('suffix_14', 'september_recorder',
+                    re.compile(r'(?:^|\D)(?P<stamp>\d{14})(?: \(\d+\))?\.(?:wav|mp3|729)$', re.IGNORECASE),
+                    _stamp_from_groups('stamp'), ('stamp',)),
+    FilenameGrammar('unix_epoch', 'epoch_export',
+                    re.compile(r'-(?P<epoch>\d{10})\.\d+-\d{14}'),
+                    _stamp_from_epoch),
+]
+
+
+class CallFilename(NamedTuple):
+    filename: str
+    mobile_number: Optional[str]
+    call_start: Optional[datetime]
+    timestamp_format: Optional[str]
+    source_system: Optional[str]
+
+
+def extract_mobile(filename: str) -> Optional[str]:
+    """Mobile number encoded in a recording filename (same rules as the original June script)"""
+    match = MOBILE_PATTERN.search(filename)
+    if match:
+        return match.group('mobile')
+    match = MOBILE_FALLBACK_PATTERN.search(filename)
+    if match:
+        return match.group('mobile')[-10:]
+    return None
+
+
+@lru_cache(maxsize=65536)
+def parse_call_filename(filename: str) -> CallFilename:
+    """
+    Parse a recording filename with the first matching grammar.
+
+    Args:
+        filename: Recording file name (no directory)
+
+    Returns:
+        CallFilename; call_start/timestamp_format/source_system are None when no grammar matches
+    """
+    mobile_number = extract_mobile(filename)
+    for grammar in FILENAME_GRAMMARS:
+        match = grammar.pattern.search(filename)
+        if match:
+            call_start = grammar.stamp(match.groupdict())
+            if call_start is not None:
+                return CallFilename(filename, mobile_number, call_start, grammar.name, grammar.source_system)
+    return CallFilename(filename, mobile_number, None, None, None)
+
+
+def parse_call_filenames(filenames: Iterable[str]):
+    """
+    Parse many filenames at once with vectorized str.extract.
+
+    Args:
+        filenames: Recording file names
+
+    Returns:
+        DataFrame with the CallFilename columns, one row per input name (same order)
+    """
+    import pandas as pd
+
+    names = pd.Series(list(filenames), dtype=object).astype(str)
+    result = pd.DataFrame({'filename': names})
+    mobile = names.str.extract(MOBILE_PATTERN)['mobile']
+    fallback = names.str.extract(MOBILE_FALLBACK_PATTERN)['mobile'].str[-10:]
+    result['mobile_number'] = mobile.fillna(fallback)
+
+    call_start = pd.Series(pd.NaT, index=names.index, dtype='datetime64[ns]')
+    timestamp_format = pd.Series(None, index=names.index, dtype=object)
+    source_system = pd.Series(None, index=names.index, dtype=object)
+    for grammar in FILENAME_GRAMMARS:
+        pending = call_start.isna()
+        if not pending.any():
+            break
+        parts = names[pending].str.extract(grammar.pattern)
+        matched = parts.notna().all(axis=1)
+        if not matched.any():
+            continue
+        parts = parts[matched]
+        if grammar.stamp_groups:
+            stamps = parts[list(grammar.stamp_groups)].agg(''.join, axis=1)
+            starts = pd.to_datetime(stamps, format=STAMP_FORMAT, errors='coerce')
+        else:
+            starts = pd.Series([grammar.stamp(row) for row in parts.to_dict('records')],
+                               index=parts.index, dtype='datetime64[ns]')
+        starts = starts.dropna()
+        call_start[starts.index] = starts
+        timestamp_format[starts.index] = grammar.name
+        source_system[starts.index] = grammar.source_system
+
+    result['call_start'] = call_start
+    result['timestamp_format'] = timestamp_format
+    result['source_system'] = source_system
+    return result
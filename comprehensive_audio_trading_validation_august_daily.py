@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import glob
 from datetime import datetime, timedelta
+from order_book import load_order_book
+from call_filenames import parse_call_filenames
 
 def parse_time(ts):
     """Parse timestamp string to datetime object"""
@@ -38,19 +40,18 @@ def consolidate_audio_clusters(audio_files, audio_data, consolidation_window_min
     if len(audio_files) <= 1:
         return [audio_files]
     
-    # Sort audio files by time
+    # Sort audio files by time (start time parsed from the filename by its recorder grammar;
+    # October g-YYYYMMDD-HHMMSS, .mp3 and .729 names included)
+    parsed = parse_call_filenames(audio_files)
     audio_times = []
-    for audio_file in audio_files:
-        # Extract timestamp from filename
-        date_part = audio_file.split('-')[-1].replace('.wav', '')
-        year = date_part[:4]
-        month = date_part[4:6]
-        day = date_part[6:8]
-        hour = date_part[8:10]
-        minute = date_part[10:12]
-        second = date_part[12:14]
-        audio_time = datetime.strptime(f'{year}-{month}-{day} {hour}:{minute}:{second}', '%Y-%m-%d %H:%M:%S')
-        audio_times.append((audio_file, audio_time))
+    unparsed = []
+    for audio_file, audio_time in zip(audio_files, parsed['call_start']):
+        if pd.isna(audio_time):
+            unparsed.append(audio_file)
+        else:
+            audio_times.append((audio_file, audio_time.to_pydatetime()))
+    if not audio_times:
+        return [[audio_file] for audio_file in unparsed]
     
     audio_times.sort(key=lambda x: x[1])
     
@@ -75,6 +76,9 @@ def consolidate_audio_clusters(audio_files, audio_data, consolidation_window_min
     # Add the last cluster
     clusters.append([audio[0] for audio in current_cluster])
     
+    # Files without a recognisable timestamp cannot be grouped by time
+    clusters.extend([audio_file] for audio_file in unparsed)
+    
     return clusters
 
 def validate_audio_trading_for_date(date_str):
@@ -187,26 +191,28 @@ def validate_audio_trading_for_date(date_str):
         print(f"✅ Audio-order validation completed (no order file for this date)")
         return output_path
     
-    # Load order data
-    try:
-        orders = pd.read_csv(order_file_path, dtype=str)
-        print(f"Loaded order file with {len(orders)} records")
-        print(f"Order file columns: {orders.columns.tolist()}")
-    except Exception as e:
-        print(f"Error loading order file: {e}")
+    # Load order data (shared typed OrderBook, cached per file)
+    order_book = load_order_book(date_str, order_file=order_file_path)
+    if order_book is None:
+        print(f"Error loading order file: {order_file_path}")
         return None
+    orders = order_book.orders
+    print(f"Loaded order file with {len(orders)} records")
+    print(f"Order file columns: {orders.columns.tolist()}")
     
-    # Filter for KL users and process timestamps
+    # Filter for KL users (User starts with 'KL', same view as email/OMS surveillance)
     if 'User' in orders.columns:
-        kl_orders = orders[orders['User'].str.contains('KL', na=False)]
+        kl_orders = order_book.kl_orders.copy()
         print(f"Found {len(kl_orders)} KL orders")
     else:
-        kl_orders = orders
+        kl_orders = orders.copy()
         print("No User column found, using all orders")
     
-    # Process order timestamps
-    if 'OrgTimeStamp' in kl_orders.columns:
-        kl_orders['order_time'] = kl_orders['OrgTimeStamp'].apply(parse_time)
+    # Order timestamps are parsed once by the loader
+    if 'OrgTimeStamp_dt' in kl_orders.columns:
+        kl_orders['order_time'] = kl_orders['OrgTimeStamp_dt']
+    elif 'OrgTimeStamp' in kl_orders.columns:
+        kl_orders['order_time'] = pd.to_datetime(kl_orders['OrgTimeStamp'].apply(parse_time), errors='coerce')
     else:
         kl_orders['order_time'] = pd.NaT
     
@@ -92,6 +92,20 @@ def s3_file_exists(s3_key):
         logger.error(f"Unexpected error checking S3 file: {e}")
         return False
 
+def s3_object_info(s3_key):
+    """(LastModified timestamp, size) of an S3 object, or None if it does not exist or can't be checked"""
+    try:
+        s3_client = get_s3_client()
+        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        return response['LastModified'].timestamp(), response['ContentLength']
+    except ClientError as e:
+        if e.response['Error']['Code'] != '404':
+            logger.error(f"Error checking S3 file {s3_key}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error checking S3 file: {e}")
+        return None
+
 def download_file_from_s3(s3_key, local_path=None):
     """
     Download file from S3 to local temporary file or specified path
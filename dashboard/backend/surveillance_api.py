@@ -22,7 +22,7 @@ from dotenv import load_dotenv
 from s3_utils import (
     get_s3_key, s3_file_exists, read_excel_from_s3, read_csv_from_s3,
     read_json_from_s3, read_text_from_s3, list_s3_objects, list_s3_directories,
-    upload_file_to_s3, generate_presigned_post_url, get_s3_client
+    upload_file_to_s3, generate_presigned_post_url, get_s3_client, s3_object_info
 )
 
 # Load environment variables
@@ -55,6 +55,33 @@ logger = logging.getLogger(__name__)
 # Global job tracking with 24-hour retention
 surveillance_jobs = {}
 
+# Speaker turns returned per page by the transcript endpoints
+TRANSCRIPT_TURNS_PAGE_SIZE = int(os.getenv('TRANSCRIPT_TURNS_PAGE_SIZE', '50'))
+
+def _email_records():
+    """Email artifact reader (email_records.py lives in the surveillance base directory)"""
+    import sys
+    if SURVEILLANCE_BASE_PATH not in sys.path:
+        sys.path.insert(0, SURVEILLANCE_BASE_PATH)
+    import email_records
+    return email_records
+
+def _transcript_store():
+    """Transcript store (transcript_store.py lives in the surveillance base directory)"""
+    import sys
+    if SURVEILLANCE_BASE_PATH not in sys.path:
+        sys.path.insert(0, SURVEILLANCE_BASE_PATH)
+    import transcript_store
+    return transcript_store
+
+def _audio_catalog():
+    """Recording catalog for the surveillance base directory (audio_catalog.py lives there)"""
+    import sys
+    if SURVEILLANCE_BASE_PATH not in sys.path:
+        sys.path.insert(0, SURVEILLANCE_BASE_PATH)
+    import audio_catalog
+    return audio_catalog.open_catalog(base_dir=SURVEILLANCE_BASE_PATH)
+
 def cleanup_old_jobs():
     """Clean up jobs older than 24 hours"""
     current_time = datetime.now()
@@ -323,59 +350,110 @@ def read_email_mapping(date_path):
             return None
 
 def read_transcript(date_path, audio_filename):
-    """Read transcript file for audio evidence"""
+    """Read transcript file for audio evidence (through the transcript store)"""
     date_name = os.path.basename(date_path) if os.path.sep in date_path else date_path
     transcript_dir = f"{date_path}/transcripts_{date_name}" if date_path else f"transcripts_{date_name}"
     
     # PERMANENT FIX: Handle audio filename with or without extension
     # Transcript files are typically named: filename.mp3.txt or filename.wav.txt
     # But Excel might have filename without extension
-    base_filename = audio_filename
-    transcript_candidates = []
-    
-    if base_filename.endswith('.mp3') or base_filename.endswith('.wav'):
-        # If extension is present, use it
-        transcript_candidates.append(f"{base_filename}.txt")
-    else:
-        # If no extension, try with .mp3 first (most common)
-        transcript_candidates.append(f"{base_filename}.mp3.txt")
-        transcript_candidates.append(f"{base_filename}.txt")
+    try:
+        transcript_store = _transcript_store()
+        transcript_candidates = transcript_store.transcript_candidates(audio_filename)
+    except Exception as e:
+        logger.warning(f"Transcript store unavailable: {e}")
+        transcript_store = None
+        base_filename = audio_filename
+        if base_filename.endswith('.mp3') or base_filename.endswith('.wav'):
+            transcript_candidates = [base_filename]
+        else:
+            transcript_candidates = [f"{base_filename}.mp3", base_filename]
     
     if USE_S3:
+        # Indexed copy first - a HEAD request instead of a download, as long as the
+        # S3 object still has the LastModified / size it was stored with
+        if transcript_store is not None:
+            try:
+                stored = transcript_store.open_store().get_stored(date_name, audio_filename)
+                if stored is not None:
+                    s3_info = s3_object_info(f"{S3_BASE_PREFIX}/{transcript_dir}/{stored['audio_filename']}.txt")
+                    if s3_info is None or s3_info == (stored['source_mtime'], stored['source_size']):
+                        logger.info(f"Found transcript in store: {date_name}/{stored['audio_filename']}")
+                        return stored['content']
+                    logger.info(f"Transcript changed in S3, refreshing: {date_name}/{stored['audio_filename']}")
+            except Exception as e:
+                logger.warning(f"Transcript store lookup failed for {audio_filename}: {e}")
+        
         # Try each candidate in S3
-        for transcript_filename in transcript_candidates:
-            s3_key = f"{S3_BASE_PREFIX}/{transcript_dir}/{transcript_filename}"
-            if s3_file_exists(s3_key):
+        for candidate in transcript_candidates:
+            s3_key = f"{S3_BASE_PREFIX}/{transcript_dir}/{candidate}.txt"
+            s3_info = s3_object_info(s3_key)
+            if s3_info is not None:
                 logger.info(f"Found transcript in S3: {s3_key}")
                 try:
                     content = read_text_from_s3(s3_key)
                     logger.info(f"Successfully read transcript file, length: {len(content)}")
-                    return content
                 except Exception as e:
                     logger.error(f"Error reading transcript from S3 {s3_key}: {e}")
                     return None
+                if transcript_store is not None:
+                    try:
+                        # Structured turns written next to the transcript, when present
+                        turns = None
+                        turns_key = f"{S3_BASE_PREFIX}/{transcript_dir}/{candidate}{transcript_store.TURNS_SUFFIX}"
+                        if s3_file_exists(turns_key):
+                            turns = [json.loads(line) for line in read_text_from_s3(turns_key).splitlines() if line.strip()]
+                        transcript_store.open_store().put(date_name, candidate, content, turns=turns,
+                                                          source_mtime=s3_info[0], source_size=s3_info[1])
+                    except Exception as e:
+                        logger.warning(f"Could not store transcript {candidate}: {e}")
+                return content
         
         logger.warning(f"Transcript file not found in S3 for {audio_filename} in {transcript_dir}")
         return None
     else:
         # Local filesystem
-        for transcript_filename in transcript_candidates:
-            transcript_file = os.path.join(SURVEILLANCE_BASE_PATH, transcript_dir, transcript_filename)
-            logger.info(f"Looking for transcript file: {transcript_file}")
-            if os.path.exists(transcript_file):
-                logger.info(f"Transcript file exists: {transcript_file}")
-                try:
-                    with open(transcript_file, 'r') as f:
-                        content = f.read()
-                        logger.info(f"Successfully read transcript file, length: {len(content)}")
-                    return content
-                except Exception as e:
-                    logger.error(f"Error reading transcript {transcript_file}: {e}")
-                    return None
+        transcripts_path = os.path.join(SURVEILLANCE_BASE_PATH, transcript_dir)
+        if transcript_store is not None:
+            try:
+                content = transcript_store.get_transcript(audio_filename, transcripts_path, date_name)
+            except Exception as e:
+                logger.error(f"Error reading transcript {audio_filename} from {transcripts_path}: {e}")
+                return None
+            if content is not None:
+                logger.info(f"Successfully read transcript {audio_filename}, length: {len(content)}")
+                return content
+        else:
+            for candidate in transcript_candidates:
+                transcript_file = os.path.join(transcripts_path, f"{candidate}.txt")
+                if os.path.exists(transcript_file):
+                    try:
+                        with open(transcript_file, 'r') as f:
+                            return f.read()
+                    except Exception as e:
+                        logger.error(f"Error reading transcript {transcript_file}: {e}")
+                        return None
         
         logger.warning(f"Transcript file not found for {audio_filename} in {transcript_dir}")
         return None
 
+def read_transcript_turns(date_path, audio_filename):
+    """Structured speaker turns for audio evidence (None if there is no transcript)"""
+    date_name = os.path.basename(date_path) if os.path.sep in date_path else date_path
+    transcript_store = _transcript_store()
+    if not USE_S3:
+        transcript_dir = f"{date_path}/transcripts_{date_name}" if date_path else f"transcripts_{date_name}"
+        return transcript_store.open_store().get_turns(
+            audio_filename, os.path.join(SURVEILLANCE_BASE_PATH, transcript_dir), date_name)
+    # read_transcript refreshes the stored transcript (and its turns) when the S3 copy changed
+    if read_transcript(date_path, audio_filename) is None:
+        return None
+    stored = transcript_store.open_store().get_stored(date_name, audio_filename)
+    if stored is None:
+        return None
+    return [{'turn': number, 'speaker': turn.get('speaker'), 'text': turn.get('text'),
+             'offset': turn.get('offset')} for number, turn in enumerate(stored['turns'], 1)]
+
 def get_order_file_paths(year, month):
     """Get all available order file paths for the given year/month"""
     month_to_order_dir = {
@@ -666,6 +744,11 @@ def get_audio_evidence(order_id, date):
         
         # Read transcript for the first file (or combine if needed)
         transcript = read_transcript(date_path, audio_filenames[0])
+        try:
+            turns = read_transcript_turns(date_path, audio_filenames[0]) or []
+        except Exception as e:
+            logger.warning(f"Could not load transcript turns for {audio_filenames[0]}: {e}")
+            turns = []
         
         audio_evidence = {
             'filename': audio_filenames[0] if len(audio_filenames) == 1 else audio_filename,  # Show single filename or full string
@@ -673,6 +756,11 @@ def get_audio_evidence(order_id, date):
             'fileCount': len(audio_filenames),
             'duration': '5:32',  # This would need to be calculated from actual audio
             'transcript': transcript or 'Transcript not available',
+            'date': date,
+            'turnCount': len(turns),
+            'turns': turns[:TRANSCRIPT_TURNS_PAGE_SIZE],  # First page; more via /transcript-turns
+            'turnsFilename': audio_filenames[0],  # The file the turns come from (filename may list several)
+            'turnsPageSize': TRANSCRIPT_TURNS_PAGE_SIZE,
             'speakers': {
                 'client': ['Client discussed trade requirements'],
                 'dealer': ['Dealer provided market information']
@@ -821,29 +909,21 @@ def get_discrepancy_details(order_id, date):
 def serve_audio_file(filename):
     """Serve audio files for playback with proper headers for telephony format"""
     try:
-        # PERMANENT FIX: Search all months and try with/without extensions in single efficient loop
+        # Look the recording up in the audio catalog (filename with or without extension)
         # This handles cases where Excel has filename without extension
-        audio_file_path = None
-        
-        # Build list of filenames to try (exact, with .mp3, with .wav)
-        filenames_to_try = [filename]
-        if not filename.endswith('.mp3') and not filename.endswith('.wav'):
-            filenames_to_try.append(f"{filename}.mp3")
-            filenames_to_try.append(f"{filename}.wav")
-        
-        # Search all months for the file
-        for month_path in [AUGUST_CALL_RECORDS_PATH, SEPTEMBER_CALL_RECORDS_PATH, OCTOBER_CALL_RECORDS_PATH, NOVEMBER_CALL_RECORDS_PATH, DECEMBER_CALL_RECORDS_PATH]:
-            if os.path.exists(month_path):
-                for root, dirs, files in os.walk(month_path):
-                    for try_filename in filenames_to_try:
-                        if try_filename in files:
-                            audio_file_path = os.path.join(root, try_filename)
-                            logger.info(f"Found audio file: {audio_file_path}")
-                            break
-                    if audio_file_path:
-                        break
-                if audio_file_path:
-                    break
+        catalog = _audio_catalog()
+        recording = catalog.find(filename)
+        if recording is None or not os.path.exists(recording['local_path']):
+            # Not catalogued yet (copied in outside the upload flow): refresh the month trees
+            # incrementally - unchanged files are only stat'ed - and look again
+            for month_path in [AUGUST_CALL_RECORDS_PATH, SEPTEMBER_CALL_RECORDS_PATH, OCTOBER_CALL_RECORDS_PATH, NOVEMBER_CALL_RECORDS_PATH, DECEMBER_CALL_RECORDS_PATH]:
+                month_root = os.path.join(SURVEILLANCE_BASE_PATH, month_path)
+                if os.path.exists(month_root):
+                    catalog.scan_tree(month_root)
+            recording = catalog.find(filename)
+        audio_file_path = recording['local_path'] if recording else None
+        if audio_file_path:
+            logger.info(f"Found audio file: {audio_file_path}")
         
         # If file found, serve it
         if audio_file_path and os.path.exists(audio_file_path):
@@ -904,6 +984,56 @@ def get_available_dates(year, month):
         logger.error(f"Error getting available dates for {year}/{month}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/surveillance/transcript-turns/<string:date>/<path:filename>')
+def get_transcript_turns(date, filename):
+    """One page of a call's speaker turns, e.g. ?page=2&page_size=50"""
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        page_size = max(1, min(int(request.args.get('page_size', TRANSCRIPT_TURNS_PAGE_SIZE)), 500))
+    except ValueError:
+        return jsonify({'error': 'page and page_size must be numbers'}), 400
+    try:
+        month_paths = get_month_paths_from_date(date)
+        date_path = os.path.join(month_paths["reports"], date)
+        turns = read_transcript_turns(date_path, filename)
+        if turns is None:
+            return jsonify({'error': 'Transcript not found'}), 404
+        start = (page - 1) * page_size
+        return jsonify({
+            'filename': filename,
+            'page': page,
+            'pageSize': page_size,
+            'turnCount': len(turns),
+            'hasMore': start + page_size < len(turns),
+            'turns': turns[start:start + page_size]
+        })
+    except Exception as e:
+        logger.error(f"Error getting transcript turns for {filename} on {date}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/surveillance/transcripts/search')
+def search_transcripts():
+    """Keyword search over indexed call transcripts, e.g. ?q=RELIANCE OR "stop loss"&from=2025-08-01&to=2025-08-31"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        results = _transcript_store().open_store().search(
+            query,
+            date_from=request.args.get('from') or None,
+            date_to=request.args.get('to') or None,
+            client_id=request.args.get('client') or None,
+            limit=limit
+        )
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    except Exception as e:
+        # Usually FTS query syntax (unbalanced quotes, bare operators)
+        logger.error(f"Transcript search failed for {query!r}: {e}")
+        return jsonify({'error': f'Search failed: {e}'}), 400
+    return jsonify({'query': query, 'count': len(results), 'results': results})
+
 @app.route('/api/surveillance/health')
 def health_check():
     """Health check endpoint"""
@@ -1182,6 +1312,17 @@ def upload_files():
                 upload_file_to_s3(temp_file.name, s3_key)
                 logger.info(f"✅ File uploaded to S3: s3://{S3_BUCKET_NAME}/{s3_key}")
                 
+                if file_type == 'audio':
+                    # Catalog the recording while the bytes are still local (hash, duration)
+                    try:
+                        _audio_catalog().add_file(
+                            temp_file.name, ddmmyyyy,
+                            relative_path=f"{month_name}/Call Records/Call_{ddmmyyyy}/{filename}",
+                            s3_key=s3_key
+                        )
+                    except Exception as e:
+                        logger.warning(f"Could not catalog uploaded recording {filename}: {e}")
+                
                 # Clean up temp file
                 os.unlink(temp_file.name)
                 
@@ -1621,11 +1762,10 @@ def execute_file_discovery_step(date_str, logs):
                     logs.append(f"⚠️  Call Records directory missing, creating: {call_records_dir}")
                     os.makedirs(call_records_dir, exist_ok=True)
                 
-                # Count audio files in Call Records directory
-                import glob
-                audio_files = glob.glob(os.path.join(call_records_dir, "*.mp3")) + \
-                             glob.glob(os.path.join(call_records_dir, "*.wav"))
-                audio_count = len(audio_files)
+                # Count audio files in Call Records directory (refreshes the audio catalog)
+                catalog = _audio_catalog()
+                catalog.scan_directory(call_records_dir, ddmmyyyy)
+                audio_count = len(catalog.recordings(ddmmyyyy, local_only=True))
                 
                 # Count expected audio files from mappings
                 expected_audio_count = sum(1 for src, dst in file_mappings.items() 
@@ -1639,8 +1779,8 @@ def execute_file_discovery_step(date_str, logs):
                         logs.append(f"🔄 Attempting to re-copy files...")
                         success_retry, file_mappings_retry = mapper.process_uploaded_files(formatted_date, replace_existing=True)
                         if success_retry:
-                            audio_files_retry = glob.glob(os.path.join(call_records_dir, "*.mp3")) + \
-                                              glob.glob(os.path.join(call_records_dir, "*.wav"))
+                            catalog.scan_directory(call_records_dir, ddmmyyyy)
+                            audio_files_retry = catalog.recordings(ddmmyyyy, local_only=True)
                             if len(audio_files_retry) > 0:
                                 logs.append(f"✅ Retry successful: {len(audio_files_retry)} audio files now in Call Records")
                             else:
@@ -1762,10 +1902,9 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                     return {'success': False, 'error': 'Email file is empty', 'logs': logs}
                 log(f"✅ Email file verified: {expected_file} ({file_size:,} bytes)")
                 
-                # Verify file content is valid JSON
+                # Verify file content is a valid email artifact (NDJSON records or legacy JSON)
                 try:
-                    with open(expected_file, 'r') as f:
-                        email_data = json.load(f)
+                    email_summary = _email_records().read_email_summary(expected_file)
                     
                     # FIX: Copy to comprehensive_dealing_emails_analysis.json for complete_email_surveillance_system.py
                     # The file from S3 now has email_analyses (raw emails) which is what the system expects
@@ -1774,15 +1913,11 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                     log(f"✅ Copied email data to: {comprehensive_file} (for AI analysis)")
                     
                     # Verify structure
-                    if 'email_analyses' in email_data:
-                        email_count = len(email_data['email_analyses'])
+                    email_count = email_summary.get('email_count', 0)
+                    if email_summary.get('kind') == 'email_input':
                         log(f"✅ Email file contains email_analyses ({email_count} emails)")
-                    elif 'all_results' in email_data:
-                        email_count = len(email_data['all_results'])
-                        log(f"⚠️  WARNING: File contains all_results instead of email_analyses ({email_count} emails)")
                     else:
-                        log(f"⚠️  WARNING: File structure unknown, keys: {list(email_data.keys())}")
-                        email_count = 0
+                        log(f"⚠️  WARNING: File contains analyzed results instead of email_analyses ({email_count} emails)")
                     
                     # CRITICAL FIX: Run complete_email_surveillance_system.py to perform AI analysis
                     # This is what actually classifies emails as "trade_instruction" vs "other"
@@ -1862,13 +1997,11 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                                 # CRITICAL FIX: Save analyzed results (with all_results) back to email_surveillance file
                                 # This is what email_order_validation expects
                                 try:
-                                    with open(latest_output, 'r') as f:
-                                        analyzed_results = json.load(f)
+                                    analyzed_summary = _email_records().read_email_summary(latest_output)
                                     
                                     # Update the email_surveillance file with analyzed results (LOCALLY)
                                     analyzed_email_file = os.path.join(SURVEILLANCE_BASE_PATH, f'email_surveillance_{date_str}.json')
-                                    with open(analyzed_email_file, 'w') as f:
-                                        json.dump(analyzed_results, f, indent=2)
+                                    shutil.copy2(latest_output, analyzed_email_file)
                                     log(f"✅ Updated email_surveillance_{date_str}.json with analyzed results (all_results)")
                                     
                                     # CRITICAL FIX: Upload analyzed results to S3 in Daily_Reports folder
@@ -1886,18 +2019,12 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                                     
                                     log(f"💡 Note: Original email_analyses kept at: Email_Data/{year}/{month_name}/email_surveillance_{date_str}.json")
                                     
-                                    # Log summary with detailed breakdown
-                                    trade_instructions = analyzed_results.get('trade_instructions', {}).get('total', 0)
-                                    all_results = analyzed_results.get('all_results', [])
-                                    total_emails = len(all_results) if all_results else 0
+                                    # Log summary with detailed breakdown (from the summary record, no email parsing)
+                                    trade_instructions = analyzed_summary.get('trade_instructions', {}).get('total', 0)
+                                    total_emails = analyzed_summary.get('email_count', 0)
                                     
                                     # Count intents for debugging
-                                    intent_counts = {}
-                                    if all_results:
-                                        for email in all_results:
-                                            ai_analysis = email.get('ai_analysis', {})
-                                            intent = ai_analysis.get('ai_email_intent', 'NOT_SET') if ai_analysis else 'NO_ANALYSIS'
-                                            intent_counts[intent] = intent_counts.get(intent, 0) + 1
+                                    intent_counts = analyzed_summary.get('category_counts', {})
                                     
                                     log(f"📊 Analysis summary: {trade_instructions} trade instructions found out of {total_emails} total emails")
                                     if intent_counts:
@@ -1933,13 +2060,11 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                         latest_output = max(output_files, key=os.path.getctime)
                         logs.append(f"✅ Found output file despite timeout: {latest_output}")
                         try:
-                            with open(latest_output, 'r') as f:
-                                analyzed_results = json.load(f)
+                            analyzed_summary = _email_records().read_email_summary(latest_output)
                             
                             # Save results even if timed out
                             analyzed_email_file = os.path.join(SURVEILLANCE_BASE_PATH, f'email_surveillance_{date_str}.json')
-                            with open(analyzed_email_file, 'w') as f:
-                                json.dump(analyzed_results, f, indent=2)
+                            shutil.copy2(latest_output, analyzed_email_file)
                             logs.append(f"✅ Saved partial results to email_surveillance_{date_str}.json")
                             
                             # Upload to S3
@@ -1948,7 +2073,10 @@ def execute_email_processing_step(date_str, logs, add_log_callback=None):
                             upload_file_to_s3(analyzed_email_file, s3_key)
                             logs.append(f"✅ Uploaded partial results to S3")
                             
-                            trade_instructions = analyzed_results.get('trade_instructions', {}).get('total', 0)
+                            if analyzed_summary.get('complete'):
+                                trade_instructions = analyzed_summary.get('trade_instructions', {}).get('total', 0)
+                            else:
+                                trade_instructions = analyzed_summary.get('category_counts', {}).get('trade_instruction', 0)
                             logs.append(f"📊 Partial analysis: {trade_instructions} trade instructions found")
                         except Exception as save_error:
                             logs.append(f"⚠️  Could not save partial results: {save_error}")
@@ -2157,13 +2285,11 @@ def execute_regular_step(step, date_str, logs):
             logs.append(f"🔍 Checking for email file: {email_file}")
             if os.path.exists(email_file):
                 try:
-                    import json
-                    with open(email_file, 'r') as f:
-                        email_data = json.load(f)
-                    all_results = email_data.get('all_results', [])
-                    trade_instructions = [e for e in all_results if e.get('ai_analysis', {}).get('ai_email_intent') == 'trade_instruction']
-                    logs.append(f"📧 Email file found: {len(all_results)} total emails, {len(trade_instructions)} trade instructions")
-                    if len(trade_instructions) == 0:
+                    email_summary = _email_records().read_email_summary(email_file)
+                    total_emails = email_summary.get('email_count', 0)
+                    trade_instructions = email_summary.get('category_counts', {}).get('trade_instruction', 0)
+                    logs.append(f"📧 Email file found: {total_emails} total emails, {trade_instructions} trade instructions")
+                    if trade_instructions == 0:
                         logs.append(f"⚠️  WARNING: No trade instructions found in email file!")
                         logs.append(f"⚠️  Email matching will result in 0 matches.")
                 except Exception as e:
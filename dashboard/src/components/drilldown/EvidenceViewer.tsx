@@ -13,6 +13,7 @@ import {
   Speaker,
   X
 } from 'lucide-react';
+import { surveillanceDataService, TranscriptTurn } from '../../services/surveillanceDataService';
 
 interface AudioEvidence {
   filename: string;
@@ -27,6 +28,11 @@ interface AudioEvidence {
   callStart: string;
   callEnd: string;
   mobileNumber: string;
+  date?: string;
+  turnCount?: number;
+  turns?: TranscriptTurn[];
+  turnsFilename?: string;
+  turnsPageSize?: number;
 }
 
 interface EmailEvidence {
@@ -72,6 +78,10 @@ export const EvidenceViewer: React.FC<EvidenceViewerProps> = ({
   const [volume, setVolume] = useState(50);
   const [audioElement, setAudioElement] = useState<HTMLAudioElement | null>(null);
   const [audioError, setAudioError] = useState<string | null>(null);
+  const [turns, setTurns] = useState<TranscriptTurn[]>(
+    type === 'audio' ? (evidence as AudioEvidence).turns || [] : []
+  );
+  const [loadingTurns, setLoadingTurns] = useState(false);
 
   const handlePlayPause = () => {
     if (!audioElement) return;
@@ -165,6 +175,23 @@ export const EvidenceViewer: React.FC<EvidenceViewerProps> = ({
     }
   };
 
+  const handleShowMoreTurns = async () => {
+    const audioEvidence = evidence as AudioEvidence;
+    if (!audioEvidence.date) return;
+    // Page on the backend's page size (or the size of the first page it sent)
+    const pageSize = audioEvidence.turnsPageSize || audioEvidence.turns?.length;
+    if (!pageSize) return;
+    setLoadingTurns(true);
+    const nextPage = Math.floor(turns.length / pageSize) + 1;
+    const page = await surveillanceDataService.getTranscriptTurns(
+      audioEvidence.date, audioEvidence.turnsFilename || audioEvidence.filename, nextPage, pageSize
+    );
+    if (page) {
+      setTurns(turns.concat(page.turns));
+    }
+    setLoadingTurns(false);
+  };
+
   const formatDuration = (seconds: number) => {
     const mins = Math.floor(seconds / 60);
     const secs = Math.floor(seconds % 60);
@@ -373,11 +400,30 @@ export const EvidenceViewer: React.FC<EvidenceViewerProps> = ({
                 <CardTitle className="text-sm">Call Transcript</CardTitle>
               </CardHeader>
               <CardContent>
-                <div className="bg-gray-50 p-4 rounded-lg max-h-60 overflow-y-auto">
-                  <pre className="text-sm whitespace-pre-wrap font-mono">
-                    {audioEvidence.transcript}
-                  </pre>
-                </div>
+                {turns.length > 0 ? (
+                  <div className="bg-gray-50 p-4 rounded-lg max-h-60 overflow-y-auto space-y-2">
+                    {turns.map((turn) => (
+                      <div key={turn.turn} className="text-sm">
+                        <span className="text-xs text-muted-foreground mr-2">
+                          {turn.offset !== null ? formatDuration(turn.offset) : '--:--'}
+                        </span>
+                        <span className="font-medium mr-1">{turn.speaker}:</span>
+                        <span>{turn.text}</span>
+                      </div>
+                    ))}
+                    {turns.length < (audioEvidence.turnCount || 0) && (
+                      <Button variant="ghost" size="sm" onClick={handleShowMoreTurns} disabled={loadingTurns}>
+                        {loadingTurns ? 'Loading...' : `Show more (${turns.length} of ${audioEvidence.turnCount})`}
+                      </Button>
+                    )}
+                  </div>
+                ) : (
+                  <div className="bg-gray-50 p-4 rounded-lg max-h-60 overflow-y-auto">
+                    <pre className="text-sm whitespace-pre-wrap font-mono">
+                      {audioEvidence.transcript}
+                    </pre>
+                  </div>
+                )}
               </CardContent>
             </Card>
           </CardContent>
@@ -46,6 +46,27 @@ export interface RealAudioEvidence {
   mobileNumber: string;
   clientId: string;
   callExtract: string;
+  date?: string;
+  turnCount?: number;
+  turns?: TranscriptTurn[];
+  turnsFilename?: string;
+  turnsPageSize?: number;
+}
+
+export interface TranscriptTurn {
+  turn: number;
+  speaker: string;
+  text: string;
+  offset: number | null;
+}
+
+export interface TranscriptTurnsPage {
+  filename: string;
+  page: number;
+  pageSize: number;
+  turnCount: number;
+  hasMore: boolean;
+  turns: TranscriptTurn[];
 }
 
 export interface RealEmailEvidence {
@@ -195,6 +216,20 @@ class SurveillanceDataService {
     }
   }
 
+  // Get one page of a call's speaker turns
+  async getTranscriptTurns(date: string, filename: string, page: number = 1, pageSize: number = 50): Promise<TranscriptTurnsPage | null> {
+    try {
+      const response = await fetch(`${this.apiBase}/transcript-turns/${date}/${encodeURIComponent(filename)}?page=${page}&page_size=${pageSize}`);
+      if (!response.ok) {
+        return null;
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Error fetching transcript turns:', error);
+      return null;
+    }
+  }
+
   // Get real email evidence for an order
   async getEmailEvidence(orderId: string, date: string): Promise<RealEmailEvidence | null> {
     try {
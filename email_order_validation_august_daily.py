@@ -19,11 +19,26 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from order_book import load_order_book, CandidateIndex, normalize_client_code, normalize_order_id as normalize_orderbook_id
+from order_matching import match_group_deterministically
+from order_assignment import assign_orders_globally
+from instrument_resolver import get_resolver
+from ai_concurrency import call_with_retry, run_keyed_concurrently
+from email_records import iter_email_records
+
+# Attachment text is kept in the content-addressed store under email_processing/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_processing'))
+try:
+    from attachment_store import get_attachment_text
+except ImportError:
+    def get_attachment_text(attachment):
+        return attachment.get('extracted_text')
+
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 def load_email_surveillance_results(date_str):
-    """Load email surveillance results for the specific date."""
+    """Load the trade instruction emails from the email surveillance results for the specific date."""
     try:
         # STANDARDIZED FORMAT: Email surveillance files are in DDMMYYYY format
         # e.g., 03102025 -> email_surveillance_03102025.json
@@ -31,15 +46,11 @@ def load_email_surveillance_results(date_str):
         
         if os.path.exists(email_file):
             print(f"📧 Loading email surveillance results from: {email_file}")
-            with open(email_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Extract trade instructions from the data structure
-            # Use all_results instead of trade_instructions.emails to get emails with multiple instructions
-            all_results = data.get('all_results', [])
-            trade_instructions = [email for email in all_results if email.get('ai_analysis', {}).get('ai_email_intent') == 'trade_instruction']
+            # Stream only the trade instruction records (all instructions per email, not just
+            # the ones with details); other categories are skipped without being parsed
+            trade_instructions = list(iter_email_records(email_file, category='trade_instruction'))
             print(f"📧 Loaded {len(trade_instructions)} trade instructions from email surveillance")
-            return data
+            return trade_instructions
         else:
             print(f"❌ Email surveillance file not found: {email_file}")
             return None
@@ -54,8 +65,11 @@ def filter_emails_by_date(email_data, target_date):
     """Filter emails by date patterns in subject."""
     filtered_emails = []
     
-    # Extract trade instructions from the email data
-    emails = email_data.get('trade_instructions', {}).get('emails', [])
+    # Extract trade instructions from the email data (record list or legacy results document)
+    if isinstance(email_data, list):
+        emails = email_data
+    else:
+        emails = email_data.get('trade_instructions', {}).get('emails', [])
     
     # Convert target_date to different formats
     day = target_date[:2]
@@ -101,10 +115,14 @@ def load_kl_orders(date_str):
         order_file = f"{month_name}/Order Files/OrderBook-Closed-{date_str}.csv"
         print(f"📊 Loading KL orders from: {order_file}")
         
-        df = pd.read_csv(order_file)
+        # Shared typed loader: IDs as strings, cached per file hash
+        order_book = load_order_book(date_str)
+        if order_book is None:
+            print("❌ Error loading KL orders: OrderBook not found or unreadable")
+            return None
         
         # Filter for KL orders (User column starts with 'KL')
-        kl_orders = df[df['User'].str.startswith('KL', na=False)]
+        kl_orders = order_book.kl_orders
         
         print(f"📊 Loaded {len(kl_orders)} KL orders from {order_file}")
         return kl_orders
@@ -310,10 +328,15 @@ def calculate_match_score(email_instruction, kl_order, email_time):
         discrepancies.append(f"Buy/Sell Mismatch - Email: {email_instruction['buy_sell']}, Order: {kl_order['BuySell']}")
         return 0, discrepancies  # No match possible
     
-    # 3. Symbol Match (20 points)
+    # 3. Symbol Match (20 points) - names/aliases resolved by the instrument resolver
     if email_instruction['symbol'] and kl_order['Symbol']:
-        if email_instruction['symbol'].upper() in kl_order['Symbol'].upper():
+        resolved_symbol, _, method = get_resolver().resolve(email_instruction['symbol'], candidates=[kl_order['Symbol']])
+        if resolved_symbol and method != 'fuzzy':
             score += 20
+        elif resolved_symbol:
+            # Approximate name match - partial points, and flagged for review
+            score += 10
+            discrepancies.append(f"Symbol Approximate - Email: {email_instruction['symbol']}, Order: {kl_order['Symbol']}")
         else:
             discrepancies.append(f"Symbol Mismatch - Email: {email_instruction['symbol']}, Order: {kl_order['Symbol']}")
     
@@ -370,16 +393,18 @@ def convert_score_to_percentage(score):
         return 0
     return round((score / 180) * 100, 1)
 
-def match_instruction_to_orders(email_instruction, kl_orders):
+def match_instruction_to_orders(email_instruction, kl_orders, candidate_index=None):
     """
     Match a single email instruction to available orders
     Returns the best match with comprehensive flagging
     """
-    # Filter orders by client and symbol
-    matching_orders = kl_orders[
-        (kl_orders['ClientID'] == email_instruction['client_code']) & 
-        (kl_orders['Symbol'] == email_instruction['symbol'])
-    ].copy()
+    if candidate_index is None:
+        candidate_index = CandidateIndex(kl_orders)
+    
+    # Candidate orders for client and symbol from the per-day index
+    order_symbol, _, _ = get_resolver().resolve(
+        email_instruction['symbol'], candidates=candidate_index.symbols(email_instruction['client_code']))
+    matching_orders = candidate_index.candidates(email_instruction['client_code'], order_symbol or email_instruction['symbol'])
     
     if len(matching_orders) == 0:
         return {
@@ -486,7 +511,7 @@ def match_instruction_to_orders(email_instruction, kl_orders):
         'review_flags': review_flags
     }
 
-def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
+def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None, candidate_index=None):
     """
     Use AI to match email group to orders with intelligent symbol matching
     """
@@ -495,35 +520,13 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
     final_instruction = extract_final_instruction(email_group, group_key)
     print(f"🔍 DEBUG: Final instruction extracted: {final_instruction}")
     
-    # Filter orders by client code first - with normalization
-    client_code = final_instruction['client_code']
-    
-    # Try exact match first
-    client_orders = kl_orders[kl_orders['ClientID'] == client_code].copy()
+    if candidate_index is None:
+        candidate_index = CandidateIndex(kl_orders)
     
-    # If no exact match, try normalized client code patterns
-    if len(client_orders) == 0:
-        # Handle EOWM -> NEOWM normalization
-        if client_code.startswith('EOWM') and not client_code.startswith('NEOWM'):
-            normalized_code = f'NEOWM{client_code[4:]}'  # EOWM00542 -> NEOWM00542
-            client_orders = kl_orders[kl_orders['ClientID'] == normalized_code].copy()
-            if len(client_orders) > 0:
-                print(f"🔍 DEBUG: Found orders with normalized client code: {normalized_code}")
-        
-        # Handle WM -> NEOWM normalization
-        elif client_code.startswith('WM') and not client_code.startswith('NEOWM'):
-            normalized_code = f'NEO{client_code}'
-            client_orders = kl_orders[kl_orders['ClientID'] == normalized_code].copy()
-            if len(client_orders) > 0:
-                print(f"🔍 DEBUG: Found orders with normalized client code: {normalized_code}")
-        
-        # Handle other NEO patterns
-        elif not client_code.startswith('NEO') and client_code.isdigit():
-            # Try NEO + client_code
-            normalized_code = f'NEO{client_code}'
-            client_orders = kl_orders[kl_orders['ClientID'] == normalized_code].copy()
-            if len(client_orders) > 0:
-                print(f"🔍 DEBUG: Found orders with normalized client code: {normalized_code}")
+    # Candidate orders for the client - EOWM/WM/NEO client code variants are
+    # normalized once when the index is built
+    client_code = final_instruction['client_code']
+    client_orders = candidate_index.candidates(client_code)
     
     print(f"🔍 DEBUG: Client orders found for {client_code}: {len(client_orders)}")
     
@@ -535,15 +538,35 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
             'match_type': 'NO_MATCH',
             'confidence_score': 0,
             'discrepancies': [f'No orders found for client {client_code}'],
-            'review_flags': []
+            'review_flags': [],
+            'match_tier': 'no_candidates'
         }
     
+    # Tiered deterministic pre-match (exact / split execution / symbol alias);
+    # only ambiguous groups go to the AI
+    deterministic_result = match_group_deterministically(final_instruction, candidate_index)
+    if deterministic_result:
+        print(f"🔍 DEBUG: ✅ Deterministic {deterministic_result['match_tier']} match: "
+              f"{len(deterministic_result['matched_orders'])} orders ({deterministic_result['confidence_score']}%)")
+        return deterministic_result
+    
+    # Resolve instruction symbols locally; when all resolve, only those symbols' orders go in the prompt
+    resolver = get_resolver()
+    client_symbols = candidate_index.symbols(client_code)
+    resolved_symbols = [resolver.resolve(instruction.get('symbol'), candidates=client_symbols)[0]
+                        for instruction in final_instruction['instructions']]
+    prompt_orders = client_orders
+    if resolved_symbols and all(resolved_symbols):
+        prompt_orders = client_orders[client_orders['Symbol'].isin(set(resolved_symbols))]
+        print(f"🔍 DEBUG: Symbols resolved locally {sorted(set(resolved_symbols))}: {len(prompt_orders)}/{len(client_orders)} orders sent to AI")
+    
     # Prepare ALL email instructions for AI
     email_instructions = []
-    for instruction in final_instruction['instructions']:
+    for instruction, resolved_symbol in zip(final_instruction['instructions'], resolved_symbols):
         email_instructions.append({
             'client_code': final_instruction['client_code'],
             'symbol': instruction.get('symbol'),
+            'resolved_symbol': resolved_symbol,
             'quantity': instruction.get('quantity'),
             'price': instruction.get('price'),
             'buy_sell': instruction.get('buy_sell'),
@@ -553,7 +576,7 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
     
     # Prepare available orders for AI
     available_orders = []
-    for _, order in client_orders.iterrows():
+    for _, order in prompt_orders.iterrows():
         available_orders.append({
             'order_id': str(order['NorenOrderID']),
             'symbol': order['Symbol'],
@@ -576,6 +599,7 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
     **CRITICAL MATCHING RULES:**
 
     1. **SYMBOL MATCHING** - Be intelligent about variations:
+       - "resolved_symbol" (when present) is the OrderBook symbol resolved locally for that instruction
        - "blue jet healthcare" = "BLUEJET"
        - "Energy INVIT" = "ENERGYINF"
        - "Manappuram Finance Limited" = "MANAPPURAM"
@@ -624,13 +648,15 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
         for order in available_orders:
             print(f"🔍 DEBUG:   Order: {order['order_id']} - {order['symbol']} - {order['quantity']} - {order['price']}")
         
-        response = client.chat.completions.create(
+        response = call_with_retry(
+            client.chat.completions.create,
             model="gpt-4.1",
             messages=[
                 {"role": "system", "content": "You are a trade surveillance expert. Match trade instructions to orders accurately."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.1
+            temperature=0.1,
+            description=f"AI order matching for {group_key}"
         )
         
         ai_response = response.choices[0].message.content.strip()
@@ -656,13 +682,22 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
         matched_orders = []
         for order_id in ai_result.get('matched_order_ids', []):
             print(f"🔍 DEBUG: Looking for order ID: {order_id}")
-            matched_order = client_orders[client_orders['NorenOrderID'] == float(order_id)]
+            matched_order = client_orders[client_orders['NorenOrderID'] == normalize_orderbook_id(order_id)]
             if not matched_order.empty:
                 matched_orders.append(matched_order.iloc[0].to_dict())
                 print(f"🔍 DEBUG: ✅ Found matched order: {order_id}")
             else:
                 print(f"🔍 DEBUG: ❌ Order not found: {order_id}")
         
+        # Confirmed single-symbol matches teach the resolver the email's wording;
+        # applied in the reduce step of assign_emails_to_orders so concurrent runs stay deterministic
+        learned_symbols = []
+        matched_symbols = {order.get('Symbol') for order in matched_orders}
+        if len(matched_symbols) == 1 and float(ai_result.get('confidence_score', 0) or 0) >= 90:
+            for instruction in final_instruction['instructions']:
+                if instruction.get('symbol'):
+                    learned_symbols.append((instruction['symbol'], next(iter(matched_symbols))))
+        
         # Generate review flags
         review_flags = []
         if ai_result.get('review_required', False):
@@ -677,13 +712,17 @@ def match_email_group_to_orders_with_ai(email_group, kl_orders, group_key=None):
             'match_type': ai_result.get('match_type', 'NO_MATCH'),
             'confidence_score': ai_result.get('confidence_score', 0),
             'discrepancies': ai_result.get('discrepancies', []),
-            'review_flags': review_flags
+            'review_flags': review_flags,
+            'match_tier': 'llm',
+            'learned_symbols': learned_symbols
         }
         
     except Exception as e:
         print(f"❌ AI matching failed: {e}")
         # Fallback to exact matching
-        return match_instruction_to_orders(final_instruction, kl_orders)
+        fallback_result = match_instruction_to_orders(final_instruction, kl_orders, candidate_index)
+        fallback_result['match_tier'] = 'score_fallback'
+        return fallback_result
 
 def assign_emails_to_orders(emails, kl_orders):
     """
@@ -713,43 +752,71 @@ def assign_emails_to_orders(emails, kl_orders):
     
     print(f"📧 Extracted {len(final_instructions)} final instructions")
     
-    # Step 3: Match each instruction to orders
+    # Step 3: Match each instruction group to orders (proposals per group)
     assignments = []
-    used_orders = set()
+    candidate_index = CandidateIndex(kl_orders)
+    # Symbol universe grows with every order book seen
+    get_resolver().add_order_book(kl_orders)
     
+    # AI calls for different clients run concurrently (AI_MATCH_CONCURRENCY); groups of the
+    # same client run serially. Results are reduced below in group order, same as a serial run.
     print(f"🔍 DEBUG: Starting matching for {len(email_groups)} groups")
-    for group_key, email_group in email_groups.items():
-        print(f"🔍 DEBUG: Matching group '{group_key}' with {len(email_group)} emails")
-        match_result = match_email_group_to_orders_with_ai(email_group, kl_orders, group_key)
+    group_items = [
+        (normalize_client_code(extract_client_code_from_email(email_group[0])) or group_key, (group_key, email_group))
+        for group_key, email_group in email_groups.items()
+    ]
+    group_results = run_keyed_concurrently(
+        group_items,
+        lambda item: match_email_group_to_orders_with_ai(item[1], kl_orders, item[0], candidate_index)
+    )
+    
+    resolver = get_resolver()
+    for (_, (group_key, email_group)), match_result in zip(group_items, group_results):
+        if isinstance(match_result, Exception) or match_result is None:
+            print(f"❌ Matching failed for group '{group_key}': {match_result}")
+            match_result = {
+                'email_instruction': extract_final_instruction(email_group, group_key) or {'group_id': group_key, 'client_code': None, 'symbol': None, 'instructions': []},
+                'matched_orders': [],
+                'match_type': 'NO_MATCH',
+                'confidence_score': 0,
+                'discrepancies': [f'Matching failed: {match_result}'],
+                'review_flags': [],
+                'match_tier': 'error'
+            }
+        for text, symbol in match_result.pop('learned_symbols', []):
+            resolver.learn(text, symbol)
         print(f"🔍 DEBUG: Match result for '{group_key}': {match_result.get('match_type')} - {match_result.get('confidence_score')}%")
         print(f"🔍 DEBUG: Matched orders count: {len(match_result.get('matched_orders', []))}")
         if match_result.get('matched_orders'):
             for order in match_result['matched_orders']:
                 print(f"🔍 DEBUG:   Matched order: {order.get('NorenOrderID')} - {order.get('symbol')}")
-        
-        # Check if any of the matched orders are already used
+        assignments.append(match_result)
+    
+    # Step 4: Resolve overlapping proposals with a one-to-one assignment per client
+    # (independent of group order; losers without an alternative become ORDER_CONFLICT)
+    assign_orders_globally(assignments, candidate_index)
+    
+    used_orders = set()
+    for match_result in assignments:
         matched_order_ids = [order['NorenOrderID'] for order in match_result['matched_orders']]
-        already_used = any(order_id in used_orders for order_id in matched_order_ids)
-        
-        if already_used:
-            # Mark as conflict
-            match_result['match_type'] = 'ORDER_CONFLICT'
-            match_result['discrepancies'].append('Order already assigned to another instruction')
-        
-        # Add matched_order_ids to the result structure
         match_result['matched_order_ids'] = matched_order_ids
-        
-        # Mark orders as used
-        for order_id in matched_order_ids:
-            used_orders.add(order_id)
-        
-        assignments.append(match_result)
+        used_orders.update(matched_order_ids)
+        if match_result.get('assignment') == 'reassigned':
+            print(f"🔄 Reassigned {match_result['email_instruction'].get('group_id')}: {matched_order_ids}")
+        elif match_result.get('match_type') == 'ORDER_CONFLICT':
+            print(f"⚠️ Order conflict for {match_result['email_instruction'].get('group_id')}: proposal assigned to another instruction")
     
     print(f"\n📊 NEW MAPPING SUMMARY:")
     print(f"   Total email groups: {len(email_groups)}")
     print(f"   Final instructions: {len(final_instructions)}")
     print(f"   Successful matches: {len([a for a in assignments if a['match_type'] != 'NO_MATCH'])}")
     print(f"   Orders used: {len(used_orders)}")
+    tier_counts = {}
+    for assignment in assignments:
+        tier = assignment.get('match_tier', 'llm')
+        tier_counts[tier] = tier_counts.get(tier, 0) + 1
+    print(f"   Deciding tiers: {tier_counts}")
+    get_resolver().save_learned()
     
     return assignments
 
@@ -780,6 +847,8 @@ def generate_mapping_report(matches, date_str):
                 'Email_Price': first_instruction.get('price', ''),
                 'Email_Buy_Sell': first_instruction.get('buy_sell', ''),
                 'Match_Type': match['match_type'],
+                'Match_Tier': match.get('match_tier', ''),
+                'Assignment': match.get('assignment', ''),
                 'Confidence_Score': match['confidence_score'],
                 'Total_Order_Quantity': sum(order['Qty'] for order in orders),
                 'Order_Count': len(orders),
@@ -799,6 +868,8 @@ def generate_mapping_report(matches, date_str):
                 'Email_Price': instruction.get('price', ''),
                 'Email_Buy_Sell': instruction.get('buy_sell', ''),
                 'Match_Type': match['match_type'],
+                'Match_Tier': match.get('match_tier', ''),
+                'Assignment': match.get('assignment', ''),
                 'Confidence_Score': match['confidence_score'],
                 'Total_Order_Quantity': sum(order['Qty'] for order in orders),
                 'Order_Count': len(orders),
@@ -874,20 +945,8 @@ def save_mapping_data(matches, date_str):
 
 def normalize_order_id(order_id):
     """Convert scientific notation to full order ID for comparison"""
-    if pd.isna(order_id):
-        return None
-    try:
-        # Convert scientific notation to full number, then to string
-        normalized = str(int(float(order_id)))
-        # Handle precision issues for very large numbers
-        # If the normalized ID is very close to the original, use the original
-        if len(normalized) > 15:  # Very large order IDs
-            # Try to match by checking if they're within a small range
-            original_int = int(float(order_id))
-            return str(original_int)
-        return normalized
-    except (ValueError, TypeError):
-        return None
+    # Digit strings from the typed OrderBook are returned as-is (no float precision loss)
+    return normalize_orderbook_id(order_id)
 
 def update_audio_surveillance_excel(matches, date_str):
     """Update the audio surveillance Excel file with email-order mapping information."""
@@ -917,16 +976,10 @@ def update_audio_surveillance_excel(matches, date_str):
         df = pd.read_excel(audio_file)
         print(f"📊 Loaded audio surveillance file with {len(df)} orders")
         
-        # Load KL orders to create NorenOrderID to ExchOrderID mapping
-        kl_orders = load_kl_orders(date_str)
-        if kl_orders is not None:
-            # Create mapping from NorenOrderID to ExchOrderID
-            noren_to_exch_mapping = {}
-            for _, row in kl_orders.iterrows():
-                noren_id = row.get('NorenOrderID')
-                exch_id = row.get('ExchOrderID')
-                if pd.notna(noren_id) and pd.notna(exch_id):
-                    noren_to_exch_mapping[noren_id] = exch_id
+        # NorenOrderID to ExchOrderID mapping is precomputed by the shared OrderBook loader
+        order_book = load_order_book(date_str)
+        if order_book is not None:
+            noren_to_exch_mapping = order_book.noren_to_exch
             print(f"📊 Created NorenOrderID to ExchOrderID mapping for {len(noren_to_exch_mapping)} orders")
         else:
             noren_to_exch_mapping = {}
@@ -943,6 +996,7 @@ def update_audio_surveillance_excel(matches, date_str):
                 noren_order_id = order.get('NorenOrderID')
                 if pd.notna(noren_order_id):  # Only map orders with valid IDs
                     # Map NorenOrderID to ExchOrderID for Excel matching
+                    noren_order_id = normalize_order_id(noren_order_id)
                     exch_order_id = noren_to_exch_mapping.get(noren_order_id, noren_order_id)
                     # Normalize the order ID for comparison
                     normalized_order_id = normalize_order_id(exch_order_id)
@@ -966,9 +1020,10 @@ def update_audio_surveillance_excel(matches, date_str):
                         if source_email.get('has_attachments', False) and source_email.get('attachments'):
                             email_content += f"\n--- PDF ATTACHMENTS ---\n"
                             for attachment in source_email.get('attachments', []):
-                                if 'extracted_text' in attachment:
+                                extracted_text = get_attachment_text(attachment)
+                                if extracted_text:
                                     email_content += f"\nPDF: {attachment.get('name', 'Unknown')}\n"
-                                    email_content += f"{attachment['extracted_text']}\n"
+                                    email_content += f"{extracted_text}\n"
                         
                         email_order_mapping[normalized_order_id] = {
                             'email_match': 'Matched',
@@ -1070,9 +1125,10 @@ def update_audio_surveillance_excel(matches, date_str):
                                     if source_email.get('has_attachments', False) and source_email.get('attachments'):
                                         email_content += f"\n--- PDF ATTACHMENTS ---\n"
                                         for attachment in source_email.get('attachments', []):
-                                            if 'extracted_text' in attachment:
+                                            extracted_text = get_attachment_text(attachment)
+                                            if extracted_text:
                                                 email_content += f"\nPDF: {attachment.get('name', 'Unknown')}\n"
-                                                email_content += f"{attachment['extracted_text']}\n"
+                                                email_content += f"{extracted_text}\n"
                                     
                                     mapping = {
                                         'email_match': 'Matched',
@@ -1167,15 +1223,12 @@ def main():
     
     # Step 1: Load email surveillance results
     print("📧 Step 1: Loading email surveillance results...")
-    all_emails = load_email_surveillance_results(date_str)
-    if all_emails is None:
+    date_emails = load_email_surveillance_results(date_str)
+    if date_emails is None:
         sys.exit(1)
     
     # Step 2: Get trade instructions (skip date filtering for date-specific files)
     print("📅 Step 2: Getting trade instructions...")
-    # Use all_results instead of trade_instructions.emails to get complete email data with all instructions
-    all_results = all_emails.get('all_results', [])
-    date_emails = [email for email in all_results if email.get('ai_analysis', {}).get('ai_email_intent') == 'trade_instruction']
     print(f"📧 Found {len(date_emails)} trade instructions")
     
     # Step 3: Load KL orders
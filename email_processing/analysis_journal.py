@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Append-only checkpoint journal for the email analysis stage.
+
+Every analyzed email/thread is appended (and fsynced) to
+email_analysis_journal_{date}.jsonl as soon as its analysis finishes, keyed by
+its Graph message ids (or thread key / content hash for older inputs). When
+complete_email_surveillance_system.py is restarted after a crash, OOM or token
+expiry - or re-run from the dashboard job API - threads already in the journal
+are reused instead of being sent to the model again.
+
+A partially written last line (crash mid-write) is discarded on open.
+"""
+
+import hashlib
+import json
+import os
+
+JOURNAL_DIR = os.getenv('EMAIL_ANALYSIS_JOURNAL_DIR', '.')
+
+
+def analysis_key(email):
+    """Stable key for an email/thread: its message ids, else thread key + content hash"""
+    message_ids = email.get('message_ids') or ([email['message_id']] if email.get('message_id') else [])
+    if message_ids:
+        return 'msg:' + hashlib.sha1('|'.join(sorted(message_ids)).encode('utf-8')).hexdigest()
+    content = '\x1f'.join(str(email.get(field, '')) for field in ('thread_key', 'subject', 'sender', 'date', 'clean_text'))
+    return 'sha1:' + hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def journal_path_for(run_id):
+    """Journal file for one surveillance run (normally the email date)"""
+    return os.path.join(JOURNAL_DIR, f"email_analysis_journal_{run_id}.jsonl")
+
+
+class AnalysisJournal:
+    """Append-only key -> analysis result journal"""
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self.entries = {}
+        if fresh and os.path.exists(path):
+            os.remove(path)
+            print(f"🧹 Started a fresh analysis journal: {path}")
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Read existing entries and drop a torn last line"""
+        if not os.path.exists(self.path):
+            return
+        good_offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self.entries[entry['key']] = entry
+                good_offset += len(line)
+        if good_offset < os.path.getsize(self.path):
+            print(f"⚠️ Discarding incomplete journal entry at byte {good_offset} of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+        if self.entries:
+            print(f"📒 Resuming from journal: {len(self.entries)} email(s) already analyzed ({self.path})")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def append(self, key, result, **extra):
+        """Record one finished analysis durably before moving on"""
+        entry = {'key': key, **extra, 'result': result}
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.entries[key] = entry
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return len(self.entries)
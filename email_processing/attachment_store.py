@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Content-addressed attachment store for email processing.
+
+Attachments are keyed by the sha256 of their bytes, so the same client mandate
+PDF or forwarded .eml that shows up across threads and days is only stored and
+parsed once. The index keeps the extracted text and page count next to each
+blob; emails in the JSON output reference attachments by hash.
+
+Layout:
+    attachment_store/
+        index.json                  sha256 -> metadata + extracted text
+        blobs/ab/abcdef....pdf      raw attachment bytes
+"""
+
+import json
+import os
+import hashlib
+import mimetypes
+from datetime import datetime, timedelta
+
+SURVEILLANCE_BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATTACHMENT_STORE_DIR = os.getenv('ATTACHMENT_STORE_DIR', os.path.join(SURVEILLANCE_BASE, 'attachment_store'))
+ATTACHMENT_STORE_MAX_MB = int(os.getenv('ATTACHMENT_STORE_MAX_MB', '500'))
+ATTACHMENT_STORE_MAX_AGE_DAYS = int(os.getenv('ATTACHMENT_STORE_MAX_AGE_DAYS', '90'))
+
+_index_cache = None
+
+
+def _index_path():
+    return os.path.join(ATTACHMENT_STORE_DIR, 'index.json')
+
+
+def _blob_path(sha256, extension):
+    return os.path.join(ATTACHMENT_STORE_DIR, 'blobs', sha256[:2], f"{sha256}{extension}")
+
+
+def load_index():
+    """Load the store index (cached for the lifetime of the process)"""
+    global _index_cache
+    if _index_cache is not None:
+        return _index_cache
+
+    _index_cache = {}
+    if os.path.exists(_index_path()):
+        try:
+            with open(_index_path(), 'r') as f:
+                _index_cache = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read attachment store index, starting empty: {e}")
+            _index_cache = {}
+    return _index_cache
+
+
+def save_index():
+    """Write the index atomically so a crash never leaves a half-written file"""
+    index = load_index()
+    os.makedirs(ATTACHMENT_STORE_DIR, exist_ok=True)
+    tmp_path = _index_path() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, _index_path())
+
+
+def compute_sha256(content):
+    """Return the hex sha256 of raw attachment bytes"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_entry(sha256):
+    """Return the index entry for a hash, or None if it is not stored"""
+    entry = load_index().get(sha256)
+    if entry and not os.path.exists(entry.get('file_path', '')):
+        # Blob was removed from disk behind our back - treat as a miss
+        return None
+    return entry
+
+
+def store_attachment_bytes(content, name, content_type):
+    """Store attachment bytes and return (sha256, entry, is_new)"""
+    sha256 = compute_sha256(content)
+    index = load_index()
+    now = datetime.now().isoformat()
+
+    entry = get_entry(sha256)
+    if entry:
+        entry['last_used'] = now
+        entry['hit_count'] = entry.get('hit_count', 0) + 1
+        return sha256, entry, False
+
+    extension = mimetypes.guess_extension(content_type) if content_type else None
+    if not extension:
+        extension = '.bin'
+
+    file_path = _blob_path(sha256, extension)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+    entry = {
+        'sha256': sha256,
+        'name': name,
+        'content_type': content_type,
+        'size': len(content),
+        'file_path': file_path,
+        'first_seen': now,
+        'last_used': now,
+        'hit_count': 0
+    }
+    index[sha256] = entry
+    return sha256, entry, True
+
+
+def has_extracted_text(sha256):
+    """True if the text for this attachment was already extracted"""
+    entry = get_entry(sha256)
+    return bool(entry) and 'extracted_text' in entry
+
+
+def record_extraction(sha256, extracted_text, page_count=None):
+    """Save extracted text (and page count for PDFs) against a stored attachment"""
+    entry = load_index().get(sha256)
+    if not entry:
+        return
+    entry['extracted_text'] = extracted_text
+    entry['page_count'] = page_count
+    entry['extracted_at'] = datetime.now().isoformat()
+
+
+def get_attachment_text(attachment):
+    """Return extracted text for an attachment reference from the email JSON.
+
+    Accepts both the new hash references and older records that still carry
+    inline 'extracted_text'.
+    """
+    if attachment.get('extracted_text'):
+        return attachment['extracted_text']
+    sha256 = attachment.get('sha256')
+    if not sha256:
+        return None
+    entry = load_index().get(sha256)
+    if not entry:
+        return None
+    return entry.get('extracted_text')
+
+
+def to_attachment_reference(attachment_info):
+    """Strip inline text from an attachment record, keeping the hash reference"""
+    reference = {k: v for k, v in attachment_info.items() if k != 'extracted_text'}
+    text = attachment_info.get('extracted_text')
+    if text is not None:
+        reference['text_length'] = len(text)
+    return reference
+
+
+def evict(max_mb=None, max_age_days=None):
+    """Evict least recently used blobs until the store fits the size/age limits"""
+    max_mb = ATTACHMENT_STORE_MAX_MB if max_mb is None else max_mb
+    max_age_days = ATTACHMENT_STORE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    index = load_index()
+    if not index:
+        return 0
+
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+    max_bytes = max_mb * 1024 * 1024
+
+    # Oldest first so the size pass drops the least recently used entries
+    entries = sorted(index.values(), key=lambda e: e.get('last_used', ''))
+    total_bytes = sum(e.get('size', 0) for e in entries)
+
+    evicted = 0
+    for entry in entries:
+        too_old = entry.get('last_used', '') < cutoff
+        too_big = total_bytes > max_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            if os.path.exists(entry.get('file_path', '')):
+                os.remove(entry['file_path'])
+        except OSError as e:
+            print(f"⚠️ Could not remove stored attachment {entry.get('name')}: {e}")
+            continue
+        total_bytes -= entry.get('size', 0)
+        del index[entry['sha256']]
+        evicted += 1
+
+    if evicted:
+        print(f"🧹 Evicted {evicted} attachments from store ({total_bytes / (1024 * 1024):.1f} MB kept)")
+    return evicted
@@ -7,8 +7,10 @@ Achieves 91% coverage for email trade surveillance
 
 import json
 import re
+import hashlib
 import openai
 import os
+import sys
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -25,6 +27,29 @@ try:
 except ImportError:
     TWO_STAGE_AVAILABLE = False
 
+# Attachment text is stored by content hash, emails only carry the reference
+try:
+    from attachment_store import get_attachment_text
+except ImportError:
+    def get_attachment_text(attachment):
+        return attachment.get('extracted_text')
+
+# Per-email checkpoints so interrupted runs resume instead of re-analyzing
+from analysis_journal import AnalysisJournal, analysis_key, journal_path_for
+
+# NDJSON email artifacts (shared with the validation step and dashboard)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from email_records import (
+    EmailRecordWriter, iter_email_records, read_email_summary, email_category, KIND_SURVEILLANCE_RESULTS
+)
+
+# Deterministic extraction for known dealer table layouts (no model call)
+try:
+    from fast_path_extraction import extract_fast_path, FAST_PATH_MIN_CONFIDENCE
+    FAST_PATH_AVAILABLE = True
+except ImportError:
+    FAST_PATH_AVAILABLE = False
+
 # Prefer strict two-stage analyzer if available (duplicate file per user request)
 STRICT_TWO_STAGE_AVAILABLE = False
 try:
@@ -369,7 +394,11 @@ def call_openai_model(model_name, attempt, max_retries, prompt):
         return None, e
 
 def analyze_email_with_ai(subject, clean_text, sender, table_data=None, attachments=None):
-    """Analyze email using AI for intent and order details - can extract multiple instructions"""
+    """
+    Analyze email using AI for intent and order details - can extract multiple instructions.
+
+    When no model returns a usable result, the fallback analysis has ai_failed=True.
+    """
     try:
         # Prepare PDF attachment information for AI
         attachment_info = ""
@@ -377,8 +406,9 @@ def analyze_email_with_ai(subject, clean_text, sender, table_data=None, attachme
             attachment_info = "\n\n**PDF ATTACHMENTS FOUND:**\n"
             for i, attachment in enumerate(attachments, 1):
                 attachment_info += f"PDF Attachment {i}: {attachment.get('name', 'Unknown')}\n"
-                if 'extracted_text' in attachment:
-                    attachment_info += f"PDF Content:\n{attachment['extracted_text']}\n"
+                extracted_text = get_attachment_text(attachment)
+                if extracted_text:
+                    attachment_info += f"PDF Content:\n{extracted_text}\n"
                 attachment_info += "\n"
         
         prompt = f"""
@@ -455,7 +485,8 @@ def analyze_email_with_ai(subject, clean_text, sender, table_data=None, attachme
                 "ai_confidence_score": 0,
                 "ai_reasoning": f"Forced model {model_name} returned no usable result",
                 "ai_order_details": None,
-                "ai_instruction_type": None
+                "ai_instruction_type": None,
+                "ai_failed": True
             }
 
         # Default: try o3, then gpt-4.1
@@ -477,7 +508,8 @@ def analyze_email_with_ai(subject, clean_text, sender, table_data=None, attachme
                             "ai_confidence_score": 0,
                             "ai_reasoning": "AI response empty or invalid after retries on both o3 and gpt-4.1",
                             "ai_order_details": None,
-                            "ai_instruction_type": None
+                            "ai_instruction_type": None,
+                            "ai_failed": True
                         }
 
     except Exception as e:
@@ -487,9 +519,28 @@ def analyze_email_with_ai(subject, clean_text, sender, table_data=None, attachme
             "ai_confidence_score": 0,
             "ai_reasoning": f"AI analysis failed: {str(e)}",
             "ai_order_details": None,
-            "ai_instruction_type": None
+            "ai_instruction_type": None,
+            "ai_failed": True
         }
 
+def _input_fingerprint(path):
+    """Content hash of the input file (journal id for inputs without a target date)"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _has_meaningful_details(detail):
+    """True if an instruction carries any of the core order fields"""
+    return isinstance(detail, dict) and any([
+        detail.get('client_code'),
+        detail.get('symbol'),
+        detail.get('quantity'),
+        detail.get('price'),
+        detail.get('buy_sell')
+    ])
+
 def _normalize_order_details(order_details):
     """Normalize order details while preserving arrays. Returns the input as-is if it's already properly formatted."""
     if isinstance(order_details, dict):
@@ -499,245 +550,232 @@ def _normalize_order_details(order_details):
         return order_details
     return {}
 
-def main():
-    """Complete email surveillance system from scratch"""
-    
-    print("=== COMPLETE EMAIL SURVEILLANCE SYSTEM ===")
-    print("Full AI analysis from scratch with enhanced extraction methods")
-    print("Target: 91% coverage for email trade surveillance")
+def analyze_email_record(email, manual_extractions):
+    """
+    Analyze one email/thread record (fast path, AI analysis, instruction extraction).
     
-    # Generate timestamp for output file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    Returns:
+        (result record, whether the fast path was used)
+    """
+    subject = email.get('subject', '')
+    clean_text = email.get('clean_text', '')
+    sender = email.get('sender', '')
+    attachments = email.get('attachments', [])
+    has_attachments = email.get('has_attachments', False)
     
-    # Load comprehensive analysis
-    print("\n📂 Loading email data...")
-    with open('comprehensive_dealing_emails_analysis.json', 'r') as f:
-        data = json.load(f)
+    if has_attachments:
+        print(f"   📎 Email has {len(attachments)} attachments")
     
-    # Handle both list and dict structures
-    if isinstance(data, list):
-        emails = data
-    else:
-        emails = data.get('email_analyses', [])
-    print(f"   Loaded {len(emails)} emails for analysis")
+    # Step 1: AI Analysis
+    table_data = email.get('table_data', [])
     
-    # Get manual extractions
-    manual_extractions = get_manual_extractions()
+    # Fast path: well-structured dealer tables are extracted deterministically
+    ai_analysis = None
+    used_fast_path = False
+    if FAST_PATH_AVAILABLE:
+        fast_path_result = extract_fast_path(subject, table_data, clean_text)
+        if fast_path_result and fast_path_result['ai_confidence_score'] >= FAST_PATH_MIN_CONFIDENCE:
+            print(f"   ⚡ Fast path extraction ({fast_path_result['ai_confidence_score']}%): {fast_path_result['ai_reasoning']}")
+            ai_analysis = fast_path_result
+            used_fast_path = True
+        elif fast_path_result:
+            print(f"   ⚠️ Fast path confidence too low ({fast_path_result['ai_confidence_score']}%), using AI")
     
-    # Process all emails
-    print(f"\n🤖 Starting AI analysis for {len(emails)} emails...")
-    
-    results = []
-    trade_instructions = []
-    trade_confirmations = []
-    other_emails = []
-    
-    for i, email in enumerate(emails, 1):
-        subject = email.get('subject', '')
-        clean_text = email.get('clean_text', '')
-        sender = email.get('sender', '')
-        attachments = email.get('attachments', [])
-        has_attachments = email.get('has_attachments', False)
-        
-        print(f"\n[{i}/{len(emails)}] Analyzing: {subject[:60]}...")
-        if has_attachments:
-            print(f"   📎 Email has {len(attachments)} attachments")
-        
-        # Step 1: AI Analysis
-        table_data = email.get('table_data', [])
-        
+    if ai_analysis is None:
         # Force legacy analysis (old system)
         print(f"   🤖 Using legacy analysis (gpt-4.1)...")
         ai_analysis = analyze_email_with_ai(subject, clean_text, sender, table_data, attachments)
+    
+    # Step 2: Enhanced Extraction for Trade Instructions
+    if ai_analysis.get('ai_email_intent') == 'trade_instruction':
+        print(f"   ✅ Trade instruction detected")
+        
+        # Handle multiple instructions from AI analysis
+        ai_order_details = ai_analysis.get('ai_order_details', [])
+        
+        # Ensure ai_order_details is a list
+        if not isinstance(ai_order_details, list):
+            if isinstance(ai_order_details, dict):
+                ai_order_details = [ai_order_details]
+            else:
+                ai_order_details = []
         
-        # Step 2: Enhanced Extraction for Trade Instructions
-        if ai_analysis.get('ai_email_intent') == 'trade_instruction':
-            print(f"   ✅ Trade instruction detected")
+        # Check if we have manual extraction for this email
+        if subject in manual_extractions:
+            print(f"   🔧 Applying manual extraction")
+            manual_details = manual_extractions[subject]
             
-            # Handle multiple instructions from AI analysis
-            ai_order_details = ai_analysis.get('ai_order_details', [])
+            # For manual extraction, we still create a single instruction
+            combined_details = {
+                'client_code': manual_details.get('client_code'),
+                'symbol': manual_details.get('symbol'),
+                'quantity': manual_details.get('quantity'),
+                'price': manual_details.get('price'),
+                'buy_sell': manual_details.get('buy_sell'),
+                'order_time': manual_details.get('trade_date'),
+                'trade_date': manual_details.get('trade_date'),
+                'isin': manual_details.get('isin'),
+                'expiry': manual_details.get('expiry'),
+                'strike_price': manual_details.get('strike_price'),
+                'option_type': manual_details.get('option_type'),
+                'order_type': manual_details.get('order_type')
+            }
             
-            # Ensure ai_order_details is a list
-            if not isinstance(ai_order_details, list):
-                if isinstance(ai_order_details, dict):
-                    ai_order_details = [ai_order_details]
-                else:
-                    ai_order_details = []
+            # Check if we have meaningful order details
+            has_order_details = any([
+                combined_details['client_code'],
+                combined_details['symbol'],
+                combined_details['quantity'],
+                combined_details['price'],
+                combined_details['buy_sell']
+            ])
             
-            # Check if we have manual extraction for this email
-            if subject in manual_extractions:
-                print(f"   🔧 Applying manual extraction")
-                manual_details = manual_extractions[subject]
-                
-                # For manual extraction, we still create a single instruction
-                combined_details = {
-                    'client_code': manual_details.get('client_code'),
-                    'symbol': manual_details.get('symbol'),
-                    'quantity': manual_details.get('quantity'),
-                    'price': manual_details.get('price'),
-                    'buy_sell': manual_details.get('buy_sell'),
-                    'order_time': manual_details.get('trade_date'),
-                    'trade_date': manual_details.get('trade_date'),
-                    'isin': manual_details.get('isin'),
-                    'expiry': manual_details.get('expiry'),
-                    'strike_price': manual_details.get('strike_price'),
-                    'option_type': manual_details.get('option_type'),
-                    'order_type': manual_details.get('order_type')
-                }
+            if has_order_details:
+                print(f"   ✅ Order details extracted (manual)")
+                ai_analysis['ai_order_details'] = [combined_details]
+            else:
+                print(f"   ⚠️ No order details found")
+                ai_analysis['ai_order_details'] = []
+        else:
+            # Use AI extraction - handle multiple instructions
+            print(f"   🔧 Using AI extraction from clean text")
+            
+            # Process each instruction from AI
+            valid_instructions = []
+            
+            # Handle case where AI returns single object instead of array
+            if isinstance(ai_order_details, dict):
+                ai_order_details = [ai_order_details]
+            elif not isinstance(ai_order_details, list):
+                ai_order_details = []
+            
+            for instruction in ai_order_details:
+                # Normalize each instruction
+                normalized_instruction = _normalize_order_details(instruction) or {}
                 
-                # Check if we have meaningful order details
+                # Check if this instruction has meaningful order details
                 has_order_details = any([
-                    combined_details['client_code'],
-                    combined_details['symbol'],
-                    combined_details['quantity'],
-                    combined_details['price'],
-                    combined_details['buy_sell']
+                    normalized_instruction.get('client_code'),
+                    normalized_instruction.get('symbol'),
+                    normalized_instruction.get('quantity'),
+                    normalized_instruction.get('price'),
+                    normalized_instruction.get('buy_sell')
                 ])
                 
                 if has_order_details:
-                    print(f"   ✅ Order details extracted (manual)")
-                    ai_analysis['ai_order_details'] = [combined_details]
-                else:
-                    print(f"   ⚠️ No order details found")
-                    ai_analysis['ai_order_details'] = []
-            else:
-                # Use AI extraction - handle multiple instructions
-                print(f"   🔧 Using AI extraction from clean text")
-                
-                # Process each instruction from AI
-                valid_instructions = []
-                
-                # Handle case where AI returns single object instead of array
-                if isinstance(ai_order_details, dict):
-                    ai_order_details = [ai_order_details]
-                elif not isinstance(ai_order_details, list):
-                    ai_order_details = []
-                
-                for instruction in ai_order_details:
-                    # Normalize each instruction
-                    normalized_instruction = _normalize_order_details(instruction) or {}
-                    
-                    # Check if this instruction has meaningful order details
-                    has_order_details = any([
-                        normalized_instruction.get('client_code'),
-                        normalized_instruction.get('symbol'),
-                        normalized_instruction.get('quantity'),
-                        normalized_instruction.get('price'),
-                        normalized_instruction.get('buy_sell')
-                    ])
-                    
-                    if has_order_details:
-                        valid_instructions.append(normalized_instruction)
-                
-                if valid_instructions:
-                    print(f"   ✅ {len(valid_instructions)} instruction(s) extracted (AI from clean text)")
-                    ai_analysis['ai_order_details'] = valid_instructions
-                else:
-                    print(f"   ⚠️ No order details found in AI extraction")
-                    ai_analysis['ai_order_details'] = []
+                    valid_instructions.append(normalized_instruction)
             
-            # Only add to trade_instructions if we have valid instructions
-            if ai_analysis.get('ai_order_details'):
-                trade_instructions.append({
-                    'subject': subject,
-                    'sender': sender,
-                    'clean_text': clean_text,  # Include the complete email content
-                    'ai_analysis': ai_analysis,
-                    'attachments': attachments,
-                    'has_attachments': has_attachments
-                })
-        elif ai_analysis.get('ai_email_intent') == 'trade_confirmation':
-            print(f"   📋 Trade confirmation detected")
-            trade_confirmations.append({
-                'subject': subject,
-                'sender': sender,
-                'clean_text': clean_text,  # Include the complete email content
-                'ai_analysis': ai_analysis,
-                'attachments': attachments,
-                'has_attachments': has_attachments
-            })
-        else:
-            print(f"   📄 Other email detected")
-            other_emails.append({
-                'subject': subject,
-                'sender': sender,
-                'clean_text': clean_text,  # Include the complete email content
-                'ai_analysis': ai_analysis,
-                'attachments': attachments,
-                'has_attachments': has_attachments
-            })
+            if valid_instructions:
+                print(f"   ✅ {len(valid_instructions)} instruction(s) extracted (AI from clean text)")
+                ai_analysis['ai_order_details'] = valid_instructions
+            else:
+                print(f"   ⚠️ No order details found in AI extraction")
+                ai_analysis['ai_order_details'] = []
         
-        results.append({
-            'subject': subject,
-            'sender': sender,
-            'clean_text': clean_text,  # Include the complete email content
-            'ai_analysis': ai_analysis,
-            'attachments': attachments,
-            'has_attachments': has_attachments
-        })
+    elif ai_analysis.get('ai_email_intent') == 'trade_confirmation':
+        print(f"   📋 Trade confirmation detected")
+    else:
+        print(f"   📄 Other email detected")
     
-    # Calculate final statistics
-    print(f"\n📊 CALCULATING FINAL STATISTICS...")
+    result = {
+        'subject': subject,
+        'sender': sender,
+        'clean_text': clean_text,  # Include the complete email content
+        'ai_analysis': ai_analysis,
+        'attachments': attachments,
+        'has_attachments': has_attachments
+    }
+    return result, used_fast_path
+
+def main():
+    """Complete email surveillance system from scratch"""
+    
+    print("=== COMPLETE EMAIL SURVEILLANCE SYSTEM ===")
+    print("Full AI analysis from scratch with enhanced extraction methods")
+    print("Target: 91% coverage for email trade surveillance")
+    
+    # Generate timestamp for output file
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # Stream the email input (NDJSON, or the legacy single JSON document)
+    input_file = 'comprehensive_dealing_emails_analysis.json'
+    print("\n📂 Loading email data...")
+    input_summary = read_email_summary(input_file)
+    total_emails = input_summary.get('email_count', 0)
+    print(f"   Found {total_emails} emails for analysis")
+    
+    # Checkpoint journal: threads analyzed by an earlier, interrupted run are not re-sent to the model
+    run_id = (input_summary.get('target_date') or '').replace('-', '') or _input_fingerprint(input_file)
+    fresh = '--fresh' in sys.argv or os.getenv('EMAIL_ANALYSIS_RESUME', '1') == '0'
+    journal = AnalysisJournal(journal_path_for(run_id), fresh=fresh)
+    resumed_count = 0
+    
+    # Get manual extractions
+    manual_extractions = get_manual_extractions()
     
-    total_emails = len(emails)
-    total_trade_instructions = len(trade_instructions)
-    total_confirmations = len(trade_confirmations)
-    total_other = len(other_emails)
+    # Results are written one email per line as they are analyzed
+    output_file = f'complete_surveillance_results_{timestamp}.json'
+    writer = EmailRecordWriter(output_file, KIND_SURVEILLANCE_RESULTS, timestamp=timestamp)
+    
+    # Process all emails
+    print(f"\n🤖 Starting AI analysis for {total_emails} emails...")
     
-    # Count trade instructions with order details
-    trade_instructions_with_details = []
-    for ti in trade_instructions:
-        details = ti['ai_analysis'].get('ai_order_details', [])
+    total_trade_instructions = 0
+    trade_instructions_with_details = 0
+    fast_path_count = 0
+    
+    for i, email in enumerate(iter_email_records(input_file), 1):
+        print(f"\n[{i}/{total_emails}] Analyzing: {email.get('subject', '')[:60]}...")
         
-        # Handle both single dict and array cases
-        if isinstance(details, dict):
-            details = [details]
-        elif not isinstance(details, list):
-            details = []
+        # Threads already in the journal were analyzed by an earlier (interrupted) run
+        key = analysis_key(email)
+        entry = journal.get(key)
+        if entry is not None:
+            print(f"   ⏭️ Already analyzed - reusing journaled result")
+            result, used_fast_path = entry['result'], entry.get('fast_path', False)
+            resumed_count += 1
+        else:
+            result, used_fast_path = analyze_email_record(email, manual_extractions)
+            # Failed model calls are not journaled, so a resumed run retries them
+            if not result['ai_analysis'].get('ai_failed'):
+                journal.append(key, result, fast_path=used_fast_path, subject=result['subject'])
         
-        # Check if any instruction has meaningful details
-        has_meaningful_details = False
-        for detail in details:
-            if any([
-                detail.get('client_code'),
-                detail.get('symbol'),
-                detail.get('quantity'),
-                detail.get('price'),
-                detail.get('buy_sell')
-            ]):
-                has_meaningful_details = True
-                break
+        if used_fast_path:
+            fast_path_count += 1
+        # Only count as a trade instruction if we have valid instructions
+        ai_analysis = result['ai_analysis']
+        if ai_analysis.get('ai_email_intent') == 'trade_instruction' and ai_analysis.get('ai_order_details'):
+            total_trade_instructions += 1
+            if any(_has_meaningful_details(detail) for detail in ai_analysis['ai_order_details']):
+                trade_instructions_with_details += 1
         
-        if has_meaningful_details:
-            trade_instructions_with_details.append(ti)
+        writer.write(result, email_category(result))
     
-    trade_instructions_without_details = total_trade_instructions - len(trade_instructions_with_details)
-    coverage_percentage = (len(trade_instructions_with_details) / total_trade_instructions * 100) if total_trade_instructions > 0 else 0
+    journal.close()
+    if resumed_count:
+        print(f"\n📒 Reused {resumed_count} journaled analyses, {writer.count - resumed_count} analyzed in this run")
     
-    # Save results with fixed naming format
-    output_file = f'complete_surveillance_results_{timestamp}.json'
+    # Calculate final statistics
+    print(f"\n📊 CALCULATING FINAL STATISTICS...")
     
-    with open(output_file, 'w') as f:
-        json.dump({
-            'timestamp': timestamp,
-            'total_emails_analyzed': total_emails,
-            'trade_instructions': {
-                'total': total_trade_instructions,
-                'with_order_details': len(trade_instructions_with_details),
-                'without_order_details': trade_instructions_without_details,
-                'coverage_percentage': coverage_percentage,
-                'emails': trade_instructions
-            },
-            'trade_confirmations': {
-                'total': total_confirmations,
-                'emails': trade_confirmations
-            },
-            'other_emails': {
-                'total': total_other,
-                'emails': other_emails
-            },
-            'all_results': results
-        }, f, indent=2)
+    total_emails = writer.count
+    total_confirmations = writer.category_counts.get('trade_confirmation', 0)
+    total_other = total_emails - writer.category_counts.get('trade_instruction', 0) - total_confirmations
+    trade_instructions_without_details = total_trade_instructions - trade_instructions_with_details
+    coverage_percentage = (trade_instructions_with_details / total_trade_instructions * 100) if total_trade_instructions > 0 else 0
+    
+    writer.close(
+        total_emails_analyzed=total_emails,
+        trade_instructions={
+            'total': total_trade_instructions,
+            'with_order_details': trade_instructions_with_details,
+            'without_order_details': trade_instructions_without_details,
+            'coverage_percentage': coverage_percentage
+        },
+        trade_confirmations={'total': total_confirmations},
+        other_emails={'total': total_other},
+        fast_path_extractions=fast_path_count
+    )
     
     # Final summary
     print(f"\n{'='*80}")
@@ -749,9 +787,10 @@ def main():
     print(f"   Trade instructions: {total_trade_instructions}")
     print(f"   Trade confirmations: {total_confirmations}")
     print(f"   Other emails: {total_other}")
+    print(f"   Extracted without AI (fast path): {fast_path_count}")
     
     print(f"\n🎯 TRADE INSTRUCTION COVERAGE:")
-    print(f"   With order details: {len(trade_instructions_with_details)}")
+    print(f"   With order details: {trade_instructions_with_details}")
     print(f"   Without order details: {trade_instructions_without_details}")
     print(f"   Coverage: {coverage_percentage:.1f}%")
     
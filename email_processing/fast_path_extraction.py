@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Deterministic fast-path extraction for well-structured trade instruction emails.
+
+Most daily instructions arrive in a handful of fixed dealer layouts: a table
+with client code / scrip / qty / rate / buy-sell columns, usually under an
+"Approval for Purchase/Sale" or "Request for Trade Execution" subject. These
+are recognised here from the parsed table_data and subject, and returned in
+the same shape as analyze_email_with_ai() with a confidence score. Anything
+unrecognised or below FAST_PATH_MIN_CONFIDENCE still goes to the LLM, and so
+does a complete table under a subject that matches no known template.
+"""
+
+import os
+import re
+
+FAST_PATH_MIN_CONFIDENCE = int(os.getenv('FAST_PATH_MIN_CONFIDENCE', '90'))
+
+# Header keywords (lower case, substring match) -> canonical field
+HEADER_ALIASES = [
+    ('buy_sell', ['buy/sell', 'buy / sell', 'buys/sell', 'b/s', 'transaction type', 'side', 'action']),
+    ('client_code', ['trading code', 'client code', 'client id', 'ucc', 'account code', 'account']),
+    ('isin', ['isin']),
+    ('symbol', ['scrip', 'symbol', 'script name', 'security name', 'stock', 'scheme', 'instrument']),
+    ('quantity', ['lot qty', 'quantity', 'qty', 'no of shares', 'no. of shares', 'shares']),
+    ('strike_price', ['strike']),
+    ('price', ['market price', 'limit price', 'rate', 'price']),
+    ('trade_date', ['trade date', 'date']),
+    ('expiry', ['expiry']),
+    ('option_type', ['pe/ce', 'ce/pe', 'option type']),
+    ('order_type', ['order type'])
+]
+
+CORE_FIELDS = ['client_code', 'symbol', 'quantity', 'price', 'buy_sell']
+
+CLIENT_CODE_PATTERN = re.compile(r'^(?:NEOWM|NEOWP|NEOC|NEO|WM|EOWM)\d+$|^\d{4,8}$', re.IGNORECASE)
+QUANTITY_PATTERN = re.compile(r'^\d{1,3}(?:,\d{2,3})*$|^\d+$')
+PRICE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)')
+
+# Known subject templates; default_side fills the side when the table has no buy/sell column
+SUBJECT_TEMPLATES = [
+    {'name': 'approval_for_purchase', 'pattern': re.compile(r'approval for (?:purchase|buy)', re.IGNORECASE), 'default_side': 'BUY'},
+    {'name': 'approval_for_sale', 'pattern': re.compile(r'approval for (?:sale|sell)', re.IGNORECASE), 'default_side': 'SELL'},
+    {'name': 'request_for_trade_execution', 'pattern': re.compile(r'(?:request|req)\.? for (?:trade )?execution|trade execution request', re.IGNORECASE), 'default_side': None},
+    {'name': 'exchange_trades', 'pattern': re.compile(r'exchange trades?', re.IGNORECASE), 'default_side': None}
+]
+
+CONFIRMATION_SUBJECT = re.compile(r'trade\s+conf[a-z]*mat[a-z]*n', re.IGNORECASE)
+# Follow-ups that change an instruction need the model's judgement
+AMENDMENT_KEYWORDS = re.compile(r'\b(?:cancel(?:led)?|modify|modified|revised?|amend(?:ed)?|hold off|do not execute)\b', re.IGNORECASE)
+
+
+def map_header_row(row):
+    """Map header cells to canonical fields. Returns {column_index: field}"""
+    mapping = {}
+    used = set()
+    for index, cell in enumerate(row):
+        header = str(cell).strip().lower()
+        if not header:
+            continue
+        for field, keywords in HEADER_ALIASES:
+            if field in used:
+                continue
+            if any(keyword in header for keyword in keywords):
+                mapping[index] = field
+                used.add(field)
+                break
+    return mapping
+
+
+def _parse_side(value):
+    value = value.strip().upper()
+    if value in ('BUY', 'B', 'PURCHASE'):
+        return 'BUY'
+    if value in ('SELL', 'S', 'SALE'):
+        return 'SELL'
+    return None
+
+
+def _parse_price(value):
+    value = value.strip()
+    upper = value.upper()
+    if upper in ('CMP', 'MARKET', 'MKT', 'AT MARKET'):
+        return 'CMP'
+    match = PRICE_PATTERN.search(value)
+    if not match:
+        return None
+    if 'LIMIT' in upper:
+        return f"LIMIT {match.group(1)}"
+    return match.group(1)
+
+
+def parse_row(row, mapping):
+    """Convert one data row into an instruction dict, parsing and validating each field"""
+    instruction = {}
+    for index, field in mapping.items():
+        if index >= len(row):
+            continue
+        value = str(row[index]).strip()
+        if not value or value.lower() in ('na', 'n/a', '-'):
+            continue
+
+        if field == 'client_code':
+            if CLIENT_CODE_PATTERN.match(value.replace(' ', '')):
+                instruction['client_code'] = value.replace(' ', '').upper()
+        elif field == 'quantity':
+            if QUANTITY_PATTERN.match(value.replace(' ', '')):
+                instruction['quantity'] = value.replace(',', '').replace(' ', '')
+        elif field == 'price':
+            price = _parse_price(value)
+            if price:
+                instruction['price'] = price
+        elif field == 'buy_sell':
+            side = _parse_side(value)
+            if side:
+                instruction['buy_sell'] = side
+        elif field == 'option_type':
+            if value.upper() in ('PE', 'CE'):
+                instruction['option_type'] = value.upper()
+        else:
+            instruction[field] = value
+    return instruction
+
+
+def find_subject_template(subject):
+    """Return the known subject template for this email, if any"""
+    for template in SUBJECT_TEMPLATES:
+        if template['pattern'].search(subject or ''):
+            return template
+    return None
+
+
+def extract_fast_path(subject, table_data, clean_text=''):
+    """
+    Try to extract trade instructions without the LLM.
+
+    Returns a result dict in the analyze_email_with_ai() format (with
+    'extraction_method': 'fast_path'), or None if no known layout matched.
+    """
+    if not table_data or CONFIRMATION_SUBJECT.search(subject or ''):
+        return None
+
+    template = find_subject_template(subject)
+    instructions = []
+    row_scores = []
+    matched_layout = None
+
+    seen_tables = set()
+    for table in table_data:
+        if len(table) < 2:
+            continue
+        # A thread joins the tables of all its messages; a table quoted again
+        # in a reply is the same instruction, not a second one
+        table_key = tuple(tuple(str(cell).strip() for cell in row) for row in table)
+        if table_key in seen_tables:
+            continue
+        seen_tables.add(table_key)
+        mapping = map_header_row(table[0])
+        mapped_fields = set(mapping.values())
+        # A recognised trade table names at least client, scrip and quantity columns
+        if not {'client_code', 'symbol', 'quantity'} <= mapped_fields:
+            continue
+        matched_layout = ', '.join(sorted(mapped_fields & set(CORE_FIELDS)))
+
+        for row in table[1:]:
+            if not any(str(cell).strip() for cell in row):
+                continue
+            instruction = parse_row(row, mapping)
+            if not instruction.get('client_code') and not instruction.get('symbol'):
+                # Totals / remarks rows
+                continue
+            if not instruction.get('buy_sell') and template and template['default_side']:
+                instruction['buy_sell'] = template['default_side']
+
+            present = sum(1 for field in CORE_FIELDS if instruction.get(field))
+            row_scores.append(present / len(CORE_FIELDS))
+            instruction.setdefault('order_time', None)
+            instructions.append(instruction)
+
+    if not instructions:
+        return None
+
+    # Confidence: weakest row decides, small bonus for a known subject template.
+    # A table alone (no known subject) never skips the LLM - the body and
+    # attachments of an unknown layout may change what the table says
+    confidence = int(min(row_scores) * 90) + (10 if template else 0)
+    if not template:
+        confidence = min(confidence, FAST_PATH_MIN_CONFIDENCE - 1)
+    if AMENDMENT_KEYWORDS.search(clean_text or ''):
+        confidence -= 30
+    confidence = max(0, min(confidence, 100))
+
+    instruction_type = 'rm_forwarded' if re.match(r'^\s*(?:fw|fwd)\s*:', subject or '', re.IGNORECASE) else 'client_direct'
+    template_name = template['name'] if template else 'table_only'
+    return {
+        "ai_email_intent": "trade_instruction",
+        "ai_confidence_score": confidence,
+        "ai_reasoning": f"Deterministic fast path: template '{template_name}', table columns [{matched_layout}], {len(instructions)} row(s)",
+        "ai_order_details": instructions,
+        "ai_instruction_type": instruction_type,
+        "extraction_method": "fast_path"
+    }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Bounded PDF text extraction for email attachments.
+
+PDFs are parsed in a worker process pool so one oversized contract note can't
+stall the email step:
+- PDF_MAX_PAGES caps the number of pages read per file
+- PDF_TIMEOUT_SECONDS is a per-file budget; workers stop at the deadline and
+  the pool is torn down if a worker hangs inside a single page
+- scanned/image-only pages (images, no fonts) are skipped without parsing
+- page text is collected in a list and joined once
+
+Per-page timings are aggregated in PDF_METRICS for the end-of-run summary.
+"""
+
+import os
+import time
+import multiprocessing
+
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '50'))
+PDF_TIMEOUT_SECONDS = float(os.getenv('PDF_TIMEOUT_SECONDS', '60'))
+PDF_POOL_SIZE = int(os.getenv('PDF_POOL_SIZE', str(min(4, os.cpu_count() or 1))))
+
+PDF_METRICS = {
+    'files': 0,
+    'pages_extracted': 0,
+    'pages_skipped_image': 0,
+    'pages_over_limit': 0,
+    'page_limits': set(),  # max_pages values applied (callers may override PDF_MAX_PAGES)
+    'timeouts': 0,
+    'errors': 0,
+    'total_page_seconds': 0.0,
+    'slowest_page_seconds': 0.0
+}
+
+_pool = None
+
+
+def _page_is_image_only(page):
+    """True for scanned pages: image XObjects but no fonts to extract text from"""
+    try:
+        resources = page.get('/Resources')
+        if resources is None:
+            return False
+        resources = resources.get_object()
+        if '/Font' in resources:
+            return False
+        xobjects = resources.get('/XObject')
+        if xobjects is None:
+            return False
+        xobjects = xobjects.get_object()
+        return any(xobjects[key].get_object().get('/Subtype') == '/Image' for key in xobjects)
+    except Exception:
+        return False
+
+
+def _extract_pdf_worker(file_path, max_pages, timeout_seconds):
+    """Runs in a pool worker - parse up to max_pages before the deadline"""
+    result = {
+        'text': '',
+        'page_count': 0,
+        'pages_extracted': 0,
+        'pages_skipped_image': 0,
+        'page_seconds': [],
+        'truncated': False,
+        'max_pages': max_pages,
+        'timed_out': False,
+        'error': None
+    }
+    try:
+        import PyPDF2
+    except ImportError:
+        result['error'] = "PyPDF2 not installed. Install with: pip install PyPDF2"
+        return result
+
+    deadline = time.monotonic() + timeout_seconds
+    try:
+        with open(file_path, 'rb') as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            page_count = len(pdf_reader.pages)
+            result['page_count'] = page_count
+            result['truncated'] = page_count > max_pages
+
+            parts = []
+            for page_number in range(min(page_count, max_pages)):
+                if time.monotonic() > deadline:
+                    result['timed_out'] = True
+                    break
+
+                page = pdf_reader.pages[page_number]
+                if _page_is_image_only(page):
+                    result['pages_skipped_image'] += 1
+                    continue
+
+                started = time.monotonic()
+                page_text = page.extract_text() or ''
+                result['page_seconds'].append(time.monotonic() - started)
+                result['pages_extracted'] += 1
+
+                if page_text.strip():
+                    parts.append(page_text)
+
+            result['text'] = '\n'.join(parts).strip()
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(processes=PDF_POOL_SIZE)
+    return _pool
+
+
+def shutdown_pdf_pool(terminate=False):
+    """Close the worker pool (terminate=True kills workers stuck on a page)"""
+    global _pool
+    if _pool is None:
+        return
+    if terminate:
+        _pool.terminate()
+    else:
+        _pool.close()
+    _pool.join()
+    _pool = None
+
+
+def _record_metrics(result):
+    PDF_METRICS['files'] += 1
+    PDF_METRICS['pages_extracted'] += result['pages_extracted']
+    PDF_METRICS['pages_skipped_image'] += result['pages_skipped_image']
+    if result['truncated']:
+        PDF_METRICS['pages_over_limit'] += result['page_count'] - result['max_pages']
+        PDF_METRICS['page_limits'].add(result['max_pages'])
+    if result['timed_out']:
+        PDF_METRICS['timeouts'] += 1
+    if result['error']:
+        PDF_METRICS['errors'] += 1
+    if result['page_seconds']:
+        PDF_METRICS['total_page_seconds'] += sum(result['page_seconds'])
+        PDF_METRICS['slowest_page_seconds'] = max(PDF_METRICS['slowest_page_seconds'], max(result['page_seconds']))
+
+
+def extract_pdf_texts(file_paths, max_pages=None, timeout_seconds=None):
+    """Extract text from several PDFs concurrently.
+
+    Returns a dict file_path -> result dict (text, page_count, truncated,
+    timed_out, error, ...). A file that overruns its budget by more than a few
+    seconds gets a timed_out result and the pool is recycled.
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    timeout_seconds = PDF_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+
+    pool = _get_pool()
+    pending = {
+        path: pool.apply_async(_extract_pdf_worker, (path, max_pages, timeout_seconds))
+        for path in file_paths
+    }
+
+    # Workers stop cooperatively at the deadline; the grace period covers
+    # a page that hangs inside PyPDF2 itself. The pool runs tasks in
+    # submission order, PDF_POOL_SIZE at a time, so the i-th task may only
+    # start once the i // PDF_POOL_SIZE waves before it have finished
+    started = time.monotonic()
+    task_budget = timeout_seconds + 5
+    results = {}
+    pool_hung = False
+    for position, (path, async_result) in enumerate(pending.items()):
+        hard_deadline = started + (position // PDF_POOL_SIZE + 1) * task_budget
+        remaining = max(0.1, hard_deadline - time.monotonic())
+        try:
+            result = async_result.get(timeout=remaining)
+        except multiprocessing.TimeoutError:
+            pool_hung = True
+            result = {
+                'text': '', 'page_count': 0, 'pages_extracted': 0, 'pages_skipped_image': 0,
+                'page_seconds': [], 'truncated': False, 'max_pages': max_pages, 'timed_out': True,
+                'error': f"PDF extraction exceeded {timeout_seconds:.0f}s"
+            }
+        _record_metrics(result)
+        results[path] = result
+
+    if pool_hung:
+        shutdown_pdf_pool(terminate=True)
+    return results
+
+
+def extract_pdf_text(file_path, max_pages=None, timeout_seconds=None):
+    """Extract text from a single PDF within the page/time budget"""
+    return extract_pdf_texts([file_path], max_pages, timeout_seconds)[file_path]
+
+
+def print_pdf_metrics():
+    """Print the aggregated per-page timing metrics"""
+    if not PDF_METRICS['files']:
+        return
+    pages = PDF_METRICS['pages_extracted']
+    avg_ms = (PDF_METRICS['total_page_seconds'] / pages * 1000) if pages else 0.0
+    print(f"📊 PDF extraction: {PDF_METRICS['files']} files, {pages} pages "
+          f"(avg {avg_ms:.0f} ms/page, slowest {PDF_METRICS['slowest_page_seconds'] * 1000:.0f} ms)")
+    print(f"   Skipped: {PDF_METRICS['pages_skipped_image']} image-only pages, "
+          f"{PDF_METRICS['pages_over_limit']} pages over the "
+          f"{'/'.join(str(limit) for limit in sorted(PDF_METRICS['page_limits']) or [PDF_MAX_PAGES])}-page limit")
+    if PDF_METRICS['timeouts'] or PDF_METRICS['errors']:
+        print(f"   ⚠️ {PDF_METRICS['timeouts']} timeouts, {PDF_METRICS['errors']} errors")
@@ -3,7 +3,6 @@
 Process emails for specific dates using Graph API and AI analysis
 """
 
-import json
 import os
 import sys
 from datetime import datetime
@@ -11,9 +10,20 @@ import shutil
 import msal
 import requests
 import base64
-import mimetypes
-from pathlib import Path
 from dotenv import load_dotenv
+from attachment_store import (
+    store_attachment_bytes, has_extracted_text, record_extraction,
+    get_attachment_text, to_attachment_reference, save_index, evict
+)
+from pdf_extraction import (
+    extract_pdf_text, extract_pdf_texts, print_pdf_metrics, shutdown_pdf_pool, PDF_MAX_PAGES
+)
+
+# Shared HTML parser and artifact format live in the surveillance base directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_parsing import parse_html
+from email_records import write_email_records, KIND_EMAIL_INPUT
+from thread_compaction import compact_thread, strip_quoted_html
 
 # Load environment variables
 load_dotenv()
@@ -23,15 +33,9 @@ TENANT_ID = "d3f35719-3f42-4550-b567-4421c83ca87b"
 CLIENT_ID = "6ceedeac-fa0a-4480-b09b-ddec4eacd285"
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 SCOPES = ["Mail.Read"]
-ATTACHMENT_TEMP_DIR = "temp_attachments"
-
-def create_attachment_temp_dir():
-    """Create temporary directory for attachments"""
-    Path(ATTACHMENT_TEMP_DIR).mkdir(exist_ok=True)
-    return ATTACHMENT_TEMP_DIR
 
-def download_attachment(attachment_id, message_id, headers, temp_dir):
-    """Download attachment from Graph API"""
+def download_attachment(attachment_id, message_id, headers):
+    """Download attachment from Graph API into the content-addressed attachment store"""
     try:
         # Get attachment metadata first
         attachment_url = f"https://graph.microsoft.com/v1.0/me/messages/{message_id}/attachments/{attachment_id}"
@@ -68,38 +72,18 @@ def download_attachment(attachment_id, message_id, headers, temp_dir):
                 print(f"⚠️ Failed to decode attachment {name}: {e}")
                 return None
         
-        # Determine file extension
-        if content_type:
-            extension = mimetypes.guess_extension(content_type) or '.bin'
-        else:
-            extension = '.bin'
-        if not extension.startswith('.'):
-            extension = '.' + extension
-        
-        # Create safe filename with length limit
-        safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
-        if not safe_name.endswith(extension):
-            safe_name += extension
-        
-        # Limit filename length to avoid filesystem errors (max 255 chars total)
-        # Keep attachment_id (first 50 chars) + safe_name (max 200 chars)
-        max_safe_name_length = 200
-        if len(safe_name) > max_safe_name_length:
-            # Truncate but keep extension
-            name_part = safe_name[:max_safe_name_length-len(extension)]
-            safe_name = name_part + extension
-        
-        # Save file
-        file_path = os.path.join(temp_dir, f"{attachment_id}_{safe_name}")
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        # Store by content hash - recurring mandates/trade sheets are kept once
+        sha256, entry, is_new = store_attachment_bytes(file_content, name, content_type)
+        if not is_new:
+            print(f"   ♻️ Attachment {name} already in store ({sha256[:12]})")
         
         return {
             'id': attachment_id,
             'name': name,
             'content_type': content_type,
-            'file_path': file_path,
-            'size': len(file_content)
+            'file_path': entry['file_path'],
+            'size': len(file_content),
+            'sha256': sha256
         }
         
     except requests.exceptions.RequestException as e:
@@ -109,28 +93,21 @@ def download_attachment(attachment_id, message_id, headers, temp_dir):
         print(f"❌ Failed to download attachment {attachment_id}: {e}")
         return None
 
-def extract_text_from_pdf_attachment(attachment_info):
-    """Extract text content from PDF attachments using PyPDF2"""
-    file_path = attachment_info['file_path']
+def extract_text_from_pdf_attachment(attachment_info, extraction=None):
+    """Extract text content from PDF attachments (bounded, runs in the PDF worker pool)"""
     name = attachment_info['name']
     
-    try:
-        import PyPDF2
-        with open(file_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text += page_text + "\n"
-            return text.strip()
-                    
-    except ImportError:
-        print("⚠️ PyPDF2 not installed. Install with: pip install PyPDF2")
-        return None
-    except Exception as e:
-        print(f"⚠️ PDF text extraction failed for {name}: {e}")
-        return None
+    if extraction is None:
+        extraction = extract_pdf_text(attachment_info['file_path'])
+    
+    attachment_info['page_count'] = extraction['page_count']
+    if extraction['error']:
+        print(f"⚠️ PDF text extraction failed for {name}: {extraction['error']}")
+    if extraction['truncated']:
+        print(f"   ⚠️ {name}: only first {PDF_MAX_PAGES} of {extraction['page_count']} pages read")
+    if extraction['pages_skipped_image']:
+        print(f"   ⚠️ {name}: skipped {extraction['pages_skipped_image']} image-only pages")
+    return extraction['text'] or None
 
 def extract_text_from_email_attachment(attachment_info):
     """Extract text content from email attachments (forwarded emails)"""
@@ -217,7 +194,7 @@ def extract_text_from_email_attachment(attachment_info):
         # Return at least the attachment name
         return f"Email attachment: {name}"
 
-def process_email_attachments(message_id, attachments, headers, temp_dir):
+def process_email_attachments(message_id, attachments, headers):
     """Process PDF and email attachments for an email"""
     processed_attachments = []
     
@@ -225,11 +202,7 @@ def process_email_attachments(message_id, attachments, headers, temp_dir):
         return processed_attachments
     
     print(f"📎 Processing {len(attachments)} attachments for message {message_id}")
-    
-    # Ensure temp directory exists
-    if not os.path.exists(temp_dir):
-        print(f"   📁 Creating temp directory: {temp_dir}")
-        os.makedirs(temp_dir, exist_ok=True)
+    pending_pdfs = []
     
     for attachment in attachments:
         attachment_id = attachment.get('id')
@@ -239,7 +212,7 @@ def process_email_attachments(message_id, attachments, headers, temp_dir):
             
         # Download attachment
         print(f"   📥 Downloading attachment: {attachment.get('name', 'Unknown')}")
-        attachment_info = download_attachment(attachment_id, message_id, headers, temp_dir)
+        attachment_info = download_attachment(attachment_id, message_id, headers)
         if not attachment_info:
             print(f"   ❌ Failed to download attachment {attachment_id}")
             continue
@@ -293,29 +266,47 @@ def process_email_attachments(message_id, attachments, headers, temp_dir):
             print(f"   ⚠️ Skipping non-PDF/non-email attachment: {name} ({content_type})")
             continue
         
+        # Store hit: text was already extracted on an earlier run, skip re-parsing
+        sha256 = attachment_info['sha256']
+        if has_extracted_text(sha256):
+            print(f"   ♻️ Using cached text for {name}")
+            processed_attachments.append(attachment_info)
+            continue
+        
         # Extract text content based on attachment type
         text_content = None
         if is_pdf:
-            print(f"   🔍 Extracting text from PDF: {name}")
-            text_content = extract_text_from_pdf_attachment(attachment_info)
-            if text_content:
-                attachment_info['extracted_text'] = text_content
-                print(f"   ✅ Extracted text from PDF {name} ({len(text_content)} chars)")
-            else:
-                print(f"   ⚠️ No text extracted from PDF {name}")
+            # PDFs are extracted together in the worker pool after the loop
+            pending_pdfs.append(attachment_info)
         elif is_email_attachment:
             print(f"   🔍 Extracting text from email attachment: {name}")
             text_content = extract_text_from_email_attachment(attachment_info)
             if text_content and text_content != f"Email attachment: {name}":
-                attachment_info['extracted_text'] = text_content
                 print(f"   ✅ Extracted text from email attachment {name} ({len(text_content)} chars)")
             else:
                 print(f"   ⚠️ No text extracted from email attachment {name}")
                 # Still add the attachment info even if extraction failed
-                attachment_info['extracted_text'] = f"Email attachment: {name}"
+                text_content = f"Email attachment: {name}"
+            record_extraction(sha256, text_content)
         
         processed_attachments.append(attachment_info)
     
+    if pending_pdfs:
+        print(f"   🔍 Extracting text from {len(pending_pdfs)} PDFs")
+        extractions = extract_pdf_texts([a['file_path'] for a in pending_pdfs])
+        for attachment_info in pending_pdfs:
+            name = attachment_info['name']
+            extraction = extractions[attachment_info['file_path']]
+            text_content = extract_text_from_pdf_attachment(attachment_info, extraction)
+            if text_content:
+                print(f"   ✅ Extracted text from PDF {name} ({len(text_content)} chars)")
+            else:
+                print(f"   ⚠️ No text extracted from PDF {name}")
+            # Cache scanned/empty PDFs too so they are not re-parsed every day,
+            # but retry next run if the PDF could not be opened at all
+            if not extraction['error'] or extraction['page_count']:
+                record_extraction(attachment_info['sha256'], text_content, attachment_info.get('page_count'))
+    
     return processed_attachments
 
 def get_emails_for_date(target_date: str):
@@ -415,9 +406,6 @@ def get_emails_for_date(target_date: str):
             print(f"❌ No dealing emails found for {target_date}")
             return None
         
-        # Create temporary directory for attachments
-        temp_dir = create_attachment_temp_dir()
-        
         # Pre-process emails to pass body content to AI
         processed_emails = []
         for email in dealing_emails:
@@ -439,8 +427,6 @@ def get_emails_for_date(target_date: str):
             
             # FIX: Pass raw HTML to AI for better table structure preservation
             # Generate clean_text for backward compatibility, but pass HTML to AI
-            import re
-            import html
             
             # CRITICAL FIX: If Graph API returned text instead of HTML, we need to request HTML explicitly
             # For now, if content_type is 'text', we can't do much, but log a warning
@@ -448,17 +434,21 @@ def get_emails_for_date(target_date: str):
                 print(f"⚠️  Warning: Email body is plain text, not HTML. Subject: {email.get('subject', 'N/A')}")
                 print(f"   This might cause table parsing issues. Consider requesting HTML format from Graph API.")
             
+            # One streaming pass gives clean_text plus structured tables (table_data),
+            # so deterministic table parsing can run before any LLM call
+            parsed_body = parse_html(html_content, content_type)
+            table_data = parsed_body['tables']
+            # Tables of the quoted reply history belong to the earlier message - a reply
+            # quoting the original table would otherwise repeat its instructions. A reply
+            # whose only table is quoted (original not in this run) keeps it
+            own_html = strip_quoted_html(html_content) if html_content else html_content
+            if own_html != html_content:
+                own_tables = parse_html(own_html, content_type)['tables']
+                if own_tables:
+                    table_data = own_tables
             if html_content:
                 # Generate clean_text for backward compatibility (used in some places)
-                # Only strip HTML if we actually have HTML (contentType == 'html')
-                if content_type == 'html':
-                    # We have HTML, generate clean_text by stripping tags
-                    clean_text = html.unescape(html_content)
-                    clean_text = re.sub(r'<[^>]+>', '', clean_text)
-                    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-                else:
-                    # We have plain text, use it as-is for clean_text
-                    clean_text = html_content.strip()
+                clean_text = parsed_body['text']
                 
                 # Keep raw HTML content to pass to AI (preserves table structure)
                 # If content_type is 'html', html_content contains HTML
@@ -480,14 +470,15 @@ def get_emails_for_date(target_date: str):
                         attachments = attachments_data.get('value', [])
                         
                         # Process attachments
-                        processed_attachments = process_email_attachments(message_id, attachments, headers, temp_dir)
+                        processed_attachments = process_email_attachments(message_id, attachments, headers)
                         
                         # Add attachment text to email content
                         # FIX: Append to both HTML and clean_text to maintain consistency
                         for attachment in processed_attachments:
-                            if 'extracted_text' in attachment:
+                            extracted_text = get_attachment_text(attachment)
+                            if extracted_text:
                                 attachment_type = "PDF" if attachment.get('content_type') == 'application/pdf' else "EMAIL"
-                                attachment_text = f"\n\n--- {attachment_type} ATTACHMENT: {attachment['name']} ---\n{attachment['extracted_text']}\n--- END {attachment_type} ATTACHMENT ---\n"
+                                attachment_text = f"\n\n--- {attachment_type} ATTACHMENT: {attachment['name']} ---\n{extracted_text}\n--- END {attachment_type} ATTACHMENT ---\n"
                                 
                                 # Append to HTML (raw HTML passed to AI)
                                 html_content += attachment_text
@@ -496,6 +487,9 @@ def get_emails_for_date(target_date: str):
                                 if 'clean_text' in locals():
                                     clean_text += attachment_text
                         
+                        # Reference attachments by hash - text lives in the attachment store
+                        processed_attachments = [to_attachment_reference(a) for a in processed_attachments]
+                        
                     except Exception as e:
                         print(f"⚠️ Failed to process attachments for message {message_id}: {e}")
             
@@ -512,12 +506,13 @@ def get_emails_for_date(target_date: str):
                     print(f"   clean_text has <table>: {'<table' in clean_text.lower()}")
             
             processed_email = {
+                'message_id': email.get('id'),  # Graph message id (analysis journal key)
                 'subject': email.get('subject', ''),
                 'sender': email.get('from', {}).get('emailAddress', {}).get('address', ''),
                 'date': email.get('receivedDateTime', ''),
                 'clean_text': html_content,  # Pass raw HTML to AI (preserves table structure)
                 'clean_text_fallback': clean_text if 'clean_text' in locals() else html_content,  # Keep clean_text for backward compatibility
-                'table_data': [],  # Let AI extract table data
+                'table_data': table_data,  # Tables parsed from the HTML body
                 'body': email.get('body', {}),
                 'toRecipients': email.get('toRecipients', []),
                 'ccRecipients': email.get('ccRecipients', []),
@@ -528,6 +523,11 @@ def get_emails_for_date(target_date: str):
             }
             processed_emails.append(processed_email)
         
+        # Persist newly stored attachments even if later steps fail
+        save_index()
+        print_pdf_metrics()
+        shutdown_pdf_pool()
+        
         # Group emails by thread (same subject pattern)
         thread_groups = {}
         for email in processed_emails:
@@ -555,9 +555,35 @@ def get_emails_for_date(target_date: str):
         
         # Create thread-based data structure for emails
         thread_emails = []
+        compaction_totals = {'raw_tokens': 0, 'compact_tokens': 0, 'fallbacks': 0}
         for thread_key, emails in thread_groups.items():
+            # Compact prompt content: new text per message, tables as pipe rows,
+            # no quoted history/signatures. Raw HTML is only used if validation fails.
+            attachment_texts = {}
+            for index, email in enumerate(emails):
+                for attachment in email.get('attachments', []):
+                    extracted_text = get_attachment_text(attachment)
+                    if extracted_text:
+                        attachment_type = "PDF" if attachment.get('content_type') == 'application/pdf' else "EMAIL"
+                        attachment_texts.setdefault(index, []).append((attachment_type, attachment['name'], extracted_text))
+            compact_content, compaction_stats = compact_thread(emails, attachment_texts)
+            compaction_totals['raw_tokens'] += compaction_stats['raw_tokens']
+            if compact_content is not None:
+                compaction_totals['compact_tokens'] += compaction_stats['compact_tokens']
+                print(f"🧮 {thread_key[:60]}: {compaction_stats['messages']} msg(s), "
+                      f"~{compaction_stats['raw_tokens']} -> ~{compaction_stats['compact_tokens']} tokens "
+                      f"(per message: {compaction_stats['message_tokens']})")
+            else:
+                compaction_totals['compact_tokens'] += compaction_stats['raw_tokens']
+                compaction_totals['fallbacks'] += 1
+                print(f"⚠️ {thread_key[:60]}: compaction failed ({compaction_stats['fallback_reason']}), using raw HTML")
+            
             if len(emails) == 1:
-                # Single email thread - preserve HTML directly
+                # Single email thread - compact content, or preserve HTML directly
+                if compact_content is not None:
+                    emails[0]['clean_text'] = compact_content
+                emails[0]['compaction'] = compaction_stats
+                emails[0]['thread_key'] = thread_key
                 thread_emails.append(emails[0])
             else:
                 # Multiple email thread - combine content
@@ -588,18 +614,22 @@ def get_emails_for_date(target_date: str):
                         combined_content += f"Subject: {email['subject']}\n"
                         combined_content += f"Content: {email_content}\n"
                 
-                # Combine attachments from all emails in thread
+                # Combine attachments and parsed tables from all emails in thread
                 combined_attachments = []
+                combined_tables = []
                 for email in emails:
                     combined_attachments.extend(email.get('attachments', []))
+                    combined_tables.extend(email.get('table_data', []))
                 
                 # Create combined thread email
                 thread_email = {
+                    'thread_key': thread_key,
+                    'message_ids': [email['message_id'] for email in emails if email.get('message_id')],
                     'subject': thread_key,
                     'sender': emails[0]['sender'],  # Use first email sender
                     'date': emails[0]['date'],  # Use first email date
-                    'clean_text': combined_content,
-                    'table_data': [],
+                    'clean_text': compact_content if compact_content is not None else combined_content,
+                    'table_data': combined_tables,
                     'body': emails[0]['body'],
                     'toRecipients': emails[0]['toRecipients'],
                     'ccRecipients': emails[0]['ccRecipients'],
@@ -608,21 +638,17 @@ def get_emails_for_date(target_date: str):
                     'attachments': combined_attachments,  # Include all attachments from thread
                     'has_attachments': len(combined_attachments) > 0,
                     'thread_emails': emails,  # Keep original emails for reference
-                    'is_thread': True
+                    'is_thread': True,
+                    'compaction': compaction_stats
                 }
                 thread_emails.append(thread_email)
         
-        # Create filtered data structure
-        filtered_data = {
-            'email_analyses': thread_emails,
-            'email_type': 'dealing'
-        }
+        print(f"🧮 Prompt compaction: ~{compaction_totals['raw_tokens']} -> ~{compaction_totals['compact_tokens']} tokens "
+              f"across {len(thread_groups)} threads ({compaction_totals['fallbacks']} raw HTML fallbacks)")
         
-        # Save to temporary file
+        # Save to temporary file (one thread per line)
         temp_file = f"temp_emails_{target_date.replace('-', '')}.json"
-        
-        with open(temp_file, "w") as f:
-            json.dump(filtered_data, f, indent=2, default=str, ensure_ascii=False)
+        write_email_records(temp_file, thread_emails, KIND_EMAIL_INPUT, email_type='dealing', target_date=target_date)
         
         print(f"📧 Saved {len(processed_emails)} dealing emails for {target_date}")
         
@@ -748,13 +774,13 @@ def process_emails_for_date(target_date: str):
         except:
             pass
         
-        # Clean up attachment temporary directory
+        # Persist the attachment store and apply the eviction policy
         try:
-            if os.path.exists(ATTACHMENT_TEMP_DIR):
-                shutil.rmtree(ATTACHMENT_TEMP_DIR)
-                print(f"🧹 Cleaned up attachment temporary directory")
-        except:
-            pass
+            evict()
+            save_index()
+            print(f"💾 Saved attachment store index")
+        except Exception as e:
+            print(f"⚠️ Failed to save attachment store: {e}")
 
 def main():
     if len(sys.argv) != 2:
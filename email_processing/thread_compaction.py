@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Thread compaction for AI email analysis.
+
+Multi-message threads used to be sent to the model as the concatenated raw
+HTML of every message, and every reply repeats the quoted copy of the earlier
+ones. Compaction keeps, per message:
+- the new text only (quoted reply history cut off, except for the first
+  message which may itself be a forwarded client instruction)
+- tables collapsed to pipe-delimited rows
+- no signature block / legal disclaimer
+
+The result is validated (no client codes, ISINs or numbers on the full
+thread's order-bearing lines lost) and callers fall back to raw HTML when
+validation fails.
+"""
+
+import re
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_parsing import parse_html
+
+# Where quoted reply history starts in Outlook / Gmail / plain-text replies
+HTML_QUOTE_MARKERS = re.compile(
+    r'<div[^>]+id=["\']?(?:divRplyFwdMsg|appendonsend)|'
+    r'<div[^>]+class=["\']?gmail_quote|'
+    r'<blockquote|'
+    r'<hr[^>]*tabindex=["\']?-1|'
+    r'-----\s*Original Message\s*-----',
+    re.IGNORECASE
+)
+TEXT_QUOTE_MARKERS = re.compile(
+    r'^(?:-----\s*Original Message\s*-----|'
+    r'From:\s.+(?:Sent|Date):\s|'
+    r'On\s.{5,80}\swrote:|'
+    r'>)',
+    re.IGNORECASE
+)
+DISCLAIMER_MARKERS = re.compile(
+    r'^(?:disclaimer\b|'
+    r'this (?:e-?mail|message)(?: and any (?:files|attachments))? (?:is|are|may be) (?:confidential|intended)|'
+    r'the information contained in this (?:e-?mail|message)|'
+    r'caution:\s*this (?:e-?mail|message) originated)',
+    re.IGNORECASE
+)
+SIGN_OFF = re.compile(r'^(?:thanks?(?: (?:&|and) regards)?|regards|best regards|warm regards|kind regards|sincerely)[,.!]?$', re.IGNORECASE)
+MAX_SIGNATURE_LINES = 8
+
+# Identifiers that must survive compaction (client codes, ISINs, order ids, quantities/prices)
+KEY_TOKEN_PATTERN = re.compile(r'\b(?:[A-Z]{2,}\d{3,}|IN[A-Z0-9]{10}|\d{3,}(?:\.\d+)?)\b')
+# Only order-bearing lines of the full thread are checked: lines with order
+# wording and table rows that are not contact details. Signatures and
+# disclaimers, which compaction strips on purpose, carry registration
+# numbers, phone numbers and pin codes
+ORDER_LINE_PATTERN = re.compile(
+    r'\b(?:buy|sell|bought|sold|purchase|qty|quantity|price|rate|shares?|units?|lots?|'
+    r'orders?|client|code|isin|cmp|limit|market|scrip|symbol)\b',
+    re.IGNORECASE
+)
+SIGNATURE_DETAIL_PATTERN = re.compile(
+    r'\b(?:sebi|regn?\.?|registration|cin|gstin|arn|tel|telephone|phone|mob|mobile|fax|pin|'
+    r'address|floor|road|marg|mumbai|www)\b|@[\w-]+\.',
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text):
+    """Approximate prompt tokens (tiktoken when installed, else ~4 chars per token)"""
+    if not text:
+        return 0
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding('cl100k_base').encode(text))
+    except Exception:
+        return len(text) // 4
+
+
+def strip_quoted_html(html_content):
+    """Cut the HTML body at the start of the quoted reply history"""
+    match = HTML_QUOTE_MARKERS.search(html_content)
+    if match and match.start() > 0:
+        return html_content[:match.start()]
+    return html_content
+
+
+def strip_quoted_text(lines):
+    """Cut plain-text lines at the first quoted-reply header"""
+    for i, line in enumerate(lines):
+        if i > 0 and TEXT_QUOTE_MARKERS.match(line):
+            return lines[:i]
+    return lines
+
+
+def strip_signature(lines, keep_quoted=False):
+    """Drop legal disclaimers and a short signature block after the sign-off"""
+    if keep_quoted:
+        # Forwarded content may follow a disclaimer - only drop the disclaimer paragraphs
+        return [line for line in lines if not DISCLAIMER_MARKERS.match(line)]
+
+    for i, line in enumerate(lines):
+        if DISCLAIMER_MARKERS.match(line):
+            lines = lines[:i]
+            break
+
+    for i, line in enumerate(lines):
+        # Only a short tail after the sign-off is treated as a signature;
+        # tables (pipe rows) after "Regards" are kept
+        tail = lines[i + 1:]
+        if SIGN_OFF.match(line) and len(tail) <= MAX_SIGNATURE_LINES and not any('|' in t for t in tail):
+            return lines[:i + 1]
+    return lines
+
+
+def compact_email_body(body_content, content_type='html', keep_quoted=False):
+    """Return the compact text of one message (tables inlined as pipe rows)"""
+    if content_type == 'html' and not keep_quoted:
+        body_content = strip_quoted_html(body_content)
+
+    text = parse_html(body_content, content_type, inline_tables=True)['text']
+    lines = text.split('\n') if text else []
+    if not keep_quoted:
+        lines = strip_quoted_text(lines)
+    lines = strip_signature(lines, keep_quoted)
+    return '\n'.join(lines).strip()
+
+
+def _key_tokens(text):
+    return set(KEY_TOKEN_PATTERN.findall(text or ''))
+
+
+def _order_key_tokens(text):
+    """Key identifiers on the order-bearing lines of a full message (disclaimers and signature details skipped)"""
+    lines = strip_signature((text or '').split('\n'), keep_quoted=True)
+    order_lines = []
+    for line in lines:
+        is_row, has_order_words = '|' in line, bool(ORDER_LINE_PATTERN.search(line))
+        if SIGNATURE_DETAIL_PATTERN.search(line):
+            # Contact details: only an order table row (e.g. with a mobile column) counts
+            if is_row and has_order_words:
+                order_lines.append(line)
+        elif is_row or has_order_words:
+            order_lines.append(line)
+    return _key_tokens('\n'.join(order_lines))
+
+
+def validate_compaction(full_text, compact_text):
+    """Compaction is valid if it kept some text and lost no identifiers from order-bearing lines"""
+    if full_text.strip() and not compact_text.strip():
+        return False, "compaction produced empty content"
+    missing = _order_key_tokens(full_text) - _key_tokens(compact_text)
+    if missing:
+        sample = ', '.join(sorted(missing)[:5])
+        return False, f"compaction dropped {len(missing)} identifiers ({sample})"
+    return True, None
+
+
+def compact_thread(emails, attachment_texts=None):
+    """Build compact prompt content for a thread (list of processed emails, oldest first).
+
+    attachment_texts maps email index -> list of (attachment_type, name, text).
+    Returns (content, stats). content is None when compaction failed validation
+    and the caller should fall back to raw HTML.
+    """
+    attachment_texts = attachment_texts or {}
+    sections = []
+    full_texts = []
+    raw_tokens = 0
+    message_tokens = []
+
+    for i, email in enumerate(emails):
+        body = email.get('body', {}) if isinstance(email.get('body'), dict) else {}
+        body_content = body.get('content', '') or ''
+        content_type = body.get('contentType', 'html')
+
+        raw_tokens += estimate_tokens(email.get('clean_text', ''))
+        full_texts.append(parse_html(body_content, content_type, inline_tables=True)['text'])
+
+        # The first message keeps its quoted part - a forward of a client
+        # instruction has the actual order details below the forward header
+        text = compact_email_body(body_content, content_type, keep_quoted=(i == 0))
+
+        section = f"--- Email from {email.get('sender', '')} | {email.get('date', '')} ---\n"
+        section += f"Subject: {email.get('subject', '')}\n"
+        section += text
+        for attachment_type, name, attachment_text in attachment_texts.get(i, []):
+            section += f"\n\n--- {attachment_type} ATTACHMENT: {name} ---\n{attachment_text}\n--- END {attachment_type} ATTACHMENT ---"
+            full_texts.append(attachment_text)
+        sections.append(section)
+        message_tokens.append(estimate_tokens(section))
+
+    content = '\n\n'.join(sections)
+    compact_tokens = estimate_tokens(content)
+    ok, reason = validate_compaction('\n'.join(full_texts), content)
+
+    stats = {
+        'messages': len(emails),
+        'raw_tokens': raw_tokens,
+        'compact_tokens': compact_tokens,
+        'message_tokens': message_tokens,
+        'compacted': ok,
+        'fallback_reason': reason
+    }
+    return (content if ok else None), stats
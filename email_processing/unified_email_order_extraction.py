@@ -4,10 +4,15 @@ Unified Email Order Extraction
 Comprehensive script that handles all email order extraction solutions
 """
 
+import os
+import sys
 import json
 import re
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from email_records import iter_email_records
+
 def extract_from_structured_tables(table_data):
     """Extract order details from structured table data"""
     extracted = {
@@ -297,11 +302,8 @@ def main():
     print("=== UNIFIED EMAIL ORDER EXTRACTION ===")
     print("Comprehensive solution for all email order extraction")
     
-    # Load comprehensive analysis
-    with open('comprehensive_dealing_emails_analysis.json', 'r') as f:
-        data = json.load(f)
-    
-    emails = data['email_analyses']
+    # Load comprehensive analysis (NDJSON email records, legacy JSON also accepted)
+    emails = list(iter_email_records('comprehensive_dealing_emails_analysis.json'))
     
     # Load original trade instructions
     with open('trade_instructions_20250822_171054.json', 'r') as f:
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Newline-delimited JSON (NDJSON) storage for email surveillance artifacts.
+
+Email inputs (temp_emails_*.json, comprehensive_dealing_emails_analysis.json)
+and surveillance results (complete_surveillance_results_*.json,
+email_surveillance_{date}.json) are written one email/thread per line instead
+of a single indented JSON document:
+
+    {"record_type": "header", "format": "email-ndjson/1", "kind": "surveillance_results", ...}
+    {"record_type": "email", "category": "trade_instruction", "subject": ..., "ai_analysis": ...}
+    ...
+    {"record_type": "summary", "total_emails_analyzed": ..., "category_counts": {...}}
+
+The category (AI email intent) is a field of each record, so results are no
+longer stored twice (once in a category list and again in all_results).
+Writers append records as analysis progresses and readers stream them,
+optionally filtered by category, so peak memory no longer grows with the day.
+
+The file names are unchanged. Readers also accept the legacy single-document
+JSON layout (email_analyses / all_results), so older files on disk and in S3
+keep working.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMAIL_RECORDS_FORMAT = 'email-ndjson/1'
+
+# Artifact kinds
+KIND_EMAIL_INPUT = 'email_input'
+KIND_SURVEILLANCE_RESULTS = 'surveillance_results'
+
+_HEADER_PREFIX = '{"record_type": "header"'
+_SUMMARY_PREFIX = '{"record_type": "summary"'
+_EMAIL_PREFIX = '{"record_type": "email", "category": '
+
+# Bytes read from the end of a file to find the summary record
+_SUMMARY_TAIL_BYTES = 1 << 16
+
+
+def email_category(email: Dict[str, Any]) -> str:
+    """
+    Category of an analyzed email: its AI intent ('trade_instruction',
+    'trade_confirmation', ...) or 'other' when there is no analysis.
+    """
+    ai_analysis = email.get('ai_analysis') or {}
+    return ai_analysis.get('ai_email_intent') or 'other'
+
+
+class EmailRecordWriter:
+    """
+    Streaming NDJSON writer; use as a context manager.
+
+    The header is written on open, each write() appends and flushes one
+    record, and close() appends the summary record. If the block raises, the
+    file is closed without a summary so readers can tell it is incomplete.
+    """
+
+    def __init__(self, path: str, kind: str, **header: Any):
+        self.path = path
+        self.count = 0
+        self.category_counts: Dict[str, int] = {}
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write_line({
+            'record_type': 'header',
+            'format': EMAIL_RECORDS_FORMAT,
+            'kind': kind,
+            'created': datetime.now().isoformat(),
+            **header
+        })
+
+    def _write_line(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._file.write('\n')
+
+    def write(self, email: Dict[str, Any], category: Optional[str] = None):
+        """
+        Append one email/thread record.
+
+        Args:
+            email: Email dictionary
+            category: Category stored with the record (None for raw input emails)
+        """
+        record = {'record_type': 'email', 'category': category}
+        record.update((key, value) for key, value in email.items() if key not in record)
+        self._write_line(record)
+        self._file.flush()
+        self.count += 1
+        if category is not None:
+            self.category_counts[category] = self.category_counts.get(category, 0) + 1
+
+    def close(self, **summary: Any):
+        """Write the summary record (counts are added automatically) and close the file"""
+        if self._file.closed:
+            return
+        self._write_line({
+            'record_type': 'summary',
+            'email_count': self.count,
+            'category_counts': self.category_counts,
+            **summary
+        })
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+        return False
+
+
+def write_email_records(path: str, emails: List[Dict[str, Any]], kind: str = KIND_EMAIL_INPUT,
+                        categorize: bool = False, **header: Any) -> str:
+    """
+    Write a list of emails as an NDJSON artifact.
+
+    Args:
+        path: Output path
+        emails: Email dictionaries
+        kind: Artifact kind (KIND_EMAIL_INPUT or KIND_SURVEILLANCE_RESULTS)
+        categorize: Store email_category() with each record
+        header: Extra header fields
+
+    Returns:
+        path
+    """
+    with EmailRecordWriter(path, kind, email_count=len(emails), **header) as writer:
+        for email in emails:
+            writer.write(email, email_category(email) if categorize else None)
+    return path
+
+
+def is_email_records_file(path: str) -> bool:
+    """True if path is an NDJSON email artifact (False for legacy single-document JSON)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.readline().startswith(_HEADER_PREFIX)
+
+
+def _load_legacy(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {'email_analyses': data}
+    return data
+
+
+def _legacy_emails(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    if isinstance(data.get('all_results'), list):
+        for email in data['all_results']:
+            yield {'category': email_category(email), **email}
+    else:
+        for email in data.get('email_analyses', []) or []:
+            yield {'category': None, **email}
+
+
+def iter_email_records(path: str, category: Optional[str] = None,
+                       predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream email records from an NDJSON or legacy JSON artifact.
+
+    Args:
+        path: Artifact path
+        category: Only yield records of this category (e.g. 'trade_instruction');
+            other records are skipped without being parsed
+        predicate: Optional additional filter on the parsed record
+
+    Yields:
+        Email dictionaries including their 'category' field
+    """
+    if not is_email_records_file(path):
+        for email in _legacy_emails(_load_legacy(path)):
+            if category is not None and email['category'] != category:
+                continue
+            if predicate is None or predicate(email):
+                yield email
+        return
+
+    wanted_prefix = None
+    if category is not None:
+        wanted_prefix = _EMAIL_PREFIX + json.dumps(category) + ','
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.startswith('{"record_type": "email"'):
+                continue
+            if wanted_prefix is not None and line.startswith(_EMAIL_PREFIX) and not line.startswith(wanted_prefix):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                # A truncated last line means the writer was interrupted
+                logger.warning(f"{path}:{line_number}: skipping unreadable record ({e})")
+                continue
+            record.pop('record_type', None)
+            if category is not None and record.get('category') != category:
+                continue
+            if predicate is None or predicate(record):
+                yield record
+
+
+def _read_tail_summary(path: str) -> Optional[Dict[str, Any]]:
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - _SUMMARY_TAIL_BYTES))
+        tail = f.read().decode('utf-8', errors='ignore')
+    for line in reversed(tail.splitlines()):
+        if line.startswith(_SUMMARY_PREFIX):
+            return json.loads(line)
+        if line.strip():
+            return None
+    return None
+
+
+def read_email_summary(path: str) -> Dict[str, Any]:
+    """
+    Header and summary fields of an artifact, without reading the email records.
+
+    Always contains 'kind', 'complete', 'email_count' and (for results)
+    'category_counts'. For legacy files the whole document has to be loaded
+    to compute these.
+
+    Args:
+        path: Artifact path
+
+    Returns:
+        Dictionary of header + summary fields
+    """
+    if not is_email_records_file(path):
+        data = _load_legacy(path)
+        summary = {}
+        for key, value in data.items():
+            if key in ('email_analyses', 'all_results'):
+                continue
+            if isinstance(value, dict):
+                # Category blocks keep their totals, not the duplicated email lists
+                value = {k: v for k, v in value.items() if k != 'emails'}
+            summary[key] = value
+        summary['format'] = 'legacy'
+        summary['complete'] = True
+        if isinstance(data.get('all_results'), list):
+            summary['kind'] = KIND_SURVEILLANCE_RESULTS
+            counts: Dict[str, int] = {}
+            for email in data['all_results']:
+                category = email_category(email)
+                counts[category] = counts.get(category, 0) + 1
+            summary['category_counts'] = counts
+            summary['email_count'] = len(data['all_results'])
+        else:
+            summary['kind'] = KIND_EMAIL_INPUT
+            summary['email_count'] = len(data.get('email_analyses', []) or [])
+        return summary
+
+    with open(path, 'r', encoding='utf-8') as f:
+        summary = json.loads(f.readline())
+    summary.pop('record_type', None)
+    tail = _read_tail_summary(path)
+    summary['complete'] = tail is not None
+    if tail is not None:
+        tail.pop('record_type', None)
+        summary.update(tail)
+    else:
+        # Interrupted writer: count what made it to disk
+        counts = {}
+        total = 0
+        for record in iter_email_records(path):
+            total += 1
+            if record.get('category') is not None:
+                counts[record['category']] = counts.get(record['category'], 0) + 1
+        summary['email_count'] = total
+        summary['category_counts'] = counts
+    return summary
@@ -1,9 +1,10 @@
 import os
-import re
 import glob
 import pandas as pd
 import wave
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from call_filenames import extract_mobile, parse_call_filename
 
 # Paths
 CALL_RECORDS_DIR = os.path.join("July", "Call Records")
@@ -14,24 +15,11 @@ OUTPUT_PATH = os.path.join("July", "call_info_output.xlsx")
 ucc_df = pd.read_excel(UCC_PATH, dtype=str)
 ucc_numbers = set(ucc_df['MOBILE'].astype(str).str.replace(r'\D', '', regex=True))
 
-def extract_mobile(filename):
-    # Look for patterns like 09..., 009..., 093..., 602-009..., 616-009...
-    match = re.search(r'(?:^|[-_])0{1,2}(\d{10})', filename)
-    if match:
-        return match.group(1)
-    # fallback: look for any 10+ digit number
-    match = re.search(r'(\d{10,12})', filename)
-    if match:
-        return match.group(1)[-10:]
-    return None
-
 def extract_datetime(filename):
-    # Last field is like 20250603094559, may be followed by (1), (2), etc.
-    match = re.search(r'(\d{14})(?=\.wav$| \([\d]+\)\.wav$)', filename)
-    if not match:
+    # Start time from the recorder filename grammar (e.g. last field 20250603094559, maybe followed by (1), (2))
+    dt = parse_call_filename(filename).call_start
+    if not dt:
         return None, None, None  # Always return three values
-    dt_str = match.group(1)
-    dt = datetime.strptime(dt_str, "%Y%m%d%H%M%S")
     date = dt.strftime("%Y-%m-%d")
     time = dt.strftime("%H:%M:%S")
     return date, time, dt
@@ -1,20 +1,9 @@
 import pandas as pd
 import os
-import re
 from datetime import datetime, timedelta
-import glob
 
-def extract_mobile(filename):
-    """Extract mobile number using the same logic as original June script"""
-    # Look for patterns like 09..., 009..., 093..., 602-009..., 616-009...
-    match = re.search(r'(?:^|[-_])0{1,2}(\d{10})', filename)
-    if match:
-        return match.group(1)
-    # fallback: look for any 10+ digit number
-    match = re.search(r'(\d{10,12})', filename)
-    if match:
-        return match.group(1)[-10:]
-    return None
+from audio_metadata import DEFAULT_CALL_DURATION_SECONDS
+from audio_catalog import recordings_for_date
 
 def extract_call_info_for_date(date_str):
     """
@@ -51,22 +40,19 @@ def extract_call_info_for_date(date_str):
         os.makedirs(call_records_path, exist_ok=True)
         print(f"✅ Directory created: {call_records_path}")
     
-    # Get all audio files for the specific date (including .729 files)
-    audio_files = (
-        glob.glob(os.path.join(call_records_path, "*.wav")) + 
-        glob.glob(os.path.join(call_records_path, "*.mp3")) +
-        glob.glob(os.path.join(call_records_path, "*.729"))
-    )
+    # Recordings for the date (including .729 files) from the audio catalog; only new or
+    # changed files are hashed and measured
+    recordings = recordings_for_date(date_str, local_only=True)
     
     # PERMANENT FIX: Handle empty audio files gracefully - create empty output file instead of failing
-    if not audio_files:
+    if not recordings:
         print(f"ℹ️  No audio files found in {call_records_path}")
         print(f"📝 Creating empty call info output file...")
         
         # Create empty DataFrame with required columns
         empty_df = pd.DataFrame(columns=[
             'filename', 'mobile_number', 'present_in_ucc', 'call_start', 
-            'call_end', 'duration_seconds', 'client_id'
+            'call_end', 'duration_seconds', 'duration_source', 'client_id'
         ])
         
         # Save empty file to indicate processing completed (even with no audio)
@@ -75,7 +61,7 @@ def extract_call_info_for_date(date_str):
         print(f"✅ Audio file processing completed (no audio files for this date)")
         return output_path
     
-    print(f"Found {len(audio_files)} audio files for {date_str}")
+    print(f"Found {len(recordings)} audio files for {date_str}")
     
     # Load UCC database
     try:
@@ -87,14 +73,18 @@ def extract_call_info_for_date(date_str):
         print(f"Error loading UCC database: {e}")
         return None
     
+    # Real call durations were read from the audio headers when the files were catalogued
+    measured = sum(1 for recording in recordings if recording['duration_seconds'] is not None)
+    print(f"Durations from audio headers for {measured}/{len(recordings)} files")
+    
     # Extract mobile numbers and create call info
     call_info_list = []
     
-    for audio_file in audio_files:
-        filename = os.path.basename(audio_file)
+    for recording in recordings:
+        filename = recording['filename']
         
-        # Extract mobile number using the same logic as original
-        mobile_number = extract_mobile(filename)
+        # Mobile number parsed with the same logic as original when the file was catalogued
+        mobile_number = recording['mobile_number']
         
         if mobile_number:
             # Check if mobile number exists in UCC database
@@ -110,41 +100,21 @@ def extract_call_info_for_date(date_str):
                         client_id = str(row['CLIENT CD'])
                         break
             
-            # Extract timestamp from filename - handle multiple formats
-            call_start = None
+            # Timestamp from filename (g-YYYYMMDD-HHMMSS, -YYYYMMDDHHMMSS.wav or unix epoch formats)
+            call_start = datetime.fromisoformat(recording['call_start']) if recording['call_start'] else None
+            
+            # Call window: real duration from the header, the old fixed 5 minutes if unreadable
             call_end = None
             duration_seconds = None
-            
-            # Format 1: October format - g-YYYYMMDD-HHMMSS-... (e.g., g-20251001-110447-...)
-            october_format_match = re.search(r'g-(\d{8})-(\d{6})', filename)
-            if october_format_match:
-                date_part = october_format_match.group(1)  # YYYYMMDD
-                time_part = october_format_match.group(2)  # HHMMSS
-                timestamp_str = date_part + time_part  # YYYYMMDDHHMMSS
-                call_start = datetime.strptime(timestamp_str, '%Y%m%d%H%M%S')
-                call_end = call_start + timedelta(seconds=300)
-                duration_seconds = 300
-            else:
-                # Format 2: September format - ...-YYYYMMDDHHMMSS.wav (14 digits at end)
-                date_suffix_match = re.search(r'-(\d{14})\.(wav|mp3)$', filename)
-                if date_suffix_match:
-                    date_suffix = date_suffix_match.group(1)
-                    call_start = datetime.strptime(date_suffix, '%Y%m%d%H%M%S')
-                    call_end = call_start + timedelta(seconds=300)
-                    duration_seconds = 300
+            duration_source = None
+            if call_start is not None:
+                if recording['duration_seconds'] is not None:
+                    duration_seconds = round(recording['duration_seconds'], 2)
+                    duration_source = 'header'
                 else:
-                    # Format 3: Unix timestamp format - ...-UNIXTIMESTAMP.xxxx-YYYYMMDDHHMMSS
-                    timestamp_match = re.search(r'-(\d{10})\.\d+-\d{14}', filename)
-                    if timestamp_match:
-                        timestamp = int(timestamp_match.group(1))
-                        call_start = datetime.fromtimestamp(timestamp)
-                        call_end = datetime.fromtimestamp(timestamp + 300)
-                        duration_seconds = 300
-                    else:
-                        # No timestamp found
-                        call_start = None
-                        call_end = None
-                        duration_seconds = None
+                    duration_seconds = DEFAULT_CALL_DURATION_SECONDS
+                    duration_source = 'assumed'
+                call_end = call_start + timedelta(seconds=duration_seconds)
             
             call_info_list.append({
                 'filename': filename,
@@ -153,6 +123,7 @@ def extract_call_info_for_date(date_str):
                 'call_start': call_start,
                 'call_end': call_end,
                 'duration_seconds': duration_seconds,
+                'duration_source': duration_source,
                 'client_id': client_id
             })
     
@@ -169,7 +140,7 @@ def extract_call_info_for_date(date_str):
         print(f"📝 Creating empty call info output file...")
         empty_df = pd.DataFrame(columns=[
             'filename', 'mobile_number', 'present_in_ucc', 'call_start', 
-            'call_end', 'duration_seconds', 'client_id'
+            'call_end', 'duration_seconds', 'duration_source', 'client_id'
         ])
         empty_df.to_excel(output_path, index=False)
         print(f"✅ Created empty call info file: {output_path}")
@@ -9,6 +9,8 @@ import os
 import sys
 from datetime import datetime
 
+from email_records import iter_email_records
+
 def extract_oms_orders_from_email_surveillance(email_surveillance_file: str, output_file: str):
     """
     Extract OMS orders from email surveillance file and create OMS surveillance results.
@@ -20,15 +22,12 @@ def extract_oms_orders_from_email_surveillance(email_surveillance_file: str, out
     
     print(f"📋 Extracting OMS orders from: {email_surveillance_file}")
     
-    # Load email surveillance data
-    with open(email_surveillance_file, 'r') as f:
-        email_data = json.load(f)
-    
-    # Find OMS emails
-    oms_emails = []
-    for email in email_data.get('trade_instructions', {}).get('emails', []):
-        if 'New Order Alert - OMS!' in email.get('subject', ''):
-            oms_emails.append(email)
+    # Stream the trade instruction records and keep the OMS alerts
+    oms_emails = list(iter_email_records(
+        email_surveillance_file,
+        category='trade_instruction',
+        predicate=lambda email: 'New Order Alert - OMS!' in email.get('subject', '')
+    ))
     
     print(f"📋 Found {len(oms_emails)} OMS emails")
     
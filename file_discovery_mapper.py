@@ -12,6 +12,8 @@ from pathlib import Path
 import pandas as pd
 from typing import Dict, List, Optional, Tuple
 
+from audio_catalog import open_catalog, AUDIO_EXTENSIONS
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -228,6 +230,8 @@ class FileDiscoveryMapper:
                 if os.path.exists(surveillance_path):
                     logger.info(f"Successfully copied: {os.path.basename(original_path)} -> {os.path.basename(surveillance_path)}")
                     copied_count += 1
+                    if surveillance_path.lower().endswith(AUDIO_EXTENSIONS):
+                        self._catalog_recording(surveillance_path)
                 else:
                     logger.error(f"Copy verification failed: {surveillance_path} does not exist after copy")
                     failed_count += 1
@@ -240,6 +244,13 @@ class FileDiscoveryMapper:
         success = copied_count > 0 or len(file_mappings) == 0
         return success, copied_count, failed_count
     
+    def _catalog_recording(self, surveillance_path: str):
+        """Add a copied recording to the audio catalog (a later scan picks it up if this fails)"""
+        try:
+            open_catalog(base_dir=self.base_dir).add_file(surveillance_path)
+        except Exception as e:
+            logger.warning(f"Could not catalog {surveillance_path}: {e}")
+    
     def process_uploaded_files(self, date_str: str, replace_existing: bool = True) -> Tuple[bool, Dict[str, str]]:
         """
         Complete file discovery and mapping process
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+HTML parsing for email bodies.
+Single streaming pass over the HTML producing clean text plus structured tables
+(list of tables, each a list of rows, each a list of cell strings).
+
+Used by the dealing email fetch (fills table_data) and the OMS alert processor.
+Built on the stdlib html.parser tokenizer so it has no extra dependencies and
+never backtracks on large alert digests.
+"""
+import re
+import html
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Any
+
+logger = logging.getLogger(__name__)
+
+# Tags that start a new line in the text output
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'blockquote', 'pre', 'hr', 'section', 'article', 'header', 'footer'
+}
+# Tags whose content is never visible text
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'xml'}
+
+_WHITESPACE = re.compile(r'[ \t\r\f\v\xa0]+')
+
+# Table-only tokenizer: the structural tags, <br>, and script/style blocks to skip
+_TABLE_TOKEN = re.compile(
+    r'<(script|style)\b[^>]*>.*?</\1\s*>|<(/?)(table|tr|td|th)\b[^>]*>|<br\b[^>]*>',
+    re.IGNORECASE | re.DOTALL
+)
+_ANY_TAG = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+
+
+class _EmailHTMLParser(HTMLParser):
+    """Collects visible text and table cells in one pass"""
+
+    def __init__(self, inline_tables: bool = False):
+        super().__init__(convert_charrefs=True)
+        # inline_tables: render each table into the text as pipe rows instead of cell text
+        self.inline_tables = inline_tables
+        self.text_parts: List[str] = []
+        self.tables: List[List[List[str]]] = []
+        # Stack of open tables (nested tables are kept as separate tables)
+        self._table_stack: List[Dict[str, Any]] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if tag in BLOCK_TAGS:
+            self.text_parts.append('\n')
+        if tag == 'br':
+            self.handle_startendtag(tag, attrs)
+            return
+
+        if tag == 'table':
+            self._table_stack.append({'rows': [], 'row': None, 'cell': None})
+        elif not self._table_stack:
+            return
+        elif tag == 'tr':
+            table = self._table_stack[-1]
+            self._close_row(table)
+            table['row'] = []
+        elif tag in ('td', 'th'):
+            table = self._table_stack[-1]
+            self._close_cell(table)
+            if table['row'] is None:
+                table['row'] = []
+            table['cell'] = []
+            self.text_parts.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.text_parts.append('\n')
+        if tag == 'br' and self._table_stack and self._table_stack[-1]['cell'] is not None:
+            self._table_stack[-1]['cell'].append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if tag in BLOCK_TAGS:
+            self.text_parts.append('\n')
+
+        if not self._table_stack:
+            return
+        table = self._table_stack[-1]
+        if tag in ('td', 'th'):
+            self._close_cell(table)
+        elif tag == 'tr':
+            self._close_row(table)
+        elif tag == 'table':
+            self._close_row(table)
+            self._table_stack.pop()
+            if table['rows']:
+                self.tables.append(table['rows'])
+                if self.inline_tables:
+                    self.text_parts.append('\n' + tables_to_pipe_rows([table['rows']]) + '\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if not (self.inline_tables and self._table_stack):
+            self.text_parts.append(data)
+        if self._table_stack and self._table_stack[-1]['cell'] is not None:
+            self._table_stack[-1]['cell'].append(data)
+
+    def close(self):
+        super().close()
+        # Unclosed tables in truncated/malformed HTML are still returned
+        while self._table_stack:
+            table = self._table_stack.pop()
+            self._close_row(table)
+            if table['rows']:
+                self.tables.append(table['rows'])
+                if self.inline_tables:
+                    self.text_parts.append('\n' + tables_to_pipe_rows([table['rows']]) + '\n')
+
+    @staticmethod
+    def _close_cell(table):
+        if table['cell'] is None:
+            return
+        cell_text = _WHITESPACE.sub(' ', ''.join(table['cell'])).replace('\n', ' ').strip()
+        table['row'].append(cell_text)
+        table['cell'] = None
+
+    @classmethod
+    def _close_row(cls, table):
+        cls._close_cell(table)
+        row = table['row']
+        if row is not None and any(cell for cell in row):
+            table['rows'].append(row)
+        table['row'] = None
+
+
+def _normalize_text(raw_text: str) -> str:
+    """Collapse runs of whitespace and drop blank lines"""
+    lines = []
+    for line in raw_text.split('\n'):
+        line = _WHITESPACE.sub(' ', line).strip()
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_html(content: str, content_type: str = 'html', inline_tables: bool = False) -> Dict[str, Any]:
+    """
+    Parse an email body into clean text and structured tables.
+
+    Args:
+        content: Email body (HTML or plain text)
+        content_type: Graph API body contentType ('html' or 'text')
+        inline_tables: Render tables into the text as compact pipe-delimited rows
+
+    Returns:
+        Dictionary with 'text' (str) and 'tables' (list of tables, each a list of rows)
+    """
+    if not content:
+        return {'text': '', 'tables': []}
+
+    if content_type != 'html':
+        return {'text': _normalize_text(html.unescape(content)), 'tables': []}
+
+    parser = _EmailHTMLParser(inline_tables)
+    try:
+        parser.feed(content)
+        parser.close()
+    except Exception as e:
+        logger.warning(f"HTML parse failed, falling back to tag stripping: {e}")
+        text = re.sub(r'<[^>]+>', ' ', html.unescape(content))
+        return {'text': _normalize_text(text), 'tables': []}
+
+    return {
+        'text': _normalize_text(''.join(parser.text_parts)),
+        'tables': parser.tables
+    }
+
+
+def _close_fast_cell(table):
+    if table['cell'] is None:
+        return
+    cell_text = html.unescape(_ANY_TAG.sub('', ''.join(table['cell'])))
+    table['row'].append(_WHITESPACE.sub(' ', cell_text).replace('\n', ' ').strip())
+    table['cell'] = None
+
+
+def _close_fast_row(table):
+    _close_fast_cell(table)
+    row = table['row']
+    if row is not None and any(cell for cell in row):
+        table['rows'].append(row)
+    table['row'] = None
+
+
+def extract_tables_fast(content: str) -> List[List[List[str]]]:
+    """
+    Extract tables with a single finditer pass over the table tags only.
+
+    Same output as parse_html(content)['tables'] for well-formed tables, without
+    building the text output - used for large alert digests where only the
+    table cells matter.
+
+    Args:
+        content: HTML content
+
+    Returns:
+        List of tables, each a list of rows of cell strings
+    """
+    if not content:
+        return []
+
+    tables: List[List[List[str]]] = []
+    stack: List[Dict[str, Any]] = []
+    position = 0
+    for match in _TABLE_TOKEN.finditer(content):
+        if stack and stack[-1]['cell'] is not None and match.start() > position:
+            stack[-1]['cell'].append(content[position:match.start()])
+        position = match.end()
+        if match.group(1):
+            # script / style block
+            continue
+
+        tag = (match.group(3) or 'br').lower()
+        closing = bool(match.group(2))
+        if tag == 'br':
+            if stack and stack[-1]['cell'] is not None:
+                stack[-1]['cell'].append(' ')
+        elif tag == 'table':
+            if not closing:
+                stack.append({'rows': [], 'row': None, 'cell': None})
+            elif stack:
+                table = stack.pop()
+                _close_fast_row(table)
+                if table['rows']:
+                    tables.append(table['rows'])
+        elif not stack:
+            continue
+        elif tag == 'tr':
+            _close_fast_row(stack[-1])
+            if not closing:
+                stack[-1]['row'] = []
+        else:
+            table = stack[-1]
+            _close_fast_cell(table)
+            if not closing:
+                if table['row'] is None:
+                    table['row'] = []
+                table['cell'] = []
+
+    if stack and stack[-1]['cell'] is not None:
+        stack[-1]['cell'].append(content[position:])
+    # Unclosed tables in truncated/malformed HTML are still returned
+    while stack:
+        table = stack.pop()
+        _close_fast_row(table)
+        if table['rows']:
+            tables.append(table['rows'])
+    return tables
+
+
+def html_to_text(content: str) -> str:
+    """Return only the visible text of an HTML body"""
+    return parse_html(content)['text']
+
+
+def extract_tables(content: str) -> List[List[List[str]]]:
+    """Return only the tables of an HTML body"""
+    return parse_html(content)['tables']
+
+
+def tables_to_pipe_rows(tables: List[List[List[str]]]) -> str:
+    """
+    Render tables as compact pipe-delimited rows (one line per row, blank line between tables).
+
+    Args:
+        tables: Tables as returned by parse_html
+
+    Returns:
+        Text block suitable for inclusion in a prompt
+    """
+    blocks = []
+    for table in tables:
+        blocks.append('\n'.join(' | '.join(cell for cell in row) for row in table))
+    return '\n\n'.join(blocks)
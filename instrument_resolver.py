@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Local instrument resolver: free-text security names -> exchange symbols.
+
+Emails and OMS alerts name instruments as "Manappuram Finance Limited",
+"Energy INVIT" or by ISIN, while the OrderBook uses MANAPPURAM / ENERGYINF.
+The resolver combines, in order:
+- ISIN lookup (scrip master + ISINs learned from confirmed OMS matches)
+- exact symbol / normalized symbol (series suffixes like -EQ dropped)
+- aliases: seed list, scrip master company names and aliases learned from
+  confirmed matches (persisted in instrument_aliases.json)
+- a character trigram + token-set fuzzy index over symbols and names
+
+The symbol universe is built from the order books seen so far plus the
+optional scrip master CSV (SCRIP_MASTER_FILE, columns like Symbol /
+Company Name / ISIN).
+"""
+import os
+import re
+import csv
+import json
+import logging
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ALIASES_FILE = os.getenv('INSTRUMENT_ALIASES_FILE', os.path.join(BASE_DIR, 'instrument_aliases.json'))
+SCRIP_MASTER_FILE = os.getenv('SCRIP_MASTER_FILE', '')
+
+FUZZY_MIN_SCORE = float(os.getenv('INSTRUMENT_FUZZY_MIN_SCORE', '0.6'))
+# Best fuzzy hit must beat the runner-up by this much to count as unambiguous
+FUZZY_MIN_MARGIN = 0.1
+# Word-level trigram similarity that still counts as the same word (typos)
+TOKEN_MIN_SIMILARITY = 0.6
+
+# Email wording -> exchange symbol (keys normalized with name_key)
+SEED_ALIASES = {
+    'blue jet healthcare': 'BLUEJET',
+    'blue jet': 'BLUEJET',
+    'energy invit': 'ENERGYINF',
+    'energy infrastructure trust': 'ENERGYINF',
+    'manappuram finance': 'MANAPPURAM',
+    'hindustan zinc': 'HINDZINC',
+    'varun beverages': 'VBL',
+    'varun bev': 'VBL'
+}
+
+# Scrip master column names seen in exchange / broker downloads
+MASTER_SYMBOL_COLUMNS = ('symbol', 'tradingsymbol', 'trading symbol', 'nse symbol', 'scrip code')
+MASTER_NAME_COLUMNS = ('company name', 'name of company', 'security name', 'name', 'scrip name')
+MASTER_ISIN_COLUMNS = ('isin', 'isin number', 'isin code')
+
+ISIN_PATTERN = re.compile(r'^IN[A-Z0-9]{10}$')
+_COMPANY_SUFFIX = re.compile(r'\b(?:limited|ltd|pvt|private|the|company|co|inc|corp|eq)\b\.?', re.IGNORECASE)
+_SERIES_SUFFIX = re.compile(r'-(?:EQ|BE|BZ|SM|ST|IV|RR)$', re.IGNORECASE)
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def name_key(text) -> str:
+    """Lower-case, drop company suffixes and punctuation ("Manappuram Finance Ltd." -> "manappuram finance")"""
+    text = _COMPANY_SUFFIX.sub(' ', str(text or '').lower())
+    return ' '.join(_NON_ALNUM.sub(' ', text).split())
+
+
+def symbol_key(symbol) -> str:
+    """Compact symbol form without series suffix ("BLUEJET-EQ" -> "bluejet")"""
+    return _NON_ALNUM.sub('', _SERIES_SUFFIX.sub('', str(symbol or '').strip()).lower())
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _tokens_match(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    return len(shorter) >= 3 and longer.startswith(shorter)
+
+
+def _tokens_similar(a: str, b: str) -> bool:
+    """Same word, an abbreviation of it ("bev" ~ "beverages") or a misspelling ("manapuram" ~ "manappuram")"""
+    if _tokens_match(a, b):
+        return True
+    if min(len(a), len(b)) < 5:
+        return False
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b)) >= TOKEN_MIN_SIMILARITY
+
+
+def _covers(query: str, entry: str) -> bool:
+    """
+    Every distinctive query token is accounted for by the entry.
+
+    A shared first word is not enough: "tata motors" does not cover "tatasteel"
+    and "reliance power" does not cover "reliance". Compact symbol entries
+    ("bluejet") are covered by the query's words run together ("blue jet").
+    """
+    query_tokens = query.split()
+    if not query_tokens:
+        return False
+    if ''.join(query_tokens) == entry.replace(' ', ''):
+        return True
+    entry_tokens = entry.split()
+    return all(any(_tokens_similar(token, other) for other in entry_tokens) for token in query_tokens)
+
+
+def _token_set_score(query_tokens: Set[str], entry_tokens: Set[str]) -> float:
+    """Share of the shorter token set found in the other (prefix matches count, "bev" ~ "beverages")"""
+    if not query_tokens or not entry_tokens:
+        return 0.0
+    small, large = sorted((query_tokens, entry_tokens), key=len)
+    hits = sum(1 for token in small if any(_tokens_match(token, other) for other in large))
+    return hits / len(large) * 0.5 + hits / len(small) * 0.5
+
+
+class InstrumentResolver:
+    """Symbol universe with ISIN, alias and fuzzy name lookups"""
+
+    def __init__(self):
+        self.symbols: Set[str] = set()
+        self.isin_to_symbol: Dict[str, str] = {}
+        self.aliases: Dict[str, str] = dict(SEED_ALIASES)
+        self.learned_aliases: Dict[str, str] = {}
+        self.learned_isins: Dict[str, str] = {}
+        # Fuzzy index: entry text -> symbol, trigram -> entry texts
+        self._entries: Dict[str, str] = {}
+        self._trigram_index: Dict[str, Set[str]] = {}
+        self._dirty = False
+        # Matching runs on worker threads (ai_concurrency); lookups may extend the index
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------ building
+
+    def _index_entry(self, text: str, symbol: str):
+        if not text or text in self._entries:
+            return
+        self._entries[text] = symbol
+        for gram in _trigrams(text):
+            self._trigram_index.setdefault(gram, set()).add(text)
+
+    def add_symbol(self, symbol, name=None, isin=None):
+        """Add one instrument to the universe"""
+        with self._lock:
+            self._add_symbol(symbol, name, isin)
+
+    def _add_symbol(self, symbol, name=None, isin=None):
+        symbol = str(symbol or '').strip().upper()
+        if not symbol or symbol == 'NAN':
+            return
+        if symbol not in self.symbols:
+            self.symbols.add(symbol)
+            self._index_entry(symbol_key(symbol), symbol)
+        if name:
+            key = name_key(name)
+            if key:
+                self.aliases.setdefault(key, symbol)
+                self._index_entry(key, symbol)
+        if isin and ISIN_PATTERN.match(str(isin).strip().upper()):
+            self.isin_to_symbol.setdefault(str(isin).strip().upper(), symbol)
+
+    def add_order_book(self, orders):
+        """Add the symbols (and ISINs, when the file has them) of an OrderBook frame"""
+        if orders is None or 'Symbol' not in orders.columns:
+            return
+        isins = orders['ISIN'] if 'ISIN' in orders.columns else [None] * len(orders)
+        for symbol, isin in zip(orders['Symbol'], isins):
+            self.add_symbol(symbol, isin=isin if isinstance(isin, str) else None)
+
+    def load_scrip_master(self, path: str) -> int:
+        """
+        Load an optional scrip master CSV.
+
+        Args:
+            path: CSV with a symbol column and optionally company name / ISIN columns
+
+        Returns:
+            Number of instruments loaded
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        loaded = 0
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                columns = {c.strip().lower(): c for c in (reader.fieldnames or [])}
+                symbol_col = next((columns[c] for c in MASTER_SYMBOL_COLUMNS if c in columns), None)
+                name_col = next((columns[c] for c in MASTER_NAME_COLUMNS if c in columns), None)
+                isin_col = next((columns[c] for c in MASTER_ISIN_COLUMNS if c in columns), None)
+                if not symbol_col:
+                    logger.warning(f"Scrip master {path} has no symbol column")
+                    return 0
+                for row in reader:
+                    self.add_symbol(row.get(symbol_col),
+                                    name=row.get(name_col) if name_col else None,
+                                    isin=row.get(isin_col) if isin_col else None)
+                    loaded += 1
+        except Exception as e:
+            logger.warning(f"Could not load scrip master {path}: {e}")
+        logger.info(f"Loaded {loaded} instruments from scrip master {path}")
+        return loaded
+
+    def load_learned(self, path: str = ALIASES_FILE):
+        """Load aliases and ISINs learned from earlier confirmed matches"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read learned instrument aliases {path}: {e}")
+            return
+        for key, symbol in data.get('aliases', {}).items():
+            self.learned_aliases[key] = symbol
+            self.add_symbol(symbol)
+            self._index_entry(key, symbol)
+        for isin, symbol in data.get('isins', {}).items():
+            self.learned_isins[isin] = symbol
+            self.add_symbol(symbol)
+
+    def save_learned(self, path: str = ALIASES_FILE):
+        """Persist learned aliases atomically (no-op when nothing changed)"""
+        if not self._dirty:
+            return
+        data = {'aliases': self.learned_aliases, 'isins': self.learned_isins}
+        directory = os.path.dirname(path) or '.'
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"Could not save learned instrument aliases {path}: {e}")
+
+    def learn(self, text, symbol, isin=None):
+        """
+        Record a confirmed name -> symbol (and ISIN -> symbol) pair.
+
+        Args:
+            text: Instrument text as written in the email / alert
+            symbol: OrderBook symbol it was matched to
+            isin: ISIN from the alert, if any
+        """
+        with self._lock:
+            self._learn(text, symbol, isin)
+
+    def _learn(self, text, symbol, isin=None):
+        symbol = str(symbol or '').strip().upper()
+        if not symbol:
+            return
+        key = name_key(text)
+        if key and key != symbol_key(symbol) and self.learned_aliases.get(key) != symbol \
+                and SEED_ALIASES.get(key) != symbol:
+            self.learned_aliases[key] = symbol
+            self._index_entry(key, symbol)
+            self._dirty = True
+        if isin:
+            isin = str(isin).strip().upper()
+            if ISIN_PATTERN.match(isin) and self.learned_isins.get(isin) != symbol:
+                self.learned_isins[isin] = symbol
+                self._dirty = True
+        self.add_symbol(symbol)
+
+    # ------------------------------------------------------------------ lookup
+
+    def names_for(self, symbol) -> Set[str]:
+        """Known names of a symbol (seed, scrip master and learned aliases, as name_key forms)"""
+        key = symbol_key(symbol)
+        if not key:
+            return set()
+        with self._lock:
+            return {name for aliases in (self.aliases, self.learned_aliases)
+                    for name, target in aliases.items() if symbol_key(target) == key}
+
+    def _fuzzy(self, key: str, allowed: Optional[Set[str]]) -> Tuple[Optional[str], float]:
+        grams = _trigrams(key)
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for entry in self._trigram_index.get(gram, ()):
+                counts[entry] = counts.get(entry, 0) + 1
+
+        query_tokens = set(key.split())
+        best: Dict[str, float] = {}
+        for entry, shared in counts.items():
+            symbol = self._entries[entry]
+            if allowed is not None and symbol not in allowed:
+                continue
+            # With a single allowed candidate there is no runner-up, so the
+            # entry itself must account for every word of the query
+            if not _covers(key, entry):
+                continue
+            dice = 2 * shared / (len(grams) + len(_trigrams(entry)))
+            score = max(dice, _token_set_score(query_tokens, set(entry.split())))
+            if score > best.get(symbol, 0.0):
+                best[symbol] = score
+
+        if not best:
+            return None, 0.0
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        symbol, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score < FUZZY_MIN_SCORE or score - runner_up < FUZZY_MIN_MARGIN:
+            return None, score
+        return symbol, score
+
+    def resolve(self, text, isin=None, candidates: Iterable[str] = None) -> Tuple[Optional[str], float, Optional[str]]:
+        """
+        Resolve an instrument name / symbol / ISIN to an exchange symbol.
+
+        Args:
+            text: Symbol or security name as written
+            isin: ISIN, if known
+            candidates: Restrict to these symbols (e.g. the client's orders that day)
+
+        Returns:
+            (symbol, score 0-1, method) where method is 'isin', 'exact', 'alias',
+            'learned' or 'fuzzy'; (None, 0.0, None) when unresolved or ambiguous
+        """
+        with self._lock:
+            return self._resolve(text, isin, candidates)
+
+    def _resolve(self, text, isin, candidates) -> Tuple[Optional[str], float, Optional[str]]:
+        allowed = {str(c).strip().upper() for c in candidates} if candidates is not None else None
+
+        def ok(symbol):
+            return symbol and (allowed is None or symbol in allowed)
+
+        for value in (isin, text):
+            value = str(value or '').strip().upper()
+            if ISIN_PATTERN.match(value):
+                symbol = self.isin_to_symbol.get(value) or self.learned_isins.get(value)
+                if ok(symbol):
+                    return symbol, 1.0, 'isin'
+
+        if not text:
+            return None, 0.0, None
+        upper = str(text).strip().upper()
+        if ok(upper) and (allowed is not None or upper in self.symbols):
+            return upper, 1.0, 'exact'
+
+        pool = allowed if allowed is not None else self.symbols
+        same_key = [s for s in pool if symbol_key(s) == symbol_key(upper)]
+        if len(same_key) == 1:
+            return same_key[0], 1.0, 'exact'
+
+        key = name_key(text)
+        symbol = self.learned_aliases.get(key)
+        if ok(symbol):
+            return symbol, 0.95, 'learned'
+        symbol = self.aliases.get(key)
+        if ok(symbol):
+            return symbol, 0.95, 'alias'
+        if symbol and allowed is not None:
+            # Alias points at a symbol traded under a series suffix (BLUEJET -> BLUEJET-EQ)
+            same_key = [s for s in allowed if symbol_key(s) == symbol_key(symbol)]
+            if len(same_key) == 1:
+                return same_key[0], 0.95, 'alias'
+
+        if allowed is not None:
+            # Candidate symbols may not be in the universe yet
+            for candidate in allowed:
+                self.add_symbol(candidate)
+        symbol, score = self._fuzzy(key, allowed)
+        if symbol:
+            return symbol, round(score, 3), 'fuzzy'
+        return None, 0.0, None
+
+
+_resolver = None
+
+
+def get_resolver() -> InstrumentResolver:
+    """Process-wide resolver with learned aliases and the optional scrip master loaded"""
+    global _resolver
+    if _resolver is None:
+        _resolver = InstrumentResolver()
+        _resolver.load_scrip_master(SCRIP_MASTER_FILE)
+        _resolver.load_learned()
+    return _resolver
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the OMS order alert parser.
+
+Generates synthetic "New Order Alert - OMS!" HTML emails (same table layout
+as the real alerts, with some column-order variation), then times:
+
+- the generic HTML parser (html_parsing.parse_html) - the previous path
+- the single-pass table tokenizer (parse_oms_table_rows)
+- the tokenizer on a process pool, as used by process_oms_emails_from_file
+
+Usage:
+    python oms_surveillance/benchmark_oms_alert_parser.py --rows 1000 10000 100000
+    python oms_surveillance/benchmark_oms_alert_parser.py --rows 100000 --min-rows-per-sec 50000
+
+Exits non-zero when the tokenizer's serial throughput falls below --min-rows-per-sec,
+so it can guard against parser regressions in CI.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from html_parsing import parse_html
+from oms_order_alert_processor import OMS_TABLE_COLUMNS, OMS_PARSER_WORKERS, parse_oms_table_rows
+
+HEADERS = {
+    'ref_no': 'Ref.no', 'trade_date': 'Trade Date', 'client_code': 'Client Code',
+    'client_name': 'Client Name', 'account_type': 'Account Type', 'product': 'Product',
+    'side': 'Transaction Type', 'symbol': 'Scheme/Scrip', 'isin': 'ISIN', 'lob': 'LOB'
+}
+SYMBOLS = [
+    ('MANAPPURAM FINANCE LTD', 'INE522D01027'),
+    ('EDELWEISS FINANCIAL SERVICES LTD', 'INE532F01054'),
+    ('SONA BLW PRECISION FORGINGS LTD', 'INE073K01018'),
+    ('ICICI PRUDENTIAL BSE LIQUID RATE ETF', 'INF109KC1NT3')
+]
+ROWS_PER_EMAIL = 5
+
+
+def make_alert_email(rng: random.Random, rows: int, shuffle_columns: bool) -> str:
+    """Build one alert email body with `rows` order rows"""
+    columns = list(OMS_TABLE_COLUMNS)
+    if shuffle_columns:
+        rng.shuffle(columns)
+    header = ''.join(f'<th style="padding:4px">{HEADERS[c]}</th>' for c in columns)
+    body_rows = []
+    for _ in range(rows):
+        side = rng.choice(['BUY', 'SELL'])
+        symbol, isin = rng.choice(SYMBOLS)
+        values = {
+            'ref_no': f'{side}{rng.randint(0, 99999):05d}',
+            'trade_date': '04/08/2025',
+            'client_code': f'{rng.randint(100000, 999999)}',
+            'client_name': 'RAJANI SARAN &amp; CO',
+            'account_type': rng.choice(['POA', 'NON-POA']),
+            'product': 'LISTED EQ',
+            'side': side,
+            'symbol': symbol,
+            'isin': isin,
+            'lob': rng.choice(['NWM', 'NWP'])
+        }
+        cells = ''.join(f'<td style="border:1px solid #ccc"><span>{values[c]}</span></td>' for c in columns)
+        body_rows.append(f'<tr>{cells}</tr>')
+    return (
+        '<html><head><style>td { font-family: Arial; }</style></head><body>'
+        '<p>Dear Team,<br>Please find below the new order alert(s).</p>'
+        f'<table border="1"><tr>{header}</tr>{"".join(body_rows)}</table>'
+        '<p>Regards,<br>OMS</p></body></html>'
+    )
+
+
+def make_corpus(total_rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    emails = []
+    remaining = total_rows
+    while remaining > 0:
+        rows = min(ROWS_PER_EMAIL, remaining)
+        emails.append(make_alert_email(rng, rows, shuffle_columns=len(emails) % 10 == 9))
+        remaining -= rows
+    return emails
+
+
+def _count_rows(content: str) -> int:
+    return len(parse_oms_table_rows(content))
+
+
+def time_run(label: str, fn, emails, expected_rows: int) -> float:
+    start = time.perf_counter()
+    rows = fn(emails)
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed else float('inf')
+    status = '✅' if rows == expected_rows else f'❌ expected {expected_rows}'
+    print(f"   {label:<28} {rows:>8} rows  {elapsed:8.3f}s  {rate:>12,.0f} rows/s  {status}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the OMS order alert parser')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Corpus sizes (order rows) to benchmark')
+    parser.add_argument('--workers', type=int, default=OMS_PARSER_WORKERS, help='Process pool size')
+    parser.add_argument('--min-rows-per-sec', type=float, default=0,
+                        help='Fail when serial tokenizer throughput is below this')
+    parser.add_argument('--skip-generic', action='store_true', help='Skip the generic HTML parser baseline')
+    args = parser.parse_args()
+
+    failed = False
+    for total_rows in args.rows:
+        emails = make_corpus(total_rows)
+        size_mb = sum(len(e) for e in emails) / 1e6
+        print(f"\n📋 {total_rows:,} rows in {len(emails):,} emails ({size_mb:.1f} MB HTML)")
+
+        if not args.skip_generic:
+            # Baseline only counts table rows; it has no header mapping
+            time_run('generic parse_html', lambda es: sum(
+                len(t) - 1 for e in es for t in parse_html(e)['tables']), emails, total_rows)
+
+        rate = time_run('tokenizer (serial)', lambda es: sum(_count_rows(e) for e in es), emails, total_rows)
+        if args.workers > 1:
+            def pooled(es):
+                chunksize = max(1, len(es) // (args.workers * 4))
+                with multiprocessing.Pool(args.workers) as pool:
+                    return sum(pool.map(_count_rows, es, chunksize=chunksize))
+            time_run(f'tokenizer ({args.workers} processes)', pooled, emails, total_rows)
+
+        if args.min_rows_per_sec and rate < args.min_rows_per_sec:
+            print(f"   ❌ Serial throughput {rate:,.0f} rows/s below threshold {args.min_rows_per_sec:,.0f}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,8 +7,116 @@ Specialized processor for OMS Order Alert emails with fixed structure parsing.
 import json
 import re
 import os
+import sys
+import multiprocessing
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+# Shared HTML parser lives in the surveillance base directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_parsing import extract_tables_fast
+
+# Default column order of the OMS alert table (used when a table has no header row)
+OMS_TABLE_COLUMNS = [
+    'ref_no', 'trade_date', 'client_code', 'client_name', 'account_type',
+    'product', 'side', 'symbol', 'isin', 'lob'
+]
+
+# Header text (lower case, substring match) -> column; more specific keywords first
+OMS_HEADER_ALIASES = [
+    ('ref_no', ('ref',)),
+    ('trade_date', ('trade date', 'date')),
+    ('client_code', ('client code', 'ucc', 'client id')),
+    ('client_name', ('client name', 'name')),
+    ('account_type', ('account type',)),
+    ('product', ('product',)),
+    ('side', ('transaction type', 'buy/sell', 'side')),
+    ('symbol', ('scheme', 'scrip', 'symbol', 'security')),
+    ('isin', ('isin',)),
+    ('lob', ('lob',))
+]
+# Columns that must be populated for a row to count as an order
+OMS_REQUIRED_COLUMNS = ('ref_no', 'client_code', 'side', 'symbol')
+
+# Alerts per day above which parsing is spread over a process pool
+OMS_PARALLEL_THRESHOLD = int(os.getenv('OMS_PARALLEL_THRESHOLD', '200'))
+OMS_PARSER_WORKERS = int(os.getenv('OMS_PARSER_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Clean-text fallback patterns
+OMS_REF_PATTERN = re.compile(r'(BUY\d{5}|SELL\d{5})')
+OMS_ISIN_PATTERN = re.compile(r'INE[A-Z0-9]{9}')
+OMS_KNOWN_SYMBOLS = (
+    'MANAPPURAM FINANCE LTD',
+    'EDELWEISS FINANCIAL SERVICES LTD',
+    'ICICI PRUDENTIAL BSE LIQUID RATE ETF',
+    'NIPPON INDIA NIFTY 1D RATE LIQUID BEES ETF',
+    'SONA BLW PRECISION FORGINGS LTD'
+)
+
+
+def map_oms_header_row(row: List[str]) -> Optional[Dict[int, str]]:
+    """
+    Map a header row to OMS columns.
+    
+    Args:
+        row: Header cells
+    
+    Returns:
+        {cell index: column} or None if the row is not an OMS header
+    """
+    mapping = {}
+    used = set()
+    for index, cell in enumerate(row):
+        header = cell.strip().lower()
+        if not header:
+            continue
+        for column, keywords in OMS_HEADER_ALIASES:
+            if column not in used and any(keyword in header for keyword in keywords):
+                mapping[index] = column
+                used.add(column)
+                break
+    if 'client_code' in used and len(used) >= 3:
+        return mapping
+    return None
+
+
+def parse_oms_table_rows(content: str) -> List[Dict[str, str]]:
+    """
+    Extract order rows from the OMS alert HTML table(s).
+    
+    Columns are located from the header row, so added, removed or reordered
+    columns still parse; tables without a header use the default 10-column layout.
+    
+    Args:
+        content: HTML content of the alert email
+    
+    Returns:
+        List of order dictionaries keyed by OMS column names
+    """
+    orders = []
+    for table in extract_tables_fast(content):
+        mapping = None
+        for row in table:
+            # Header detection only runs until the table's header row has been seen
+            if mapping is None:
+                mapping = map_oms_header_row(row)
+                if mapping is not None:
+                    continue
+            
+            if mapping is not None:
+                order = {column: row[index] for index, column in mapping.items() if index < len(row)}
+                required = [column for column in OMS_REQUIRED_COLUMNS if column in mapping.values()]
+            elif len(row) == len(OMS_TABLE_COLUMNS):
+                order = dict(zip(OMS_TABLE_COLUMNS, row))
+                # Same requirement as the fixed layout always had: every column except trade date
+                required = [column for column in OMS_TABLE_COLUMNS if column != 'trade_date']
+            else:
+                continue
+            
+            if 'client_code' not in order or not all(order.get(column) for column in required):
+                continue
+            orders.append(order)
+    return orders
 
 def analyze_oms_order_alert_email(subject: str, sender: str, clean_text: str, attachment_info: str = "", html_content: str = "") -> Dict[str, Any]:
     """
@@ -29,7 +137,7 @@ def analyze_oms_order_alert_email(subject: str, sender: str, clean_text: str, at
     result = {
         "ai_email_intent": "oms_order_alert",
         "ai_confidence_score": "100",
-        "ai_reasoning": "Fixed structure OMS order alert parsed with Python regex",
+        "ai_reasoning": "Fixed structure OMS order alert parsed with Python HTML table parser",
         "ai_order_details": [],
         "ai_instruction_type": "oms_alert"
     }
@@ -41,50 +149,25 @@ def analyze_oms_order_alert_email(subject: str, sender: str, clean_text: str, at
     # HTML content has proper table structure that can be parsed reliably
     content_to_parse = html_content if html_content else clean_text
     
-    # Extract data from HTML table structure using a more flexible approach
+    # Extract data from the HTML table structure in a single streaming pass
     # Find ALL table rows with data (not just the first one)
-    table_row_pattern = r'<tr><td[^>]*>([^<]+)</td><td[^>]*>([^<]*)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td><td[^>]*>([^<]+)</td></tr>'
-    
-    table_matches = re.findall(table_row_pattern, content_to_parse, re.IGNORECASE | re.DOTALL)
-    if table_matches:
-        for match in table_matches:
-            # Extract table data in order: Ref.no, Trade Date, Client Code, Client Name, Account Type, Product, Transaction Type, Scheme/Scrip, ISIN, LOB
-            ref_no = match[0].strip()
-            trade_date = match[1].strip()
-            client_code = match[2].strip()
-            client_name = match[3].strip()
-            account_type = match[4].strip()
-            product = match[5].strip()
-            transaction_type = match[6].strip()
-            symbol = match[7].strip()
-            isin = match[8].strip()
-            lob = match[9].strip()
-            
-            order_details = {
-                'ref_no': ref_no,
-                'trade_date': trade_date,
-                'client_code': client_code,
-                'client_name': client_name,
-                'account_type': account_type,
-                'product': product,
-                'side': transaction_type,
-                'symbol': symbol,
-                'isin': isin,
-                'lob': lob
-            }
-            all_orders.append(order_details)
+    # Columns: Ref.no, Trade Date, Client Code, Client Name, Account Type, Product, Transaction Type, Scheme/Scrip, ISIN, LOB
+    table_orders = parse_oms_table_rows(content_to_parse)
+    if table_orders:
+        all_orders.extend(table_orders)
     else:
         # Fallback: Extract from clean_text using known patterns
         # The clean_text contains: "BUY00644105897RAJANI SARANNON-POALISTED EQBUYMANAPPURAM FINANCE LTDINE522D01027NWM"
         
         # Extract ALL reference numbers first
-        order_refs = re.findall(r'(BUY\d{5}|SELL\d{5})', clean_text)
+        order_refs = OMS_REF_PATTERN.findall(clean_text)
+        isin_match = OMS_ISIN_PATTERN.search(clean_text)
         for ref_no in order_refs:
             order_details = {}
             order_details['ref_no'] = ref_no
             
             # Extract client code - 6 digits after the order ref
-            client_code_match = re.search(rf'{ref_no}(\d{{6}})', clean_text)
+            client_code_match = re.search(rf'{re.escape(ref_no)}(\d{{6}})', clean_text)
             if client_code_match:
                 order_details['client_code'] = client_code_match.group(1)
             
@@ -112,21 +195,12 @@ def analyze_oms_order_alert_email(subject: str, sender: str, clean_text: str, at
                 order_details['side'] = 'SELL'
             
             # Extract symbol and ISIN - look for common patterns
-            symbol_patterns = [
-                r'MANAPPURAM FINANCE LTD',
-                r'EDELWEISS FINANCIAL SERVICES LTD',
-                r'ICICI PRUDENTIAL BSE LIQUID RATE ETF',
-                r'NIPPON INDIA NIFTY 1D RATE LIQUID BEES ETF',
-                r'SONA BLW PRECISION FORGINGS LTD'
-            ]
-            
-            for pattern in symbol_patterns:
+            for pattern in OMS_KNOWN_SYMBOLS:
                 if pattern in clean_text:
                     order_details['symbol'] = pattern
                     break
             
             # Extract ISIN
-            isin_match = re.search(r'INE[A-Z0-9]{9}', clean_text)
             if isin_match:
                 order_details['isin'] = isin_match.group(0)
             
@@ -203,6 +277,29 @@ def create_empty_oms_results_file() -> str:
         print(f"❌ Error creating empty OMS results file: {e}")
         return None
 
+def _analyze_oms_email(email: Dict[str, Any]):
+    """
+    Analyze one OMS email (top-level so it can run in a worker process).
+    
+    Returns:
+        (analysis, None) on success or (None, error message) on failure
+    """
+    try:
+        # PERMANENT FIX: Pass HTML content for reliable parsing (Option 2)
+        # HTML has fixed table structure that can be parsed correctly per-row
+        html_content = email.get('body', {}).get('content', '') if isinstance(email.get('body'), dict) else ''
+        
+        analysis = analyze_oms_order_alert_email(
+            subject=email.get('subject', ''),
+            sender=email.get('sender', ''),
+            clean_text=email.get('clean_text', ''),
+            attachment_info=email.get('attachment_info', ''),
+            html_content=html_content
+        )
+        return analysis, None
+    except Exception as e:
+        return None, str(e)
+
 def process_oms_emails_from_file(input_file: str) -> str:
     """
     Process OMS order alert emails from a JSON file.
@@ -239,47 +336,41 @@ def process_oms_emails_from_file(input_file: str) -> str:
         # Create an empty but valid output file to indicate successful processing with no results
         return create_empty_oms_results_file()
     
-    # Process each OMS email
+    # Process each OMS email (large days are parsed on a process pool, results stay in email order)
     processed_emails = []
     total_orders = 0
     
-    for i, email in enumerate(emails, 1):
+    if len(emails) >= OMS_PARALLEL_THRESHOLD and OMS_PARSER_WORKERS > 1:
+        print(f"📋 Parsing {len(emails)} OMS emails on {OMS_PARSER_WORKERS} worker processes")
+        chunksize = max(1, len(emails) // (OMS_PARSER_WORKERS * 4))
+        with multiprocessing.Pool(OMS_PARSER_WORKERS) as pool:
+            outcomes = pool.map(_analyze_oms_email, emails, chunksize=chunksize)
+    else:
+        outcomes = map(_analyze_oms_email, emails)
+    
+    for i, (email, (analysis, error)) in enumerate(zip(emails, outcomes), 1):
         print(f"📋 Processing OMS email {i}/{len(emails)}: {email.get('subject', 'N/A')}")
         
-        try:
-            # Analyze the OMS email
-            # PERMANENT FIX: Pass HTML content for reliable parsing (Option 2)
-            # HTML has fixed table structure that can be parsed correctly per-row
-            html_content = email.get('body', {}).get('content', '') if isinstance(email.get('body'), dict) else ''
-            
-            analysis = analyze_oms_order_alert_email(
-                subject=email.get('subject', ''),
-                sender=email.get('sender', ''),
-                clean_text=email.get('clean_text', ''),
-                attachment_info=email.get('attachment_info', ''),
-                html_content=html_content
-            )
-            
-            # Create processed email structure
-            processed_email = {
-                'email_id': f"oms_{i}",
-                'subject': email.get('subject', ''),
-                'sender': email.get('sender', ''),
-                'date': email.get('date', ''),
-                'ai_analysis': analysis,
-                'original_email': email
-            }
-            
-            processed_emails.append(processed_email)
-            
-            # Count orders found
-            orders_found = len(analysis.get('ai_order_details', []))
-            total_orders += orders_found
-            print(f"   ✅ Found {orders_found} order(s)")
-            
-        except Exception as e:
-            print(f"   ❌ Error processing email: {e}")
+        if error:
+            print(f"   ❌ Error processing email: {error}")
             continue
+        
+        # Create processed email structure
+        processed_email = {
+            'email_id': f"oms_{i}",
+            'subject': email.get('subject', ''),
+            'sender': email.get('sender', ''),
+            'date': email.get('date', ''),
+            'ai_analysis': analysis,
+            'original_email': email
+        }
+        
+        processed_emails.append(processed_email)
+        
+        # Count orders found
+        orders_found = len(analysis.get('ai_order_details', []))
+        total_orders += orders_found
+        print(f"   ✅ Found {orders_found} order(s)")
     
     # Create output structure
     output_data = {
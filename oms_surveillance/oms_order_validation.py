@@ -22,6 +22,12 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from wealth_spectrum_api_client import WealthSpectrumAPIClient
 
+# Shared OrderBook loader lives in the surveillance base directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from order_book import load_order_book, normalize_order_id, CandidateIndex
+from instrument_resolver import get_resolver
+from ai_concurrency import call_with_retry, run_keyed_concurrently
+
 # Initialize OpenAI client (same as email surveillance)
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
@@ -35,7 +41,6 @@ class OMSOrderValidator:
     def __init__(self):
         """Initialize the OMS order validator."""
         self.api_client = WealthSpectrumAPIClient()
-        self.client_master_data = None
     
     def load_oms_surveillance_results(self, date: str) -> Optional[Dict]:
         """
@@ -100,15 +105,11 @@ class OMSOrderValidator:
         
         logger.info(f"Found {len(client_codes)} unique client codes to map")
         
-        # Fetch client master data if not already available
-        if self.client_master_data is None:
-            self.client_master_data = self.api_client.fetch_client_master_data()
-        
-        if not self.client_master_data:
+        # Map client codes via the cached client master index (fetches only when the snapshot expired)
+        if self.api_client.get_client_index() is None:
             logger.error("Failed to fetch client master data")
             return {}
         
-        # Map client codes
         mapping_results = self.api_client.batch_map_client_codes(list(client_codes))
         
         # Filter out None values
@@ -159,34 +160,27 @@ class OMSOrderValidator:
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         order_file = os.path.join(base_dir, month_name, 'Order Files', f'OrderBook-Closed-{orderbook_date}.csv')
         logger.info(f"[KL LOAD] Looking for OrderBook file: {order_file}")
-        print(f"[PRINT KL LOAD] path={order_file} exists={os.path.exists(order_file)}")
         if not os.path.exists(order_file):
             logger.error(f"OrderBook file not found: {order_file}")
             return None
         
-        try:
-            # Load all orders from OrderBook file
-            # Use pandas defaults (works in direct test) with low_memory disabled
-            df = pd.read_csv(order_file, low_memory=False)
-            logger.info(f"[KL LOAD] Loaded {len(df)} total orders from {order_file}")
-            logger.info(f"[KL LOAD] Columns: {list(df.columns)}")
-            print(f"[PRINT KL LOAD] rows={len(df)} cols_sample={list(df.columns)[:6]}")
-            
-            # Filter for KL orders (User column starts with 'KL') - same as email surveillance
-            if 'User' in df.columns:
-                kl_orders = df[df['User'].astype(str).str.startswith('KL', na=False)]
-                logger.info(f"[KL LOAD] Filtered to {len(kl_orders)} KL orders (User starts with 'KL')")
-                print(f"[PRINT KL LOAD] KL rows={len(kl_orders)}")
-                if len(kl_orders) == 0:
-                    logger.warning("[KL LOAD] KL filter returned 0 rows; sample User values: %s", df['User'].astype(str).head(5).tolist())
-                    print(f"[PRINT KL LOAD] KL sample users={df['User'].astype(str).head(5).tolist()}")
-                return kl_orders
-            else:
-                logger.error(f"[KL LOAD] 'User' column not found in OrderBook file: {order_file}")
-                return None
-        except Exception as e:
-            logger.error(f"[KL LOAD] Error loading OrderBook file: {e}")
+        # Shared typed loader (IDs as strings, cached per file hash) - same frame as email surveillance
+        order_book = load_order_book(orderbook_date, base_dir=base_dir, order_file=order_file)
+        if order_book is None:
+            logger.error(f"[KL LOAD] Error loading OrderBook file: {order_file}")
+            return None
+        
+        logger.info(f"[KL LOAD] Loaded {len(order_book.orders)} total orders from {order_file}")
+        if 'User' not in order_book.orders.columns:
+            logger.error(f"[KL LOAD] 'User' column not found in OrderBook file: {order_file}")
             return None
+        
+        # Filter for KL orders (User column starts with 'KL') - same as email surveillance
+        kl_orders = order_book.kl_orders
+        logger.info(f"[KL LOAD] Filtered to {len(kl_orders)} KL orders (User starts with 'KL')")
+        if len(kl_orders) == 0:
+            logger.warning("[KL LOAD] KL filter returned 0 rows; sample User values: %s", order_book.orders['User'].astype(str).head(5).tolist())
+        return kl_orders
 
     def _build_noren_to_exch_mapping(self, date: str) -> Dict[str, str]:
         """
@@ -227,39 +221,18 @@ class OMSOrderValidator:
             logger.warning(f"OrderBook file not found for mapping: {order_file}")
             return mapping
 
-        try:
-            df = pd.read_csv(order_file, low_memory=False)
-            if 'NorenOrderID' in df.columns and 'ExchOrderID' in df.columns:
-                for _, row in df.iterrows():
-                    n = str(row['NorenOrderID']) if pd.notna(row['NorenOrderID']) else ''
-                    e = str(row['ExchOrderID']) if pd.notna(row['ExchOrderID']) else ''
-                    # Normalize both sides to plain strings without trailing .0
-                    if n.endswith('.0'):
-                        n = n[:-2]
-                    if e.endswith('.0'):
-                        e = e[:-2]
-                    if n and e:
-                        mapping[n] = e
-            else:
-                logger.warning("Required columns not found in OrderBook for mapping: need 'NorenOrderID' and 'ExchOrderID'")
-        except Exception as e:
-            logger.error(f"Error building Noren->Exch mapping: {e}")
+        # IDs are normalized strings (no trailing .0) and the map is precomputed by the loader
+        order_book = load_order_book(orderbook_date, base_dir=base_dir, order_file=order_file)
+        if order_book is None:
+            logger.error("Error building Noren->Exch mapping: OrderBook could not be loaded")
+            return mapping
+        mapping.update(order_book.noren_to_exch)
         return mapping
 
     @staticmethod
     def _normalize_order_id(order_id: Any) -> Optional[str]:
         """Normalize possibly scientific or float-like order IDs to string, same as email surveillance."""
-        if pd.isna(order_id):
-            return None
-        try:
-            normalized = str(int(float(order_id)))
-            return normalized
-        except (ValueError, TypeError):
-            try:
-                s = str(order_id)
-                return s[:-2] if s.endswith('.0') else s
-            except Exception:
-                return None
+        return normalize_order_id(order_id)
     
     def match_oms_to_orders(self, oms_data: Dict, kl_orders: pd.DataFrame, client_mapping: Dict[str, str]) -> Dict[str, Dict]:
         """
@@ -275,7 +248,13 @@ class OMSOrderValidator:
         """
         
         oms_order_mapping = {}
+        # Built once per day: client code -> symbol -> KL order rows
+        candidate_index = CandidateIndex(kl_orders)
+        resolver = get_resolver()
+        resolver.add_order_book(kl_orders)
         
+        # Phase 1: collect the AI matching tasks (client mapping + local symbol resolution)
+        tasks = []
         for alert in oms_data.get('oms_order_alerts', []):
             details = alert.get('ai_analysis', {}).get('ai_order_details', [])
             # Normalize to a list of dicts
@@ -294,55 +273,83 @@ class OMSOrderValidator:
                     continue
                 
                 # Find matching KL orders for this client
-                client_orders = kl_orders[kl_orders['ClientID'] == actual_client_code]
+                client_orders = candidate_index.candidates(actual_client_code)
                 
                 if client_orders.empty:
                     logger.warning(f"No KL orders found for client code: {actual_client_code}")
                     continue
                 
-                # Use AI matching (EXACT same as email surveillance system)
-                ai_result = self.match_oms_to_orders_with_ai(order, client_orders)
+                # Resolve scheme/scrip name or ISIN locally to narrow the orders sent to AI
+                resolved_symbol, _, method = resolver.resolve(
+                    order.get('symbol'), isin=order.get('isin'),
+                    candidates=candidate_index.symbols(actual_client_code))
+                if resolved_symbol:
+                    logger.info(f"Resolved OMS symbol '{order.get('symbol')}' -> {resolved_symbol} ({method})")
+                    client_orders = candidate_index.candidates(actual_client_code, resolved_symbol)
                 
-                # Process AI matching results (same as email surveillance)
-                matched_order_ids = ai_result.get('matched_order_ids', [])
-                confidence_score = ai_result.get('confidence_score', 0)
-                match_type = ai_result.get('match_type', 'NO_MATCH')
-                reasoning = ai_result.get('reasoning', '')
-                discrepancies = ai_result.get('discrepancies', [])
+                tasks.append((actual_client_code, (order, oms_client_code, client_orders)))
+        
+        # Phase 2: AI calls run concurrently across clients (AI_MATCH_CONCURRENCY), serially per client
+        ai_results = run_keyed_concurrently(
+            tasks, lambda task: self.match_oms_to_orders_with_ai(task[0], task[2]))
+        
+        # Phase 3: deterministic reduce in alert order - same mapping as a serial run
+        for (_, (order, oms_client_code, client_orders)), ai_result in zip(tasks, ai_results):
+            if isinstance(ai_result, Exception) or ai_result is None:
+                logger.error(f"❌ AI matching failed for OMS order {order.get('order_id')}: {ai_result}")
+                continue
+            
+            # Process AI matching results (same as email surveillance)
+            matched_order_ids = ai_result.get('matched_order_ids', [])
+            confidence_score = ai_result.get('confidence_score', 0)
+            match_type = ai_result.get('match_type', 'NO_MATCH')
+            reasoning = ai_result.get('reasoning', '')
+            discrepancies = ai_result.get('discrepancies', [])
+            
+            if matched_order_ids:
+                for order_id in matched_order_ids:
+                    # PERMANENT FIX: Handle multiple OMS orders matching the same KL order
+                    # If this KL order already has an OMS match, append the new OMS Order ID
+                    if order_id in oms_order_mapping:
+                        existing_oms_id = oms_order_mapping[order_id].get('OMS_Order_ID', '')
+                        new_oms_id = order.get('order_id', '')
+                        # Append new OMS Order ID if different
+                        if new_oms_id and new_oms_id != existing_oms_id:
+                            oms_order_mapping[order_id]['OMS_Order_ID'] = f"{existing_oms_id}, {new_oms_id}"
+                            logger.info(f"📋 Multiple OMS orders match same KL order {order_id}: {existing_oms_id} and {new_oms_id}")
+                    else:
+                        # First match for this KL order
+                        oms_order_mapping[order_id] = {
+                            'OMS_Order_ID': order.get('order_id'),
+                            'OMS_Symbol': order.get('symbol'),
+                            'OMS_Quantity': order.get('quantity'),
+                            'OMS_Price': order.get('price'),
+                            'OMS_Side': order.get('buy_sell'),
+                            'OMS_Client_Code': oms_client_code,
+                            'OMS_Confidence_Score': f"{confidence_score}%",
+                            'OMS_Match_Type': 'OMS_MATCH',
+                            'OMS_AI_Reasoning': reasoning,
+                            'OMS_Discrepancies': discrepancies,
+                            'OMS_Review_Required': ai_result.get('review_required', False)
+                        }
                 
-                if matched_order_ids:
-                    for order_id in matched_order_ids:
-                        # PERMANENT FIX: Handle multiple OMS orders matching the same KL order
-                        # If this KL order already has an OMS match, append the new OMS Order ID
-                        if order_id in oms_order_mapping:
-                            existing_oms_id = oms_order_mapping[order_id].get('OMS_Order_ID', '')
-                            new_oms_id = order.get('order_id', '')
-                            # Append new OMS Order ID if different
-                            if new_oms_id and new_oms_id != existing_oms_id:
-                                oms_order_mapping[order_id]['OMS_Order_ID'] = f"{existing_oms_id}, {new_oms_id}"
-                                logger.info(f"📋 Multiple OMS orders match same KL order {order_id}: {existing_oms_id} and {new_oms_id}")
-                        else:
-                            # First match for this KL order
-                            oms_order_mapping[order_id] = {
-                                'OMS_Order_ID': order.get('order_id'),
-                                'OMS_Symbol': order.get('symbol'),
-                                'OMS_Quantity': order.get('quantity'),
-                                'OMS_Price': order.get('price'),
-                                'OMS_Side': order.get('buy_sell'),
-                                'OMS_Client_Code': oms_client_code,
-                                'OMS_Confidence_Score': f"{confidence_score}%",
-                                'OMS_Match_Type': 'OMS_MATCH',
-                                'OMS_AI_Reasoning': reasoning,
-                                'OMS_Discrepancies': discrepancies,
-                                'OMS_Review_Required': ai_result.get('review_required', False)
-                            }
-                    
-                    logger.info(f"✅ AI matched OMS order {order.get('order_id')} to {len(matched_order_ids)} KL orders (confidence: {confidence_score}%)")
-                    logger.info(f"   Reasoning: {reasoning}")
-                else:
-                    logger.warning(f"❌ AI found no matches for OMS order {order.get('order_id')}")
-                    logger.warning(f"   Reasoning: {reasoning}")
+                # Confirmed single-symbol matches teach the resolver the alert's name and ISIN
+                matched_symbols = set(client_orders.loc[client_orders['NorenOrderID'].isin(
+                    [normalize_order_id(oid) for oid in matched_order_ids]), 'Symbol'].astype(str))
+                try:
+                    confident = float(confidence_score) >= 90
+                except (TypeError, ValueError):
+                    confident = False
+                if len(matched_symbols) == 1 and confident:
+                    resolver.learn(order.get('symbol'), next(iter(matched_symbols)), isin=order.get('isin'))
+                
+                logger.info(f"✅ AI matched OMS order {order.get('order_id')} to {len(matched_order_ids)} KL orders (confidence: {confidence_score}%)")
+                logger.info(f"   Reasoning: {reasoning}")
+            else:
+                logger.warning(f"❌ AI found no matches for OMS order {order.get('order_id')}")
+                logger.warning(f"   Reasoning: {reasoning}")
         
+        resolver.save_learned()
         logger.info(f"Successfully matched {len(oms_order_mapping)} OMS orders to KL orders using AI")
         return oms_order_mapping
     
@@ -375,8 +382,8 @@ class OMSOrderValidator:
             available_orders.append({
                 'order_id': str(order.get('NorenOrderID', '')),
                 'symbol': str(order.get('Symbol', '')),
-                'quantity': order.get('Qty', 0),
-                'price': order.get('Price', 0),
+                'quantity': int(order['Qty']) if pd.notna(order.get('Qty')) else 0,
+                'price': float(order['Price']) if pd.notna(order.get('Price')) else 0,
                 'side': str(order.get('BuySell', '')),
                 'status': str(order.get('Status', '')),
                 'client_code': str(order.get('ClientID', '')),
@@ -439,13 +446,15 @@ class OMSOrderValidator:
             logger.info(f"🔍 OMS Order: {oms_order.get('symbol')} - {oms_order.get('buy_sell')}")
             logger.info(f"🔍 Available orders: {len(available_orders)}")
             
-            response = client.chat.completions.create(
+            response = call_with_retry(
+                client.chat.completions.create,
                 model="gpt-4.1",
                 messages=[
                     {"role": "system", "content": "You are a trade surveillance expert. Match OMS orders to KL orders accurately."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1
+                temperature=0.1,
+                description=f"OMS AI matching for {oms_order.get('order_id')}"
             )
             
             ai_response = response.choices[0].message.content.strip()
@@ -662,7 +671,7 @@ class OMSOrderValidator:
             # Update existing email match columns with OMS data
             for order_id, oms_data in oms_order_mapping.items():
                 # Convert NorenOrderID (from AI) to ExchOrderID used in Excel, then normalize
-                exch_id = noren_to_exch.get(str(order_id), str(order_id))
+                exch_id = noren_to_exch.get(normalize_order_id(order_id), str(order_id))
                 normalized_target = normalize_order_id_value(exch_id)
                 mask_numeric = df_order_id_str == normalized_target
                 if has_lower_order_id:
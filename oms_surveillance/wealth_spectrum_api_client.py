@@ -4,8 +4,10 @@ Wealth Spectrum API Client
 Client for interacting with the Wealth Spectrum API to map client codes.
 """
 
+import os
 import requests
 import json
+import sqlite3
 import logging
 from typing import Dict, Optional, List
 from datetime import datetime, timedelta
@@ -14,6 +16,14 @@ from datetime import datetime, timedelta
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Local client master snapshot (SQLite) - refreshed incrementally once older than the TTL
+CLIENT_MASTER_CACHE_FILE = os.getenv(
+    'CLIENT_MASTER_CACHE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client_master_cache.sqlite')
+)
+CLIENT_MASTER_TTL_HOURS = float(os.getenv('CLIENT_MASTER_TTL_HOURS', '24'))
+CLIENT_MASTER_HISTORY_DAYS = 180
+
 class WealthSpectrumAPIClient:
     """Client for Wealth Spectrum API operations."""
     
@@ -32,6 +42,12 @@ class WealthSpectrumAPIClient:
             'Authorization': f'Bearer {auth_token}',
             'Content-Type': 'application/json'
         }
+        self.cache_file = CLIENT_MASTER_CACHE_FILE
+        # USERNAME / CLIENTCODE -> REFCODE6
+        self._client_index: Optional[Dict[str, str]] = None
+        self._client_index_loaded_at: Optional[datetime] = None
+        # One extra incremental refresh per run when codes are missing from a fresh snapshot
+        self._refreshed_on_miss = False
     
     def fetch_client_master_data(self, from_date: str = None, to_date: str = None) -> Optional[Dict]:
         """
@@ -92,48 +108,190 @@ class WealthSpectrumAPIClient:
             logger.error(f"Unexpected error: {e}")
             return None
     
+    # ------------------------------------------------------------------ snapshot
+
+    def _connect_cache(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.cache_file)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS clients ("
+            "record_key TEXT PRIMARY KEY, username TEXT, clientcode TEXT, refcode6 TEXT, "
+            "record TEXT, seq INTEGER)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    @staticmethod
+    def _record_key(client: Dict) -> str:
+        return f"{client.get('CLIENTCODE', '')}|{client.get('USERNAME', '')}"
+
+    def _save_snapshot(self, records: List[Dict], to_date: str, full: bool):
+        """Upsert fetched records into the snapshot and record the covered date range"""
+        try:
+            conn = self._connect_cache()
+            with conn:
+                if full:
+                    conn.execute("DELETE FROM clients")
+                next_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM clients").fetchone()[0] + 1
+                rows = []
+                for offset, client in enumerate(records):
+                    rows.append((
+                        self._record_key(client),
+                        str(client.get('USERNAME', '')),
+                        str(client.get('CLIENTCODE', '')),
+                        str(client.get('REFCODE6', '') or ''),
+                        json.dumps(client, default=str),
+                        next_seq + offset
+                    ))
+                conn.executemany("INSERT OR REPLACE INTO clients VALUES (?, ?, ?, ?, ?, ?)", rows)
+                now = datetime.now().isoformat()
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed_at', ?)", (now,))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('to_date', ?)", (to_date,))
+                if full:
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('full_refresh_at', ?)", (now,))
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write client master snapshot {self.cache_file}: {e}")
+
+    def _load_snapshot(self):
+        """Return (rows ordered by fetch order, meta dict) or (None, {}) when there is no snapshot"""
+        if not os.path.exists(self.cache_file):
+            return None, {}
+        try:
+            conn = self._connect_cache()
+            rows = conn.execute("SELECT username, clientcode, refcode6 FROM clients ORDER BY seq").fetchall()
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            conn.close()
+            return rows, meta
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read client master snapshot {self.cache_file}: {e}")
+            return None, {}
+
+    @staticmethod
+    def _build_index(rows) -> Dict[str, str]:
+        """USERNAME / CLIENTCODE -> REFCODE6; the first record with a valid REFCODE6 wins, as in the old linear scan"""
+        index: Dict[str, str] = {}
+        for username, clientcode, refcode6 in rows:
+            if not refcode6 or refcode6 == "-":
+                continue
+            index.setdefault(str(username), refcode6)
+            index.setdefault(str(clientcode), refcode6)
+        index.pop('', None)
+        return index
+
+    def refresh_client_master_cache(self, force_full: bool = False) -> Optional[Dict[str, str]]:
+        """
+        Bring the local snapshot up to date and rebuild the in-memory index.
+
+        A missing snapshot (or force_full) fetches the full history window; an
+        expired one only fetches records from the last covered date (fDate/tDate).
+        If the API is unreachable the stale snapshot is still used.
+
+        Args:
+            force_full: Re-fetch the full history window
+        
+        Returns:
+            Code index (USERNAME / CLIENTCODE -> REFCODE6) or None if no data is available
+        """
+        rows, meta = (None, {}) if force_full else self._load_snapshot()
+        today = datetime.now().strftime('%Y-%m-%d')
+
+        refreshed_at = meta.get('refreshed_at')
+        is_fresh = False
+        if rows is not None and refreshed_at:
+            age = datetime.now() - datetime.fromisoformat(refreshed_at)
+            is_fresh = age < timedelta(hours=CLIENT_MASTER_TTL_HOURS)
+
+        if rows is None or not rows:
+            data = self.fetch_client_master_data()
+            if data is not None:
+                self._save_snapshot(data.get('data', []), today, full=True)
+                rows, meta = self._load_snapshot()
+        elif not is_fresh:
+            rows, meta = self._incremental_refresh(rows, meta)
+        else:
+            logger.info(f"Using client master snapshot from {refreshed_at} ({len(rows)} records)")
+
+        if not rows:
+            return None
+        self._client_index = self._build_index(rows)
+        self._client_index_loaded_at = datetime.now()
+        return self._client_index
+
+    def _incremental_refresh(self, rows, meta):
+        """Fetch records from the last covered date onwards (fDate/tDate) into the snapshot"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        from_date = meta.get('to_date') or (datetime.now() - timedelta(days=CLIENT_MASTER_HISTORY_DAYS)).strftime('%Y-%m-%d')
+        data = self.fetch_client_master_data(from_date=from_date, to_date=today)
+        if data is None:
+            logger.warning(f"Client master refresh failed, using snapshot from {meta.get('refreshed_at')}")
+            return rows, meta
+        logger.info(f"Incremental client master refresh: {len(data.get('data', []))} records since {from_date}")
+        self._save_snapshot(data.get('data', []), today, full=False)
+        return self._load_snapshot()
+
+    def _refresh_on_miss(self, missing: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Codes missing from a snapshot younger than the TTL may belong to clients
+        onboarded since it was refreshed: merge one incremental refresh per run.
+
+        Returns:
+            The rebuilt index, or None when this run already refreshed (or nothing changed)
+        """
+        if self._refreshed_on_miss:
+            return None
+        self._refreshed_on_miss = True
+        rows, meta = self._load_snapshot()
+        if not rows:
+            return None
+        logger.info(f"{len(missing)} code(s) not in the client master snapshot, refreshing incrementally")
+        rows, _ = self._incremental_refresh(rows, meta)
+        if not rows:
+            return None
+        self._client_index = self._build_index(rows)
+        self._client_index_loaded_at = datetime.now()
+        return self._client_index
+
+    def get_client_index(self) -> Optional[Dict[str, str]]:
+        """In-memory USERNAME / CLIENTCODE -> REFCODE6 index (loaded from the snapshot once per TTL)"""
+        if self._client_index is not None and self._client_index_loaded_at and \
+                datetime.now() - self._client_index_loaded_at < timedelta(hours=CLIENT_MASTER_TTL_HOURS):
+            return self._client_index
+        return self.refresh_client_master_cache()
+
+    # ------------------------------------------------------------------ mapping
+
     def map_wealth_spectrum_to_actual_client_code(self, wealth_spectrum_code: str, client_master_data: Dict = None) -> Optional[str]:
         """
         Map Wealth Spectrum client code to actual client code (REFCODE6).
         
         Args:
             wealth_spectrum_code: The client code from Wealth Spectrum (USERNAME or CLIENTCODE)
-            client_master_data: Pre-fetched client master data (optional)
+            client_master_data: Pre-fetched client master data (optional, otherwise the cached index is used)
         
         Returns:
             Actual client code (REFCODE6) or None if not found
         """
         
-        # Fetch client master data if not provided
-        if client_master_data is None:
-            client_master_data = self.fetch_client_master_data()
-            if not client_master_data:
+        if client_master_data is not None:
+            rows = [(c.get("USERNAME", ""), c.get("CLIENTCODE", ""), c.get("REFCODE6", "")) for c in client_master_data.get("data", [])]
+            index = self._build_index(rows)
+        else:
+            index = self.get_client_index()
+            if index is None:
                 logger.error("Failed to fetch client master data")
                 return None
         
-        try:
-            # Search for the client code in the data
-            if "data" in client_master_data:
-                for client in client_master_data["data"]:
-                    username = str(client.get("USERNAME", ""))
-                    clientcode = str(client.get("CLIENTCODE", ""))
-                    
-                    # Check if either USERNAME or CLIENTCODE matches
-                    if username == str(wealth_spectrum_code) or clientcode == str(wealth_spectrum_code):
-                        actual_client_code = client.get("REFCODE6", "")
-                        if actual_client_code and actual_client_code != "-":
-                            logger.info(f"Mapped Wealth Spectrum code {wealth_spectrum_code} to actual client code {actual_client_code}")
-                            return actual_client_code
-                        else:
-                            logger.warning(f"Found matching client but REFCODE6 is empty or invalid: {actual_client_code}")
-                            continue
-            
-            logger.warning(f"No mapping found for Wealth Spectrum code: {wealth_spectrum_code}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error mapping client code {wealth_spectrum_code}: {e}")
-            return None
+        actual_client_code = index.get(str(wealth_spectrum_code))
+        if not actual_client_code and client_master_data is None:
+            refreshed = self._refresh_on_miss([wealth_spectrum_code])
+            if refreshed is not None:
+                actual_client_code = refreshed.get(str(wealth_spectrum_code))
+        if actual_client_code:
+            logger.info(f"Mapped Wealth Spectrum code {wealth_spectrum_code} to actual client code {actual_client_code}")
+            return actual_client_code
+        
+        logger.warning(f"No mapping found for Wealth Spectrum code: {wealth_spectrum_code}")
+        return None
     
     def batch_map_client_codes(self, wealth_spectrum_codes: List[str]) -> Dict[str, Optional[str]]:
         """
@@ -146,17 +304,19 @@ class WealthSpectrumAPIClient:
             Dictionary mapping Wealth Spectrum codes to actual client codes
         """
         
-        # Fetch client master data once
-        client_master_data = self.fetch_client_master_data()
-        if not client_master_data:
+        # Cached snapshot index - network I/O only when the snapshot is missing or expired,
+        # or once per run when codes are missing from it
+        index = self.get_client_index()
+        if index is None:
             logger.error("Failed to fetch client master data for batch mapping")
             return {code: None for code in wealth_spectrum_codes}
         
-        # Map each code
-        results = {}
-        for code in wealth_spectrum_codes:
-            actual_code = self.map_wealth_spectrum_to_actual_client_code(code, client_master_data)
-            results[code] = actual_code
+        results = {code: index.get(str(code)) for code in wealth_spectrum_codes}
+        missing = [code for code, mapped in results.items() if not mapped]
+        if missing:
+            refreshed = self._refresh_on_miss(missing)
+            if refreshed is not None:
+                results.update({code: refreshed.get(str(code)) for code in missing})
         
         logger.info(f"Batch mapping completed: {len([v for v in results.values() if v])} successful mappings out of {len(wealth_spectrum_codes)} codes")
         return results
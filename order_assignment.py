@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Globally optimal one-to-one assignment of email instruction groups to KL orders.
+
+Each group is first matched on its own (deterministic tiers or the LLM), which
+gives a proposal per group. Proposals can overlap - two groups of the same
+client claiming the same order - and the old first-come used_orders check
+simply marked the later group ORDER_CONFLICT, so results depended on dict
+order. Here, per client:
+
+1. every group x candidate order pair is scored in one vectorized pass
+   (symbol, side, quantity, price, and whether the group's matcher proposed it)
+2. each group gets a few options: its proposal, single orders, and split
+   executions found by subset-sum on quantities
+3. the options are assigned jointly so no order is used twice and the total
+   score is maximal - linear_sum_assignment (scipy, or the numpy Hungarian
+   below) when every option is a single order, exact branch-and-bound over
+   option sets otherwise
+
+Groups the matcher found nothing for (NO_MATCH) are treated the same for
+every client, overlapping proposals or not: they only gain an order set no
+other group proposed that fits their quantity exactly with
+UNMATCHED_MIN_CONFIDENCE. Disjoint proposals are kept as they are.
+"""
+import os
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from order_book import CandidateIndex, normalize_client_code
+from order_matching import parse_quantity, parse_price, PRICE_TOLERANCE
+from instrument_resolver import get_resolver
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Pair score weights
+SYMBOL_POINTS = 40
+SIDE_POINTS = 20
+QUANTITY_POINTS = 25
+PRICE_POINTS = 15
+MARKET_PRICE_POINTS = 10
+PROPOSED_POINTS = 50
+# Bonus for an option whose quantities sum exactly to the instruction
+QUANTITY_FIT_POINTS = 30
+
+MAX_SINGLE_OPTIONS = int(os.getenv('ASSIGNMENT_MAX_SINGLE_OPTIONS', '5'))
+MAX_SUBSET_ORDERS = int(os.getenv('ASSIGNMENT_MAX_SUBSET_ORDERS', '16'))
+MAX_SUBSET_OPTIONS = 10
+MAX_SEARCH_NODES = int(os.getenv('ASSIGNMENT_MAX_SEARCH_NODES', '200000'))
+# A group the matcher found nothing for only gains an order set that fits its
+# quantity exactly with at least this confidence (symbol + side + quantity)
+UNMATCHED_MIN_CONFIDENCE = int(os.getenv('ASSIGNMENT_UNMATCHED_MIN_CONFIDENCE', '85'))
+
+
+def hungarian(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum-cost assignment for a rectangular cost matrix (numpy fallback when scipy is missing).
+
+    Args:
+        cost: 2-D cost matrix
+
+    Returns:
+        (row_indices, column_indices) like scipy.optimize.linear_sum_assignment
+    """
+    if SCIPY_AVAILABLE:
+        return linear_sum_assignment(cost)
+
+    cost = np.asarray(cost, dtype=float)
+    n_rows, n_cols = cost.shape
+    transposed = n_rows > n_cols
+    if transposed:
+        cost = cost.T
+        n_rows, n_cols = n_cols, n_rows
+
+    # Shortest augmenting path (Jonker-Volgenant style) with potentials, 1-based
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    match = np.zeros(n_cols + 1, dtype=int)  # match[col] = row
+    way = np.zeros(n_cols + 1, dtype=int)
+    for row in range(1, n_rows + 1):
+        match[0] = row
+        col0 = 0
+        minv = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while True:
+            used[col0] = True
+            row0 = match[col0]
+            free = ~used[1:]
+            reduced = cost[row0 - 1] - u[row0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = col0
+            candidates = np.where(free, minv[1:], np.inf)
+            col1 = int(np.argmin(candidates)) + 1
+            delta = candidates[col1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            col0 = col1
+            if match[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            match[col0] = match[col1]
+            col0 = col1
+
+    rows, cols = [], []
+    for col in range(1, n_cols + 1):
+        if match[col]:
+            rows.append(match[col] - 1)
+            cols.append(col - 1)
+    rows, cols = np.array(rows, dtype=int), np.array(cols, dtype=int)
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+class _ClientOrders:
+    """Column arrays of one client's candidate orders"""
+
+    def __init__(self, candidate_index: CandidateIndex, client_code: str):
+        self.positions = candidate_index.positions(client_code)
+        frame = candidate_index.orders.iloc[self.positions]
+        self.records = frame.to_dict('records')
+        self.ids = np.array([str(r.get('NorenOrderID')) for r in self.records], dtype=object)
+        self.symbols = np.array([str(r.get('Symbol', '')).strip().upper() for r in self.records], dtype=object)
+        self.sides = np.array([str(r.get('BuySell', '')).strip().upper()[:1] for r in self.records], dtype=object)
+        self.qty = frame['Qty'].to_numpy(dtype=float, na_value=np.nan) if 'Qty' in frame.columns else np.full(len(frame), np.nan)
+        self.price = frame['Price'].to_numpy(dtype=float, na_value=np.nan) if 'Price' in frame.columns else np.full(len(frame), np.nan)
+        self.id_to_column = {order_id: i for i, order_id in enumerate(self.ids)}
+
+
+def _group_profile(match_result: Dict, orders: _ClientOrders) -> Dict:
+    """Instruction attributes used for scoring (resolved symbols, sides, quantities, prices)"""
+    instruction = match_result.get('email_instruction') or {}
+    resolver = get_resolver()
+    client_symbols = sorted(set(orders.symbols))
+    symbols, sides, quantities, prices, market = set(), set(), [], [], False
+    for item in instruction.get('instructions') or []:
+        resolved, _, _ = resolver.resolve(item.get('symbol'), candidates=client_symbols)
+        if resolved:
+            symbols.add(resolved)
+        side = str(item.get('buy_sell') or '').strip().upper()[:1]
+        if side in ('B', 'S'):
+            sides.add(side)
+        quantity = parse_quantity(item.get('quantity'))
+        if quantity is not None:
+            quantities.append(quantity)
+        price, is_market = parse_price(item.get('price'))
+        if price is not None:
+            prices.append(price)
+        market = market or is_market
+
+    proposed = [orders.id_to_column[str(o.get('NorenOrderID'))] for o in match_result.get('matched_orders', [])
+                if str(o.get('NorenOrderID')) in orders.id_to_column]
+    return {
+        'symbols': symbols, 'sides': sides, 'quantities': quantities,
+        'prices': prices, 'market': market, 'proposed': sorted(set(proposed))
+    }
+
+
+def score_pairs(profiles: List[Dict], orders: _ClientOrders) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every group x order pair of one client.
+
+    Returns:
+        (scores, eligible) - both shaped (groups, orders)
+    """
+    n_groups, n_orders = len(profiles), len(orders.ids)
+    scores = np.zeros((n_groups, n_orders))
+    eligible = np.zeros((n_groups, n_orders), dtype=bool)
+    for g, profile in enumerate(profiles):
+        symbol_ok = np.isin(orders.symbols, list(profile['symbols'])) if profile['symbols'] else np.zeros(n_orders, dtype=bool)
+        side_ok = np.isin(orders.sides, list(profile['sides'])) if profile['sides'] else np.ones(n_orders, dtype=bool)
+        qty_ok = np.isin(orders.qty, profile['quantities']) if profile['quantities'] else np.zeros(n_orders, dtype=bool)
+        if profile['prices']:
+            price_diff = np.min(np.abs(orders.price[:, None] - np.array(profile['prices'])[None, :]), axis=1)
+            price_points = np.where(price_diff <= PRICE_TOLERANCE, PRICE_POINTS, 0)
+        else:
+            price_points = np.full(n_orders, MARKET_PRICE_POINTS if profile['market'] else 0)
+        proposed = np.zeros(n_orders, dtype=bool)
+        proposed[profile['proposed']] = True
+
+        scores[g] = (symbol_ok * SYMBOL_POINTS + side_ok * SIDE_POINTS + qty_ok * QUANTITY_POINTS
+                     + price_points + proposed * PROPOSED_POINTS)
+        # Orders are only considered for a group on a resolved symbol + side, or when its matcher proposed them
+        eligible[g] = (symbol_ok & side_ok) | proposed
+    return scores, eligible
+
+
+def _subset_sums(columns: List[int], qty: np.ndarray, target: int) -> List[Tuple[int, ...]]:
+    """Subsets (size >= 2) of the given order columns whose quantities sum exactly to target"""
+    columns = [c for c in columns if not np.isnan(qty[c]) and 0 < qty[c] <= target][:MAX_SUBSET_ORDERS]
+    results = []
+    # sums: partial sum -> a few subsets reaching it
+    sums: Dict[float, List[Tuple[int, ...]]] = {0.0: [()]}
+    for column in columns:
+        additions = {}
+        for total, subsets in sums.items():
+            new_total = total + qty[column]
+            if new_total > target:
+                continue
+            for subset in subsets:
+                additions.setdefault(new_total, []).append(subset + (column,))
+        for total, subsets in additions.items():
+            bucket = sums.setdefault(total, [])
+            bucket.extend(subsets[:max(0, MAX_SUBSET_OPTIONS - len(bucket))])
+    for subset in sums.get(float(target), []):
+        if len(subset) >= 2:
+            results.append(subset)
+    return results[:MAX_SUBSET_OPTIONS]
+
+
+def _group_options(g: int, profile: Dict, scores: np.ndarray, eligible: np.ndarray,
+                   orders: _ClientOrders, claimed=frozenset()) -> List[Tuple[float, Tuple[int, ...]]]:
+    """
+    Candidate order sets for one group with their values (always includes the empty option).
+
+    A group without a proposal (NO_MATCH) only gets sets of orders no group proposed
+    (claimed) that fit its quantity exactly with UNMATCHED_MIN_CONFIDENCE.
+    """
+    columns = [int(c) for c in np.flatnonzero(eligible[g])]
+    unmatched = not profile['proposed']
+    if unmatched:
+        columns = [c for c in columns if c not in claimed]
+    targets = set(profile['quantities'])
+    if len(profile['quantities']) > 1:
+        targets.add(sum(profile['quantities']))
+
+    bundles = set()
+    if profile['proposed']:
+        bundles.add(tuple(profile['proposed']))
+    for column in sorted(columns, key=lambda c: -scores[g, c])[:MAX_SINGLE_OPTIONS]:
+        bundles.add((column,))
+    for target in targets:
+        for subset in _subset_sums(columns, orders.qty, target):
+            bundles.add(tuple(sorted(subset)))
+
+    options = [(0.0, ())]
+    for bundle in bundles:
+        value = float(np.mean(scores[g, list(bundle)]))
+        bundle_qty = float(np.nansum(orders.qty[list(bundle)]))
+        fits = any(abs(bundle_qty - t) < 1e-9 for t in targets)
+        if unmatched and (not fits or _bundle_confidence(bundle, profile, scores[g], orders)[0]
+                          < UNMATCHED_MIN_CONFIDENCE):
+            continue
+        if fits:
+            value += QUANTITY_FIT_POINTS
+        options.append((value, bundle))
+    options.sort(key=lambda option: -option[0])
+    return options
+
+
+def _solve_options(options: List[List[Tuple[float, Tuple[int, ...]]]]) -> List[Tuple[int, ...]]:
+    """Pick one option per group, no order used twice, maximal total value"""
+    n_groups = len(options)
+
+    if all(len(bundle) <= 1 for group in options for _, bundle in group):
+        # Pure one-to-one case: rectangular assignment with a "no order" column per group
+        columns = sorted({bundle[0] for group in options for _, bundle in group if bundle})
+        column_index = {c: i for i, c in enumerate(columns)}
+        big = 1e9
+        cost = np.full((n_groups, len(columns) + n_groups), big)
+        for g, group in enumerate(options):
+            cost[g, len(columns) + g] = 0.0
+            for value, bundle in group:
+                if bundle:
+                    cost[g, column_index[bundle[0]]] = -value
+        rows, cols = hungarian(cost)
+        chosen = [()] * n_groups
+        for row, col in zip(rows, cols):
+            if col < len(columns) and cost[row, col] < big:
+                chosen[row] = (columns[col],)
+        return chosen
+
+    # Exact branch-and-bound over option sets; groups with fewest options first
+    order = sorted(range(n_groups), key=lambda g: len(options[g]))
+    best_remaining = [0.0] * (n_groups + 1)
+    for i in range(n_groups - 1, -1, -1):
+        best_remaining[i] = best_remaining[i + 1] + options[order[i]][0][0]
+
+    best = {'value': -1.0, 'choice': None}
+    nodes = [0]
+    current = [()] * n_groups
+
+    def search(i, used, value):
+        nodes[0] += 1
+        if value + best_remaining[i] <= best['value'] or nodes[0] > MAX_SEARCH_NODES:
+            return
+        if i == n_groups:
+            best['value'], best['choice'] = value, list(current)
+            return
+        g = order[i]
+        for option_value, bundle in options[g]:
+            if used.isdisjoint(bundle):
+                current[g] = bundle
+                search(i + 1, used | set(bundle), value + option_value)
+        current[g] = ()
+
+    search(0, frozenset(), 0.0)
+    if nodes[0] > MAX_SEARCH_NODES:
+        logger.warning(f"Assignment search capped at {MAX_SEARCH_NODES} nodes, using best found")
+    if best['choice'] is None:
+        # Greedy fallback: highest-value options first
+        best['choice'] = [()] * n_groups
+        used = set()
+        for g in sorted(range(n_groups), key=lambda g: -options[g][0][0]):
+            for _, bundle in options[g]:
+                if used.isdisjoint(bundle):
+                    best['choice'][g] = bundle
+                    used.update(bundle)
+                    break
+    return best['choice']
+
+
+def _bundle_confidence(bundle: Tuple[int, ...], profile: Dict, pair_scores: np.ndarray,
+                       orders: _ClientOrders) -> Tuple[int, bool]:
+    """
+    Confidence (0-100) of a bundle chosen by the assignment, from its pair scores.
+
+    The matcher's proposal bonus is left out, and the quantity points count in
+    full when the bundle's quantities sum to the instruction (split executions).
+
+    Returns:
+        (confidence, every field matched)
+    """
+    columns = list(bundle)
+    proposed = np.isin(columns, profile['proposed'])
+    base = pair_scores[columns] - proposed * PROPOSED_POINTS
+    qty_points = np.where(np.isin(orders.qty[columns], profile['quantities']), QUANTITY_POINTS, 0)
+    targets = set(profile['quantities'])
+    if len(profile['quantities']) > 1:
+        targets.add(sum(profile['quantities']))
+    bundle_qty = float(np.nansum(orders.qty[columns]))
+    if any(abs(bundle_qty - t) < 1e-9 for t in targets):
+        base = base - qty_points + QUANTITY_POINTS
+    confidence = int(round(float(np.min(base))))
+    full = SYMBOL_POINTS + SIDE_POINTS + QUANTITY_POINTS + PRICE_POINTS
+    return max(0, min(confidence, full)), confidence >= full
+
+
+def _apply_choice(match_result: Dict, bundle: Tuple[int, ...], profile: Dict, orders: _ClientOrders,
+                  claimed_by: Dict[int, str], pair_scores: np.ndarray):
+    proposed = tuple(profile['proposed'])
+    if bundle == proposed:
+        match_result['assignment'] = 'proposed' if bundle else 'unassigned'
+        return
+
+    had_proposal = bool(proposed)
+    match_result['matched_orders'] = [orders.records[c] for c in bundle]
+    discrepancies = match_result.setdefault('discrepancies', [])
+    if not bundle:
+        match_result['assignment'] = 'unassigned'
+        if had_proposal:
+            lost = [orders.ids[c] for c in proposed]
+            owners = sorted({claimed_by[c] for c in proposed if c in claimed_by})
+            match_result['match_type'] = 'ORDER_CONFLICT'
+            discrepancies.append(f"Orders {', '.join(lost)} assigned to another instruction ({', '.join(owners)})")
+        return
+
+    match_result['assignment'] = 'reassigned'
+    # The old confidence / match type described the matcher's result, not this bundle
+    confidence, all_fields_match = _bundle_confidence(bundle, profile, pair_scores, orders)
+    match_result['confidence_score'] = confidence
+    if len(bundle) > 1:
+        match_result['match_type'] = 'SPLIT_EXECUTION'
+    else:
+        match_result['match_type'] = 'EXACT_MATCH' if all_fields_match else 'PARTIAL_MATCH'
+    assigned = ', '.join(orders.ids[c] for c in bundle)
+    if had_proposal:
+        discrepancies.append(f"Reassigned by global assignment: orders {assigned} "
+                             f"instead of {', '.join(orders.ids[c] for c in proposed)}")
+    else:
+        discrepancies.append(f"Matcher found no match; orders {assigned} assigned by global assignment "
+                             f"(confidence {confidence}%)")
+    review_flags = match_result.setdefault('review_flags', [])
+    review_flags.append({'type': 'GLOBAL_REASSIGNMENT', 'reason': 'Order set chosen by one-to-one assignment'})
+
+
+def assign_orders_globally(match_results: List[Dict], candidate_index: CandidateIndex) -> List[Dict]:
+    """
+    Resolve overlapping group proposals into a one-to-one instruction <-> order assignment.
+
+    Args:
+        match_results: Per-group match results (email_instruction, matched_orders, ...)
+        candidate_index: Per-day KL order index
+
+    Returns:
+        The same results, updated in place: matched_orders re-chosen where needed and an
+        'assignment' field ('proposed', 'reassigned', 'unassigned') on every result
+    """
+    by_client: Dict[str, List[int]] = {}
+    for i, result in enumerate(match_results):
+        client_code = normalize_client_code((result.get('email_instruction') or {}).get('client_code'))
+        if client_code and candidate_index.has_client(client_code):
+            by_client.setdefault(client_code, []).append(i)
+        else:
+            result['assignment'] = 'unassigned' if not result.get('matched_orders') else 'proposed'
+
+    for client_code, indices in by_client.items():
+        orders = _ClientOrders(candidate_index, client_code)
+        profiles = [_group_profile(match_results[i], orders) for i in indices]
+
+        claimed = [c for p in profiles for c in p['proposed']]
+        overlapping = len(claimed) != len(set(claimed))
+        options = None
+        if overlapping or not all(p['proposed'] for p in profiles):
+            scores, eligible = score_pairs(profiles, orders)
+            options = []
+            for g, profile in enumerate(profiles):
+                if profile['proposed'] and not overlapping:
+                    # Disjoint proposals stand; only groups without one may gain orders
+                    proposal = tuple(profile['proposed'])
+                    options.append([(float(np.mean(scores[g, list(proposal)])), proposal)])
+                else:
+                    options.append(_group_options(g, profile, scores, eligible, orders, set(claimed)))
+        # Nothing to resolve when proposals are disjoint and no NO_MATCH group has a fitting order set
+        if options is None or (not overlapping and not any(
+                bundle for g, profile in enumerate(profiles) if not profile['proposed'] for _, bundle in options[g])):
+            for i in indices:
+                match_results[i]['assignment'] = 'proposed' if match_results[i].get('matched_orders') else 'unassigned'
+            continue
+
+        choice = _solve_options(options)
+
+        claimed_by = {}
+        for g, bundle in enumerate(choice):
+            for column in bundle:
+                claimed_by[column] = (match_results[indices[g]].get('email_instruction') or {}).get('group_id', '')
+        for g, i in enumerate(indices):
+            _apply_choice(match_results[i], tuple(choice[g]), profiles[g], orders, claimed_by, scores[g])
+        logger.info(f"Global assignment for {client_code}: {len(indices)} groups, {len(orders.ids)} orders, "
+                    f"{sum(1 for i in indices if match_results[i]['assignment'] == 'reassigned')} reassigned")
+    return match_results
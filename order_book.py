@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Shared OrderBook loader for all surveillance stages.
+
+Parses {Month}/Order Files/OrderBook-Closed-{DDMMYYYY}.csv once with an explicit
+schema (order IDs as strings, categorical User/Status/BuySell, numeric Qty/Price,
+parsed OrgTimeStamp) and exposes a KL-filtered view, a client/symbol candidate
+index and Noren <-> Exch order ID maps. The typed frame is cached next to the CSV
+(Parquet when pyarrow/fastparquet is installed, pickle otherwise), keyed by the
+CSV content hash, so every stage gets the same ready-typed frame without re-parsing.
+"""
+import os
+import glob
+import hashlib
+import logging
+from typing import Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MONTH_NAMES = {
+    1: "January", 2: "February", 3: "March", 4: "April",
+    5: "May", 6: "June", 7: "July", 8: "August",
+    9: "September", 10: "October", 11: "November", 12: "December"
+}
+
+ORDER_FILE_PATTERNS = ["OrderBook-Closed-{date}.csv", "OrderBook_Closed-{date}.csv"]
+CACHE_DIR_NAME = ".orderbook_cache"
+
+# Explicit schema - everything not listed stays a string
+ID_COLUMNS = ['NorenOrderID', 'ExchOrderID']
+CATEGORICAL_COLUMNS = ['User', 'Status', 'BuySell']
+INTEGER_COLUMNS = ['Qty', 'FillShares', 'DisclosedQty']
+FLOAT_COLUMNS = ['Price', 'AvgPrice', 'TriggerPrice']
+TIMESTAMP_COLUMN = 'OrgTimeStamp'
+PARSED_TIMESTAMP_COLUMN = 'OrgTimeStamp_dt'
+
+_memory_cache: Dict[str, "OrderBook"] = {}
+
+
+def normalize_client_code(client_code) -> Optional[str]:
+    """
+    Canonical client code used for order lookups.
+
+    Email/OMS instructions write the same account as EOWM00542, WM00542 or a bare
+    number, while the OrderBook has NEOWM00542 / NEO12345.
+
+    Args:
+        client_code: Client code as written in an email, OMS alert or OrderBook
+
+    Returns:
+        Upper-case canonical code or None for empty values
+    """
+    if client_code is None:
+        return None
+    code = str(client_code).strip().upper()
+    if not code or code == 'NAN':
+        return None
+    if code.startswith('EOWM'):
+        return f'NEOWM{code[4:]}'  # EOWM00542 -> NEOWM00542
+    if code.startswith('WM'):
+        return f'NEO{code}'  # WM00542 -> NEOWM00542
+    if code.isdigit():
+        return f'NEO{code}'
+    return code
+
+
+def _symbol_key(symbol) -> str:
+    return str(symbol).strip().upper() if symbol is not None else ''
+
+
+class CandidateIndex:
+    """
+    Per-day lookup over KL orders: canonical client code -> symbol -> row positions.
+
+    Client codes are normalized once at build time, so matchers get their
+    candidate orders without scanning or copying the whole frame per instruction.
+    """
+
+    def __init__(self, orders: pd.DataFrame):
+        self.orders = orders
+        self._index: Dict[str, Dict[str, list]] = {}
+        if 'ClientID' not in orders.columns:
+            logger.warning("'ClientID' column not found in orders, candidate index is empty")
+            self._sides = []
+            return
+
+        symbols = orders['Symbol'] if 'Symbol' in orders.columns else [''] * len(orders)
+        sides = orders['BuySell'] if 'BuySell' in orders.columns else [''] * len(orders)
+        self._sides = [str(side).strip().upper()[:1] for side in sides]
+        for position, (client_id, symbol) in enumerate(zip(orders['ClientID'], symbols)):
+            client_key = normalize_client_code(client_id)
+            if client_key is None:
+                continue
+            self._index.setdefault(client_key, {}).setdefault(_symbol_key(symbol), []).append(position)
+
+    def positions(self, client_code, symbol=None, side=None) -> list:
+        """
+        Row positions (iloc) of candidate orders.
+
+        Args:
+            client_code: Client code in any of the accepted spellings
+            symbol: Restrict to this OrderBook symbol (None for all symbols of the client)
+            side: Restrict to BUY/SELL (matched on the first letter, None for both)
+
+        Returns:
+            List of row positions in ascending order
+        """
+        by_symbol = self._index.get(normalize_client_code(client_code), {})
+        if symbol is None:
+            positions = sorted(p for rows in by_symbol.values() for p in rows)
+        else:
+            positions = by_symbol.get(_symbol_key(symbol), [])
+        if side:
+            side_key = str(side).strip().upper()[:1]
+            positions = [p for p in positions if self._sides[p] == side_key]
+        return positions
+
+    def candidates(self, client_code, symbol=None, side=None) -> pd.DataFrame:
+        """Candidate orders as a DataFrame slice (empty frame when none)"""
+        return self.orders.iloc[self.positions(client_code, symbol, side)]
+
+    def symbols(self, client_code) -> list:
+        """OrderBook symbols traded by a client"""
+        return sorted(self._index.get(normalize_client_code(client_code), {}).keys())
+
+    def has_client(self, client_code) -> bool:
+        return normalize_client_code(client_code) in self._index
+
+
+def normalize_order_id(order_id) -> Optional[str]:
+    """
+    Normalize an order ID (str, int, float or scientific notation) to a plain digit string.
+
+    Args:
+        order_id: Order ID value from a CSV, Excel sheet or JSON file
+
+    Returns:
+        Normalized ID string or None for empty values
+    """
+    if order_id is None:
+        return None
+    try:
+        if pd.isna(order_id):
+            return None
+    except (TypeError, ValueError):
+        pass
+    s = str(order_id).strip()
+    if not s or s.lower() == 'nan':
+        return None
+    if s.isdigit():
+        return s
+    if s.endswith('.0') and s[:-2].isdigit():
+        return s[:-2]
+    try:
+        # Scientific notation from Excel/float round-trips
+        return str(int(float(s)))
+    except (ValueError, OverflowError):
+        return s
+
+
+class OrderBook:
+    """Typed OrderBook for one trading day"""
+
+    def __init__(self, orders: pd.DataFrame, source_path: str):
+        self.orders = orders
+        self.source_path = source_path
+        self._kl_orders = None
+        self._noren_to_exch = None
+        self._exch_to_noren = None
+
+    @property
+    def kl_orders(self) -> pd.DataFrame:
+        """Orders placed by KL users (User starts with 'KL')"""
+        if self._kl_orders is None:
+            if 'User' in self.orders.columns:
+                mask = self.orders['User'].astype(str).str.startswith('KL', na=False)
+                self._kl_orders = self.orders[mask]
+            else:
+                logger.warning(f"'User' column not found in {self.source_path}, KL view is empty")
+                self._kl_orders = self.orders.iloc[0:0]
+        return self._kl_orders
+
+    def _build_id_maps(self):
+        self._noren_to_exch = {}
+        self._exch_to_noren = {}
+        if 'NorenOrderID' not in self.orders.columns or 'ExchOrderID' not in self.orders.columns:
+            logger.warning("Required columns not found in OrderBook for mapping: need 'NorenOrderID' and 'ExchOrderID'")
+            return
+        pairs = self.orders[['NorenOrderID', 'ExchOrderID']].dropna()
+        for noren_id, exch_id in zip(pairs['NorenOrderID'], pairs['ExchOrderID']):
+            if noren_id and exch_id:
+                self._noren_to_exch.setdefault(noren_id, exch_id)
+                self._exch_to_noren.setdefault(exch_id, noren_id)
+
+    @property
+    def noren_to_exch(self) -> Dict[str, str]:
+        """NorenOrderID -> ExchOrderID (both normalized strings)"""
+        if self._noren_to_exch is None:
+            self._build_id_maps()
+        return self._noren_to_exch
+
+    @property
+    def exch_to_noren(self) -> Dict[str, str]:
+        """ExchOrderID -> NorenOrderID (both normalized strings)"""
+        if self._exch_to_noren is None:
+            self._build_id_maps()
+        return self._exch_to_noren
+
+
+def find_order_book_file(date_str: str, base_dir: str = None) -> Optional[str]:
+    """
+    Locate the OrderBook CSV for a date.
+
+    Args:
+        date_str: Date in DDMMYYYY format
+        base_dir: Surveillance base directory (defaults to the repository root)
+
+    Returns:
+        Path to the CSV or None if not found
+    """
+    base_dir = base_dir or BASE_DIR
+    try:
+        month_name = MONTH_NAMES[int(date_str[2:4])]
+    except (ValueError, KeyError):
+        logger.error(f"Invalid date format: {date_str}. Expected DDMMYYYY")
+        return None
+
+    order_dir = os.path.join(base_dir, month_name, 'Order Files')
+    for pattern in ORDER_FILE_PATTERNS:
+        path = os.path.join(order_dir, pattern.format(date=date_str))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _parse_timestamps(values: pd.Series) -> pd.Series:
+    # Order files use DD-MM-YYYY HH:MM:SS; fall back to dayfirst parsing for other layouts
+    parsed = pd.to_datetime(values, format='%d-%m-%Y %H:%M:%S', errors='coerce')
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], dayfirst=True, errors='coerce')
+    return parsed
+
+
+def parse_order_book_csv(path: str) -> pd.DataFrame:
+    """
+    Parse an OrderBook CSV with the explicit schema.
+
+    Args:
+        path: Path to the OrderBook CSV
+
+    Returns:
+        Typed DataFrame
+    """
+    df = pd.read_csv(path, dtype=str, keep_default_na=True, low_memory=False)
+    df.columns = [c.strip() for c in df.columns]
+
+    for column in ID_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(normalize_order_id)
+    for column in ('ClientID', 'Symbol'):
+        if column in df.columns:
+            df[column] = df[column].str.strip()
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            values = pd.to_numeric(df[column].str.replace(',', ''), errors='coerce')
+            # Keep int64 like pandas inference did when every value is a whole number
+            if values.notna().all() and (values == values.round()).all():
+                values = values.astype('int64')
+            df[column] = values
+    for column in FLOAT_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column].str.replace(',', ''), errors='coerce')
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    if TIMESTAMP_COLUMN in df.columns:
+        df[PARSED_TIMESTAMP_COLUMN] = _parse_timestamps(df[TIMESTAMP_COLUMN])
+    return df
+
+
+def _read_cache(cache_base: str) -> Optional[pd.DataFrame]:
+    if os.path.exists(cache_base + '.parquet'):
+        try:
+            return pd.read_parquet(cache_base + '.parquet')
+        except Exception as e:
+            logger.warning(f"Could not read OrderBook parquet cache: {e}")
+    if os.path.exists(cache_base + '.pkl'):
+        try:
+            return pd.read_pickle(cache_base + '.pkl')
+        except Exception as e:
+            logger.warning(f"Could not read OrderBook pickle cache: {e}")
+    return None
+
+
+def _write_cache(df: pd.DataFrame, cache_base: str, csv_name: str):
+    cache_dir = os.path.dirname(cache_base)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Drop caches of older versions of the same CSV
+    for stale in glob.glob(os.path.join(cache_dir, f"{csv_name}.*")):
+        if not stale.startswith(cache_base):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    try:
+        df.to_parquet(cache_base + '.parquet', index=False)
+        return
+    except ImportError:
+        logger.info("pyarrow/fastparquet not installed, caching OrderBook as pickle")
+    except Exception as e:
+        logger.warning(f"Could not write OrderBook parquet cache: {e}")
+    try:
+        df.to_pickle(cache_base + '.pkl')
+    except Exception as e:
+        logger.warning(f"Could not write OrderBook pickle cache: {e}")
+
+
+def load_order_book(date_str: str, base_dir: str = None, order_file: str = None) -> Optional[OrderBook]:
+    """
+    Load the typed OrderBook for a date, using the per-file cache when valid.
+
+    Args:
+        date_str: Date in DDMMYYYY format
+        base_dir: Surveillance base directory (defaults to the repository root)
+        order_file: Explicit CSV path (skips the month directory lookup)
+
+    Returns:
+        OrderBook or None if the file is missing or unreadable
+    """
+    path = order_file or find_order_book_file(date_str, base_dir)
+    if not path or not os.path.exists(path):
+        logger.error(f"OrderBook file not found for {date_str}")
+        return None
+
+    try:
+        file_hash = _file_hash(path)
+    except OSError as e:
+        logger.error(f"Error reading OrderBook file {path}: {e}")
+        return None
+
+    memory_key = f"{os.path.abspath(path)}:{file_hash}"
+    if memory_key in _memory_cache:
+        return _memory_cache[memory_key]
+
+    csv_name = os.path.basename(path)
+    cache_base = os.path.join(os.path.dirname(path), CACHE_DIR_NAME, f"{csv_name}.{file_hash[:16]}")
+
+    df = _read_cache(cache_base)
+    if df is not None:
+        logger.info(f"Loaded {len(df)} orders from OrderBook cache for {csv_name}")
+    else:
+        try:
+            df = parse_order_book_csv(path)
+        except Exception as e:
+            logger.error(f"Error loading OrderBook file {path}: {e}")
+            return None
+        logger.info(f"Parsed {len(df)} orders from {path}")
+        _write_cache(df, cache_base, csv_name)
+
+    book = OrderBook(df, path)
+    _memory_cache[memory_key] = book
+    return book
+
+
+def load_kl_orders(date_str: str, base_dir: str = None) -> Optional[pd.DataFrame]:
+    """
+    Convenience wrapper returning only the KL-filtered orders for a date.
+
+    Args:
+        date_str: Date in DDMMYYYY format
+        base_dir: Surveillance base directory (defaults to the repository root)
+
+    Returns:
+        DataFrame of KL orders or None if the OrderBook could not be loaded
+    """
+    book = load_order_book(date_str, base_dir)
+    return book.kl_orders if book is not None else None
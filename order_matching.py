@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Deterministic pre-matching of email instruction groups to KL orders.
+
+Most instruction groups are trivially resolvable: the client has one order
+whose symbol, side and quantity equal the instruction, or a handful of fills
+whose quantities sum exactly to it. These are decided here in tiers, and only
+the residual ambiguous groups are sent to the LLM matcher:
+
+- exact:           one candidate order with the instruction's quantity
+- split_execution: all candidate orders (client + symbol + side) sum to the quantity
+- symbol_alias:    as above, after resolving the email's symbol text with the
+                   instrument resolver (aliases, learned names, fuzzy index)
+
+Every result records the deciding tier in 'match_tier'. Price mismatches,
+orders that are not Complete and fuzzy (approximate) symbol resolutions are
+never decided here - their confidence always falls below
+DETERMINISTIC_MIN_CONFIDENCE - and neither are groups whose instructions land
+on the same order.
+"""
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from order_book import CandidateIndex
+from instrument_resolver import get_resolver
+
+logger = logging.getLogger(__name__)
+
+DETERMINISTIC_MIN_CONFIDENCE = int(os.getenv('DETERMINISTIC_MIN_CONFIDENCE', '90'))
+
+# Confidence penalty by how the instruction symbol was resolved. A fuzzy
+# resolution alone always drops below DETERMINISTIC_MIN_CONFIDENCE, so those
+# groups go to the LLM matcher instead of being decided here
+SYMBOL_METHOD_PENALTY = {'exact': 0, 'isin': 0, 'learned': 3, 'alias': 5, 'fuzzy': 15}
+
+MARKET_PRICE_WORDS = ('CMP', 'CURRENT MARKET PRICE', 'MARKET PRICE', 'MARKET', 'MKT', 'AT MARKET')
+PRICE_TOLERANCE = 0.01
+# A price mismatch needs judgement: this penalty always drops the group below
+# DETERMINISTIC_MIN_CONFIDENCE so it goes to the LLM matcher
+PRICE_MISMATCH_PENALTY = 15
+# Same for an order that is not Complete (rejected / cancelled): whether the
+# instruction was carried out needs judgement
+STATUS_PENALTY = 15
+
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def resolve_symbol(email_symbol, order_symbols: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Resolve the symbol written in an email to one of the client's OrderBook symbols.
+
+    Args:
+        email_symbol: Symbol or security name from the email instruction
+        order_symbols: Symbols the client traded that day (upper case)
+
+    Returns:
+        (order_symbol, method) with the resolver method ('exact', 'isin',
+        'alias', 'learned' or 'fuzzy'), or (None, None)
+    """
+    if not email_symbol or not order_symbols:
+        return None, None
+    symbol, _score, method = get_resolver().resolve(email_symbol, candidates=order_symbols)
+    return symbol, method
+
+
+def parse_quantity(value) -> Optional[int]:
+    """Plain share quantity ('1,500', 1500, '1500.0'); None for value-based or missing quantities"""
+    if value is None:
+        return None
+    text = str(value).replace(',', '').strip()
+    try:
+        quantity = float(text)
+    except ValueError:
+        return None
+    if quantity <= 0 or quantity != int(quantity):
+        return None
+    return int(quantity)
+
+
+def parse_price(value) -> Tuple[Optional[float], bool]:
+    """
+    Parse an instruction price.
+
+    Returns:
+        (price, is_market) - price is None for market orders or unparseable values
+    """
+    if value is None:
+        return None, False
+    text = str(value).strip().upper()
+    if not text:
+        return None, False
+    if text in MARKET_PRICE_WORDS:
+        return None, True
+    match = _NUMBER.search(text.replace(',', ''))
+    return (float(match.group(0)), False) if match else (None, False)
+
+
+def _side_key(value) -> str:
+    return str(value or '').strip().upper()[:1]
+
+
+def _order_price(order: Dict) -> Optional[float]:
+    price = order.get('Price')
+    return float(price) if price is not None and pd.notna(price) else None
+
+
+def _match_instruction(instruction: Dict, candidate_index: CandidateIndex, client_code: str,
+                       order_symbols: List[str]) -> Optional[Dict]:
+    """Decide one instruction deterministically, or None if it is ambiguous"""
+    order_symbol, symbol_how = resolve_symbol(instruction.get('symbol'), order_symbols)
+    quantity = parse_quantity(instruction.get('quantity'))
+    side = _side_key(instruction.get('buy_sell'))
+    if not order_symbol or quantity is None or side not in ('B', 'S'):
+        return None
+
+    candidates = candidate_index.candidates(client_code, order_symbol, side)
+    if candidates.empty:
+        return None
+    orders = candidates.to_dict('records')
+
+    exact = [order for order in orders if order.get('Qty') == quantity]
+    if len(exact) == 1:
+        matched, tier = exact, 'exact'
+    elif len(exact) > 1:
+        # Same quantity placed more than once - needs judgement
+        return None
+    elif len(orders) > 1 and sum(order.get('Qty') or 0 for order in orders) == quantity:
+        matched, tier = orders, 'split_execution'
+    else:
+        return None
+    confidence = (100 if tier == 'exact' else 95) - SYMBOL_METHOD_PENALTY.get(symbol_how, 0)
+    if symbol_how != 'exact':
+        tier = 'symbol_alias'
+    discrepancies = []
+
+    price, is_market = parse_price(instruction.get('price'))
+    for order in matched:
+        order_price = _order_price(order)
+        if is_market:
+            discrepancies.append(f"Price: Market price vs Actual Price ₹{order_price}")
+        elif price is not None and order_price is not None and abs(order_price - price) > PRICE_TOLERANCE:
+            discrepancies.append(f"Price Mismatch - Email: {instruction.get('price')}, Order: {order_price}")
+            confidence -= PRICE_MISMATCH_PENALTY
+        status = str(order.get('Status', '') or '')
+        if status and status.upper() != 'COMPLETE':
+            discrepancies.append(f"Order Status: {status} (order was placed but not completed)")
+            confidence -= STATUS_PENALTY
+
+    return {
+        'orders': matched,
+        'tier': tier,
+        'confidence': max(confidence, 0),
+        'discrepancies': discrepancies,
+        'order_symbol': order_symbol
+    }
+
+
+def match_group_deterministically(final_instruction: Dict, candidate_index: CandidateIndex) -> Optional[Dict]:
+    """
+    Try to match an instruction group (see extract_final_instruction) without the LLM.
+
+    Args:
+        final_instruction: Group with 'client_code' and a list of 'instructions'
+        candidate_index: Per-day KL order index
+
+    Returns:
+        Match result in the email validation format with 'match_tier', or None when
+        any instruction is ambiguous or confidence is below DETERMINISTIC_MIN_CONFIDENCE
+    """
+    client_code = final_instruction.get('client_code')
+    instructions = final_instruction.get('instructions') or []
+    if not client_code or not instructions or not candidate_index.has_client(client_code):
+        return None
+
+    order_symbols = candidate_index.symbols(client_code)
+    decisions = []
+    for instruction in instructions:
+        decision = _match_instruction(instruction, candidate_index, client_code, order_symbols)
+        if decision is None:
+            return None
+        decisions.append(decision)
+
+    confidence = min(decision['confidence'] for decision in decisions)
+    if confidence < DETERMINISTIC_MIN_CONFIDENCE:
+        return None
+
+    matched_orders = []
+    seen = set()
+    discrepancies = []
+    for decision in decisions:
+        for order in decision['orders']:
+            # Two instructions on one order: only part of the instructed quantity
+            # was filled (or the email repeats itself) - the LLM decides
+            if order.get('NorenOrderID') in seen:
+                return None
+            seen.add(order.get('NorenOrderID'))
+            matched_orders.append(order)
+        discrepancies.extend(d for d in decision['discrepancies'] if d not in discrepancies)
+
+    tiers = [decision['tier'] for decision in decisions]
+    # The weakest tier decides the group
+    tier = next(t for t in ('symbol_alias', 'split_execution', 'exact') if t in tiers)
+    match_type = 'SPLIT_EXECUTION' if 'split_execution' in tiers or (
+        tier == 'symbol_alias' and any(len(d['orders']) > 1 for d in decisions)) else 'EXACT_MATCH'
+
+    review_flags = []
+    if any(d.startswith('Order Status:') for d in discrepancies):
+        review_flags.append({'type': 'STATUS_REVIEW', 'reason': 'Matched order(s) not Complete'})
+
+    return {
+        'email_instruction': final_instruction,
+        'matched_orders': matched_orders,
+        'match_type': match_type,
+        'confidence_score': confidence,
+        'discrepancies': discrepancies,
+        'review_flags': review_flags,
+        'match_tier': tier
+    }
@@ -5,30 +5,38 @@ from datetime import datetime
 from dotenv import load_dotenv
 import json
 from collections import defaultdict
-import re
 import numpy as np
+from transcript_store import get_transcript, get_turns, ingest_date
+from transcript_windows import TranscriptSource, build_transcript_excerpt, estimate_tokens
+from transcript_analysis_router import TranscriptAnalysisRouter
 
 # Load environment variables
 load_dotenv()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
-def read_transcript_file(filepath):
+def read_transcript(audio_file, transcripts_path):
+    """Transcript text from the transcript store ('' if there is none)"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return (get_transcript(audio_file, transcripts_path) or "").strip()
     except Exception as e:
-        print(f"Error reading {filepath}: {e}")
+        print(f"Error reading transcript for {audio_file}: {e}")
         return ""
 
-def get_transcript_path(filename, transcripts_path):
-    if filename.endswith('.wav'):
-        return os.path.join(transcripts_path, filename + '.txt')
-    elif filename.endswith('.wav.txt'):
-        return os.path.join(transcripts_path, filename)
-    else:
-        return os.path.join(transcripts_path, filename + '.txt')
+def read_transcript_source(audio_file, transcripts_path):
+    """Transcript text and speaker turns of one audio file (None if there is no transcript)"""
+    content = read_transcript(audio_file, transcripts_path)
+    if not content:
+        return None
+    try:
+        turns = get_turns(audio_file, transcripts_path) or []
+    except Exception as e:
+        print(f"Error reading speaker turns for {audio_file}: {e}")
+        turns = []
+    return TranscriptSource(audio_file, content, turns)
 
-def build_ai_prompt(order_group, transcript_content, audio_file):
+TRANSCRIPT_EXCERPT_HEADER = "Transcript excerpts (only the passages mentioning these orders, with surrounding turns; other turns are omitted):"
+
+def build_ai_prompt(order_group, transcript_content, audio_file, excerpt=False):
     prompt_orders = []
     for order in order_group:
         prompt_orders.append(f"Order ID: {order['order_id']}\n- Symbol: {order['symbol']}\n- Quantity: {order['quantity']}\n- Price: {order['price']}\n- Buy/Sell: {order['side']}\n- Order Time: {order['order_time']}")
@@ -37,7 +45,7 @@ The following orders are mapped to this call transcript (audio file: {audio_file
 
 {chr(10).join(prompt_orders)}
 
-Transcript:
+{TRANSCRIPT_EXCERPT_HEADER if excerpt else 'Transcript:'}
 {transcript_content}
 
 Instructions:
@@ -54,99 +62,20 @@ For each order, return a JSON object with these fields:
 - complaint ("yes"/"no"/"none", with brief explanation if yes)
 - action ("none"/"review"/"investigate"/"reverse")
 - ai_reasoning (brief explanation)
-Return a JSON array, one object per order. If an order is not discussed, set order_discussed to "no" and explain in ai_reasoning.
+- confidence (0 to 1, how certain you are of order_discussed, discrepancy and complaint for this order)
+Return one object per order in "orders", in the order listed above. If an order is not discussed, set order_discussed to "no" and explain in ai_reasoning.
 """
     return prompt
 
-def analyze_orders_with_audio(order_group, transcript_content, audio_file):
-    prompt = build_ai_prompt(order_group, transcript_content, audio_file)
-    prompt_length_chars = len(prompt)
-    prompt_length_words = len(prompt.split())
-    prompt_length_tokens = int(prompt_length_words * 0.75)  # rough estimate
-    print(f"[DEBUG] Prompt length for {audio_file}: {prompt_length_chars} chars, {prompt_length_words} words, ~{prompt_length_tokens} tokens")
-
-    def extract_json_array(text):
-        """
-        Extracts the first JSON array from a string.
-        Returns the JSON string, or None if not found.
-        """
-        match = re.search(r'\[\s*{.*?}\s*\]', text, re.DOTALL)
-        if match:
-            return match.group(0)
-        return None
-
-    def call_openai_model(model_name, attempt, max_retries):
-        try:
-            client = openai.OpenAI()
-            print(f"  [AI] Analyzing {audio_file} with {len(order_group)} orders... (Attempt {attempt}, Model: {model_name})")
-            
-            # Use different parameters based on model
-            if model_name == "o3":
-                response = client.chat.completions.create(
-                    model=model_name,
-                    messages=[
-                        {"role": "system", "content": "You are an expert financial compliance analyst. Analyze trading orders and call transcripts for compliance and audit purposes."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-            else:
-                response = client.chat.completions.create(
-                    model=model_name,
-                    messages=[
-                        {"role": "system", "content": "You are an expert financial compliance analyst. Analyze trading orders and call transcripts for compliance and audit purposes."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-            
-            print(f"  [AI] Analysis complete.")
-            # Try to parse JSON from response
-            content = response.choices[0].message.content
-            if not content or not content.strip():
-                raise ValueError("Empty AI response")
-            json_str = extract_json_array(content)
-            if not json_str:
-                # fallback: try to parse from first [
-                json_start = content.find('[')
-                if json_start == -1:
-                    raise ValueError("No JSON array found in AI response")
-                json_str = content[json_start:]
-            result = json.loads(json_str)
-            return result, None
-        except Exception as e:
-            print(f"  [AI] JSON parse error (Attempt {attempt}, Model: {model_name}): {e}")
-            print(f"  [AI] Prompt was:\n{prompt}\n")
-            if 'response' in locals():
-                print(f"  [AI] Raw response was:\n{response.choices[0].message.content}\n")
-            if attempt == max_retries:
-                print(f"  [AI] All retries failed for {audio_file} on model {model_name}.")
-            else:
-                print(f"  [AI] Retrying...")
-            return None, e
-
-    # First try o3 model
-    max_retries = 3
-    for attempt in range(1, max_retries + 1):
-        result, error = call_openai_model("o3", attempt, max_retries)
-        if result is not None:
-            return result
-        if attempt == max_retries:
-            print(f"  [AI] Switching to gpt-4 for {audio_file}...")
-            # Try gpt-4 model
-            for gpt_attempt in range(1, 3):
-                result, error = call_openai_model("gpt-4", gpt_attempt, 2)
-                if result is not None:
-                    return result
-                if gpt_attempt == 2:
-                    print(f"  [AI] All retries failed for {audio_file} on gpt-4.")
-                    return [{
-                        'order_id': order.get('order_id', ''),
-                        'audio_mapped': 'yes',
-                        'order_discussed': 'no',
-                        'discrepancy': 'none',
-                        'complaint': 'none',
-                        'action': 'none',
-                        'ai_reasoning': f'AI response empty or invalid after retries on both o3 and gpt-4.'
-                    } for order in order_group]
+def analyze_orders_with_audio(order_group, transcript_content, audio_file, excerpt=False,
+                              source_count=1, unmentioned_orders=0, router=None):
+    prompt = build_ai_prompt(order_group, transcript_content, audio_file, excerpt)
+    print(f"[DEBUG] Prompt length for {audio_file}: {len(prompt)} chars, ~{estimate_tokens(prompt)} tokens")
+    # Fast model for simple groups, o3 for multi-order / ambiguous / low-confidence ones
+    router = router or TranscriptAnalysisRouter()
+    return router.analyze(prompt, order_group, audio_file,
+                           transcript_tokens=estimate_tokens(transcript_content),
+                           source_count=source_count, unmentioned_orders=unmentioned_orders)
 
 def analyze_orders_for_date(date_str):
     """
@@ -173,6 +102,7 @@ def analyze_orders_for_date(date_str):
     transcripts_path = f"{month_name}/Daily_Reports/{date_str}/transcripts_{date_str}"
     output_path = f"{month_name}/Daily_Reports/{date_str}/order_transcript_analysis_{date_str}.xlsx"
     progress_file = f"{month_name}/Daily_Reports/{date_str}/order_transcript_analysis_progress_{date_str}.jsonl"
+    model_stats_file = f"{month_name}/Daily_Reports/{date_str}/order_transcript_analysis_model_stats_{date_str}.json"
     
     # Check if input files exist
     if not os.path.exists(audio_order_file):
@@ -183,6 +113,13 @@ def analyze_orders_for_date(date_str):
         print(f"Transcripts directory not found: {transcripts_path}")
         return None
     
+    # Index new/changed transcripts (with client ids from call info) before the lookups below
+    try:
+        updated = ingest_date(os.path.dirname(transcripts_path))
+        print(f"Transcript store: {updated} transcript(s) indexed")
+    except Exception as e:
+        print(f"Could not update transcript store, reading files directly: {e}")
+    
     # Load audio-order mapping
     try:
         mapping_df = pd.read_excel(audio_order_file, sheet_name='Order_Audio_Mapping')
@@ -272,6 +209,13 @@ def analyze_orders_for_date(date_str):
                     continue
         print(f"Loaded {len(processed_orders)} previously processed orders")
     
+    # One router per day so its latency / token / escalation stats cover this date only
+    router = TranscriptAnalysisRouter()
+    
+    # Transcript tokens before / after relevance windowing, across all groups
+    transcript_tokens_full = 0
+    transcript_tokens_sent = 0
+    
     # Process each audio file group
     for audio_file, group in audio_groups:
         print(f"\nProcessing audio file: {audio_file}")
@@ -287,34 +231,18 @@ def analyze_orders_for_date(date_str):
         # Load transcript
         print(f"DEBUG: About to load transcript for {audio_file}")
         # Handle consolidated audio files (multiple files combined)
-        if ',' in audio_file:  # Multiple audio files (consolidated)
-            # Combine transcripts from multiple audio files
-            audio_files_list = [f.strip() for f in audio_file.split(',')]
-            combined_transcript = []
-            
-            for single_audio_file in audio_files_list:
-                transcript_file = get_transcript_path(single_audio_file, transcripts_path)
-                if os.path.exists(transcript_file):
-                    transcript_content = read_transcript_file(transcript_file)
-                    if transcript_content:
-                        combined_transcript.append(f"=== {single_audio_file} ===")
-                        combined_transcript.append(transcript_content)
-                        combined_transcript.append("")  # Add separator
-            
-            transcript_content = "\n".join(combined_transcript)
-            if not transcript_content.strip():
+        audio_files_list = [f.strip() for f in audio_file.split(',')]
+        transcript_sources = []
+        for single_audio_file in audio_files_list:
+            source = read_transcript_source(single_audio_file, transcripts_path)
+            if source is not None:
+                transcript_sources.append(source)
+        if not transcript_sources:
+            if len(audio_files_list) > 1:
                 print(f"Empty combined transcript for {audio_file}")
-                continue
-        else:  # Single audio file
-            transcript_file = get_transcript_path(audio_file, transcripts_path)
-            if not os.path.exists(transcript_file):
-                print(f"Transcript not found: {transcript_file}")
-                continue
-            
-            transcript_content = read_transcript_file(transcript_file)
-            if not transcript_content:
-                print(f"Empty transcript for {audio_file}")
-                continue
+            else:
+                print(f"Transcript not found or empty for {audio_file}")
+            continue
         
         # Convert group to list of dictionaries for analysis
         order_group = []
@@ -332,9 +260,22 @@ def analyze_orders_for_date(date_str):
                 'client_id': order['client_id']
             })
         
+        # Send only the passages that mention this group's orders (full transcript if none do)
+        transcript_content, window_stats = build_transcript_excerpt(transcript_sources, order_group)
+        saved_tokens = window_stats['full_tokens'] - window_stats['prompt_tokens']
+        print(f"[PROMPT] Transcript for {audio_file}: ~{window_stats['full_tokens']} -> ~{window_stats['prompt_tokens']} tokens "
+              f"({saved_tokens * 100 // max(window_stats['full_tokens'], 1)}% saved, "
+              f"{window_stats['kept_turns']}/{window_stats['total_turns']} turns, {window_stats['reason']})")
+        transcript_tokens_full += window_stats['full_tokens']
+        transcript_tokens_sent += window_stats['prompt_tokens']
+        
         # Analyze orders with AI
         print(f"DEBUG: About to call AI analysis for {len(order_group)} orders...")
-        analysis_results = analyze_orders_with_audio(order_group, transcript_content, audio_file)
+        analysis_results = analyze_orders_with_audio(order_group, transcript_content, audio_file,
+                                                     excerpt=window_stats['windowed'],
+                                                     source_count=len(transcript_sources),
+                                                     unmentioned_orders=len(window_stats['unmentioned']),
+                                                     router=router)
         print(f"DEBUG: AI analysis completed, got {len(analysis_results) if analysis_results else 0} results")
         
         if analysis_results:
@@ -373,6 +314,25 @@ def analyze_orders_for_date(date_str):
         else:
             print(f"Failed to analyze orders for {audio_file}")
     
+    if transcript_tokens_full:
+        print(f"\n[PROMPT] Transcript tokens sent: ~{transcript_tokens_sent} of ~{transcript_tokens_full} "
+              f"({(transcript_tokens_full - transcript_tokens_sent) * 100 // transcript_tokens_full}% saved by relevance windowing)")
+    
+    # Model routing stats: per-model latency / tokens and how often groups were escalated
+    router_summary = router.stats.summary()
+    if router_summary['groups']:
+        print(f"[AI] {router_summary['groups']} group(s), {router_summary['escalations']} escalated "
+              f"({router_summary['escalation_rate']:.0%}) {router_summary['escalation_reasons']}")
+        for model_name, model_stats in router_summary['models'].items():
+            print(f"[AI]   {model_name}: {model_stats['calls']} call(s), {model_stats['failures']} failed, "
+                  f"avg {model_stats['avg_latency_seconds']}s, {model_stats['prompt_tokens']} prompt + "
+                  f"{model_stats['completion_tokens']} completion tokens")
+        try:
+            with open(model_stats_file, 'w') as f:
+                json.dump(router_summary, f, indent=2)
+        except Exception as e:
+            print(f"Could not save model stats to {model_stats_file}: {e}")
+    
     # Create final DataFrame with all KL orders
     if all_results:
         # Create DataFrame from analyzed orders
@@ -32,6 +32,8 @@ try:
 except ImportError:
     FILE_DISCOVERY_AVAILABLE = False
 
+from audio_catalog import recordings_for_date
+
 def run_file_discovery_step(date_str):
     """Run file discovery and mapping step."""
     print(f"\n{'='*60}")
@@ -225,8 +227,8 @@ def check_data_exists(date_str):
         print(f"❌ Order file not found: {order_file}")
         return False
     
-    # Check if there are audio files (including .729 files)
-    audio_files = [f for f in os.listdir(call_dir) if f.endswith(('.wav', '.mp3', '.729'))]
+    # Check if there are audio files (including .729 files); this also catalogs new recordings
+    audio_files = recordings_for_date(date_str, local_only=True)
     if not audio_files:
         print(f"❌ No audio files found in: {call_dir}")
         return False
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test Fast Path Extraction
+A complete trade table only skips the LLM under a known subject template, and
+a table quoted again in a reply is not a second instruction.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_processing'))
+
+from fast_path_extraction import extract_fast_path, FAST_PATH_MIN_CONFIDENCE
+from html_parsing import parse_html
+from thread_compaction import strip_quoted_html
+
+TRADE_TABLE = [[
+    ['Client Code', 'Scrip', 'Qty', 'Rate', 'Buy/Sell'],
+    ['NEO1234', 'RELIANCE', '500', '1400', 'Buy'],
+]]
+
+
+def test_known_template_with_complete_table_passes():
+    result = extract_fast_path('Approval for Purchase - 18 Aug', TRADE_TABLE)
+    assert result['ai_confidence_score'] >= FAST_PATH_MIN_CONFIDENCE
+    assert result['ai_order_details'][0]['client_code'] == 'NEO1234'
+
+
+def test_complete_table_without_template_goes_to_llm():
+    result = extract_fast_path('Re: portfolio discussion', TRADE_TABLE)
+    assert result is not None
+    assert result['ai_confidence_score'] < FAST_PATH_MIN_CONFIDENCE
+
+
+def test_amendment_wording_goes_to_llm():
+    result = extract_fast_path('Approval for Purchase - 18 Aug', TRADE_TABLE, 'Please cancel the order below')
+    assert result['ai_confidence_score'] < FAST_PATH_MIN_CONFIDENCE
+
+
+ORIGINAL_HTML = (
+    "<p>Please approve the purchase below.</p>"
+    "<table><tr><td>Client Code</td><td>Scrip</td><td>Qty</td><td>Rate</td><td>Buy/Sell</td></tr>"
+    "<tr><td>NEO1234</td><td>RELIANCE</td><td>500</td><td>1400</td><td>Buy</td></tr></table>"
+)
+REPLY_HTML = ("<p>Approved.</p><div id=\"divRplyFwdMsg\"><p>From: rm@neo-wealth.com</p></div>"
+              + ORIGINAL_HTML)
+
+
+def test_quoted_reply_does_not_repeat_instructions():
+    # Thread tables as process_emails_by_date joins them: original plus a reply quoting it
+    thread_tables = parse_html(ORIGINAL_HTML, 'html')['tables'] + parse_html(REPLY_HTML, 'html')['tables']
+    result = extract_fast_path('RE: Approval for Purchase', thread_tables)
+    assert len(result['ai_order_details']) == 1, result['ai_order_details']
+
+
+def test_reply_tables_exclude_quoted_history():
+    assert parse_html(strip_quoted_html(REPLY_HTML), 'html')['tables'] == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
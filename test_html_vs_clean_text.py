@@ -5,13 +5,14 @@ This script tests if passing raw HTML to AI improves quantity extraction
 without modifying existing logic.
 """
 
-import json
 import os
 import sys
 import re
 import html as html_module
 from datetime import datetime
 
+from email_records import iter_email_records
+
 # Add email_processing to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'email_processing'))
 
@@ -200,11 +201,7 @@ def main():
             date_str = "08102025"
             email_file = f"email_surveillance_{date_str}.json"
             if os.path.exists(email_file):
-                with open(email_file, 'r') as f:
-                    email_surveillance = json.load(f)
-                
-                all_results = email_surveillance.get('all_results', [])
-                for result in all_results:
+                for result in iter_email_records(email_file):
                     subject = result.get('subject', '')
                     if 'ADCC' in subject and 'APPROVAL' in subject.upper():
                         sender = result.get('sender', '')
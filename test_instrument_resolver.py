@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test Instrument Resolver
+Regression cases for fuzzy symbol resolution: a shared first word must not
+resolve to a different company when it is the only candidate.
+"""
+
+from instrument_resolver import InstrumentResolver
+
+# (email text, only candidate symbol) pairs that must NOT resolve
+WRONG_INSTRUMENT_PAIRS = [
+    ('Tata Motors', 'TATASTEEL'),
+    ('HDFC Bank', 'HDFCLIFE'),
+    ('Reliance Power', 'RELIANCE'),
+    ('ICICI Prudential', 'ICICIBANK'),
+    ('Adani Power', 'ADANIENT'),
+]
+
+# (email text, candidates, expected symbol) that must still resolve
+RESOLVABLE_NAMES = [
+    ('Tata Steel', ['TATASTEEL'], 'TATASTEEL'),
+    ('Tata Motors Ltd', ['TATAMOTORS', 'TATASTEEL'], 'TATAMOTORS'),
+    ('HDFC Bank', ['HDFCBANK', 'HDFCLIFE'], 'HDFCBANK'),
+    ('Blue Jet', ['BLUEJET'], 'BLUEJET'),
+    ('Varun Bev', ['VBL'], 'VBL'),
+    ('BLUEJET-EQ', ['BLUEJET'], 'BLUEJET'),
+]
+
+
+def test_single_candidate_shared_first_word_is_not_a_match():
+    resolver = InstrumentResolver()
+    for text, candidate in WRONG_INSTRUMENT_PAIRS:
+        symbol, score, method = resolver.resolve(text, candidates=[candidate])
+        assert symbol is None, f"{text!r} resolved to {symbol} ({method}, {score})"
+
+
+def test_known_names_still_resolve():
+    resolver = InstrumentResolver()
+    for text, candidates, expected in RESOLVABLE_NAMES:
+        symbol, _, method = resolver.resolve(text, candidates=candidates)
+        assert symbol == expected, f"{text!r} -> {symbol} ({method}), expected {expected}"
+
+
+def test_misspelled_company_name_resolves_fuzzily():
+    resolver = InstrumentResolver()
+    resolver.add_symbol('MANAPPURAM', name='Manappuram Finance Limited')
+    resolver.add_symbol('MUTHOOTFIN', name='Muthoot Finance Limited')
+    symbol, _, method = resolver.resolve('Manapuram Finance', candidates=['MANAPPURAM', 'MUTHOOTFIN'])
+    assert (symbol, method) == ('MANAPPURAM', 'fuzzy')
+
+
+def test_fuzzy_resolution_cannot_be_decided_deterministically():
+    try:
+        from order_matching import DETERMINISTIC_MIN_CONFIDENCE, SYMBOL_METHOD_PENALTY
+    except ImportError as e:  # order_matching needs pandas
+        print(f"⚠️  Skipping deterministic threshold check: {e}")
+        return
+    assert 100 - SYMBOL_METHOD_PENALTY['fuzzy'] < DETERMINISTIC_MIN_CONFIDENCE
+
+
+def test_price_mismatch_cannot_be_decided_deterministically():
+    try:
+        from order_matching import DETERMINISTIC_MIN_CONFIDENCE, PRICE_MISMATCH_PENALTY
+    except ImportError as e:  # order_matching needs pandas
+        print(f"⚠️  Skipping deterministic threshold check: {e}")
+        return
+    # Exact quantity, exact symbol, wrong price
+    assert 100 - PRICE_MISMATCH_PENALTY < DETERMINISTIC_MIN_CONFIDENCE
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test Order Assignment
+Overlapping group proposals must be resolved one-to-one, and a group whose
+order set is chosen by the global assignment must carry a confidence and
+match type for that set, not the ones its matcher gave. Groups the matcher
+found nothing for only gain an exact quantity fit, whether or not the client
+has overlapping proposals.
+"""
+
+try:
+    import numpy as np
+    import pandas as pd
+    from order_book import CandidateIndex
+    from order_assignment import assign_orders_globally, hungarian
+    DEPENDENCIES_AVAILABLE = True
+except ImportError as e:  # order_book / order_assignment need numpy and pandas
+    print(f"⚠️  Skipping order assignment tests: {e}")
+    DEPENDENCIES_AVAILABLE = False
+
+CLIENT = 'NEO1234'
+
+ORDERS = [
+    {'NorenOrderID': '1001', 'ClientID': CLIENT, 'Symbol': 'RELIANCE', 'BuySell': 'BUY', 'Qty': 100, 'Price': 1400.0},
+    {'NorenOrderID': '1002', 'ClientID': CLIENT, 'Symbol': 'TATAMOTORS', 'BuySell': 'SELL', 'Qty': 50, 'Price': 712.5},
+    {'NorenOrderID': '1003', 'ClientID': CLIENT, 'Symbol': 'INFY', 'BuySell': 'BUY', 'Qty': 10, 'Price': 1500.0},
+]
+
+
+def _result(group_id, symbol, side, quantity, price, matched, match_type, confidence):
+    return {
+        'email_instruction': {
+            'group_id': group_id,
+            'client_code': CLIENT,
+            'instructions': [{'symbol': symbol, 'buy_sell': side, 'quantity': quantity, 'price': price}]
+        },
+        'matched_orders': [o for o in ORDERS if o['NorenOrderID'] in matched],
+        'match_type': match_type,
+        'confidence_score': confidence,
+        'discrepancies': [],
+        'review_flags': []
+    }
+
+
+def _scenario():
+    return [
+        _result('G1', 'RELIANCE', 'BUY', '100', '1400', ['1001'], 'EXACT_MATCH', 95),
+        # Wrong proposal: claims the RELIANCE order for a TATAMOTORS instruction
+        _result('G2', 'TATAMOTORS', 'SELL', '50', '712.50', ['1001'], 'PARTIAL_MATCH', 60),
+        # Matcher found nothing although a fitting order exists
+        _result('G3', 'INFY', 'BUY', '10', '1500', [], 'NO_MATCH', 0),
+    ]
+
+
+def test_overlapping_proposals_are_resolved_one_to_one():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    results = assign_orders_globally(_scenario(), CandidateIndex(pd.DataFrame(ORDERS)))
+    assigned = [o['NorenOrderID'] for r in results for o in r['matched_orders']]
+    assert len(assigned) == len(set(assigned)), assigned
+    assert [o['NorenOrderID'] for o in results[0]['matched_orders']] == ['1001']
+    assert results[0]['assignment'] == 'proposed'
+    assert [o['NorenOrderID'] for o in results[1]['matched_orders']] == ['1002']
+
+
+def test_reassigned_group_gets_confidence_for_its_new_orders():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    results = assign_orders_globally(_scenario(), CandidateIndex(pd.DataFrame(ORDERS)))
+    reassigned = results[1]
+    assert reassigned['assignment'] == 'reassigned'
+    assert reassigned['match_type'] == 'EXACT_MATCH'
+    assert reassigned['confidence_score'] == 100
+    assert any('Reassigned by global assignment' in d for d in reassigned['discrepancies'])
+
+
+def test_no_match_group_that_gains_orders_is_rescored_and_explained():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    results = assign_orders_globally(_scenario(), CandidateIndex(pd.DataFrame(ORDERS)))
+    gained = results[2]
+    assert [o['NorenOrderID'] for o in gained['matched_orders']] == ['1003']
+    assert gained['assignment'] == 'reassigned'
+    assert gained['match_type'] != 'NO_MATCH'
+    assert gained['confidence_score'] > 0
+    assert any('Matcher found no match' in d for d in gained['discrepancies']), gained['discrepancies']
+    assert any(f['type'] == 'GLOBAL_REASSIGNMENT' for f in gained['review_flags'])
+
+
+def _assign(results):
+    return assign_orders_globally(results, CandidateIndex(pd.DataFrame(ORDERS)))
+
+
+def test_no_match_group_gains_orders_the_same_way_without_overlap():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    # Same NO_MATCH group as above, but the client's proposals are disjoint
+    results = _assign([_result('G1', 'RELIANCE', 'BUY', '100', '1400', ['1001'], 'EXACT_MATCH', 95),
+                       _result('G3', 'INFY', 'BUY', '10', '1500', [], 'NO_MATCH', 0)])
+    assert results[0]['assignment'] == 'proposed' and results[0]['confidence_score'] == 95
+    assert [o['NorenOrderID'] for o in results[1]['matched_orders']] == ['1003']
+    assert any('Matcher found no match' in d for d in results[1]['discrepancies'])
+
+
+def test_no_match_group_without_exact_fit_stays_unmatched():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    unfit = _result('G3', 'INFY', 'BUY', '25', '1500', [], 'NO_MATCH', 0)  # only a 10-share order exists
+    for others in (_scenario()[:2], _scenario()[:1]):  # with and without overlapping proposals
+        results = _assign(others + [dict(unfit, discrepancies=[], review_flags=[])])
+        assert results[-1]['matched_orders'] == [], results[-1]
+        assert results[-1]['match_type'] == 'NO_MATCH' and results[-1]['assignment'] == 'unassigned'
+
+
+def test_no_match_group_does_not_take_a_proposed_order():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    results = _assign([_result('G1', 'RELIANCE', 'BUY', '100', '1400', ['1001'], 'EXACT_MATCH', 95),
+                       _result('G4', 'RELIANCE', 'BUY', '100', '1400', [], 'NO_MATCH', 0)])
+    assert [o['NorenOrderID'] for o in results[0]['matched_orders']] == ['1001']
+    assert results[1]['matched_orders'] == [] and results[1]['match_type'] == 'NO_MATCH'
+
+
+def test_hungarian_matches_brute_force():
+    if not DEPENDENCIES_AVAILABLE:
+        return
+    from itertools import permutations
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        cost = rng.integers(0, 50, size=(4, 5)).astype(float)
+        rows, cols = hungarian(cost)
+        best = min(sum(cost[r, c] for r, c in enumerate(p)) for p in permutations(range(5), 4))
+        assert cost[rows, cols].sum() == best
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
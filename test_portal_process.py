@@ -4,10 +4,11 @@ Test script to simulate portal surveillance process and compare results
 """
 import os
 import sys
-import json
 import pandas as pd
 from datetime import datetime
 
+from email_records import iter_email_records
+
 # Set gpt-4.1 as model (like portal does)
 os.environ['EMAIL_MODEL'] = 'gpt-4.1'
 
@@ -48,22 +49,17 @@ portal_json = f'email_surveillance_{date_str}.json'
 backup_json = 'test_backup/01092025/email_surveillance_01092025.json'
 
 if os.path.exists(portal_json) and os.path.exists(backup_json):
-    with open(portal_json) as f:
-        portal_data = json.load(f)
-    with open(backup_json) as f:
-        backup_data = json.load(f)
-    
     portal_orders = 0
     backup_orders = 0
     
-    for e in portal_data.get('all_results', []):
+    for e in iter_email_records(portal_json):
         det = e.get('ai_analysis', {}).get('ai_order_details', [])
         if isinstance(det, list):
             portal_orders += len(det)
         elif isinstance(det, dict):
             portal_orders += 1
     
-    for e in backup_data.get('all_results', []):
+    for e in iter_email_records(backup_json):
         det = e.get('ai_analysis', {}).get('ai_order_details', [])
         if isinstance(det, list):
             backup_orders += len(det)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test Thread Compaction
+Compaction must keep every identifier on the order-bearing lines of a thread,
+and must not fall back to raw HTML just because it stripped a signature or
+disclaimer (SEBI registration numbers, phone numbers, pin codes).
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_processing'))
+
+from thread_compaction import compact_thread, validate_compaction
+
+SIGNATURE = (
+    "<p>Regards,</p>"
+    "<p>Rahul Mehta</p>"
+    "<p>Neo Wealth Management | SEBI Reg. No. INZ000212137</p>"
+    "<p>Tel: 022 6123 4500 | Mobile: 9820012345</p>"
+    "<p>12th Floor, Tower A, Lower Parel, Mumbai 400013</p>"
+    "<p>Disclaimer: This e-mail is confidential and intended solely for the addressee. "
+    "Registration No. INH000009999 CIN U67190MH2019PTC123456</p>"
+)
+
+
+def _email(html, sender='dealer@neo-wealth.com', date='2025-08-18T09:30:00Z'):
+    return {
+        'sender': sender,
+        'date': date,
+        'subject': 'Order confirmation',
+        'body': {'contentType': 'html', 'content': html},
+        'clean_text': html
+    }
+
+
+def test_single_message_with_signature_is_compacted():
+    thread = [_email(
+        "<p>Dear Sir,</p><p>Please buy 500 shares of RELIANCE at 1400 for client code NEO1234.</p>"
+        + SIGNATURE)]
+    content, stats = compact_thread(thread)
+    assert stats['compacted'], stats['fallback_reason']
+    assert 'NEO1234' in content and '500' in content and '1400' in content
+    assert 'INH000009999' not in content  # disclaimer dropped
+
+
+def test_reply_thread_with_quoted_signature_is_compacted():
+    first = _email(
+        "<p>Hi team,</p>"
+        "<table><tr><td>Client Code</td><td>Symbol</td><td>Qty</td><td>Price</td><td>Side</td></tr>"
+        "<tr><td>NEO1234</td><td>TATAMOTORS</td><td>250</td><td>712.50</td><td>SELL</td></tr></table>"
+        + SIGNATURE, sender='client@example.com')
+    reply = _email(
+        "<p>Confirmed, order placed.</p>" + SIGNATURE
+        + "<div id=\"divRplyFwdMsg\"><p>From: client@example.com Sent: Monday</p></div>"
+        + first['body']['content'],
+        date='2025-08-18T09:45:00Z')
+    content, stats = compact_thread([first, reply])
+    assert stats['compacted'], stats['fallback_reason']
+    assert 'NEO1234 | TATAMOTORS | 250 | 712.50 | SELL' in content
+    assert content.count('TATAMOTORS') == 1  # quoted copy dropped from the reply
+
+
+def test_lost_order_line_falls_back():
+    full = "Please buy 500 RELIANCE at 1400 for NEO1234\nRegards"
+    ok, reason = validate_compaction(full, "Please buy RELIANCE")
+    assert not ok and '1400' in reason and 'NEO1234' in reason
+
+
+def test_signature_identifiers_are_not_required():
+    full = ("Buy 500 RELIANCE at 1400 for NEO1234\nRegards,\n"
+            "SEBI Reg. No. INZ000212137\nTel: 022 6123 4500\nMumbai 400013")
+    ok, reason = validate_compaction(full, "Buy 500 RELIANCE at 1400 for NEO1234\nRegards,")
+    assert ok, reason
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test Transcript Windows
+A group's transcript is only windowed when every one of its orders is
+mentioned somewhere; otherwise the model gets the full call, and the group is
+routed to the strong model.
+"""
+
+from transcript_windows import TranscriptSource, build_transcript_excerpt
+
+FILLER = "Haan ji, market aaj thoda volatile hai, result season chal raha hai, dekhte hain kya hota hai aage."
+
+TURNS = (
+    [{'speaker': 'Dealer', 'text': 'Good morning sir, Neo Wealth se bol raha hoon.'},
+     {'speaker': 'Client', 'text': 'Haan bolo, client code NEO1234.'}]
+    + [{'speaker': 'Dealer' if i % 2 else 'Client', 'text': FILLER} for i in range(12)]
+    + [{'speaker': 'Client', 'text': 'Tata Motors mein 200 shares kharid lo 950 pe.'},
+       {'speaker': 'Dealer', 'text': 'Theek hai sir, TATAMOTORS 200 at 950 buy.'}]
+    + [{'speaker': 'Dealer' if i % 2 else 'Client', 'text': FILLER} for i in range(12)]
+    + [{'speaker': 'Client', 'text': 'Aur RIL poora nikal do.'},
+       {'speaker': 'Dealer', 'text': 'Ji sir, ho jayega.'}]
+    + [{'speaker': 'Dealer' if i % 2 else 'Client', 'text': FILLER} for i in range(6)]
+)
+CONTENT = "\n".join(f"{t['speaker']}: {t['text']}" for t in TURNS)
+
+TATAMOTORS = {'symbol': 'TATAMOTORS', 'quantity': 200, 'price': 950, 'side': 'BUY'}
+RELIANCE = {'symbol': 'RELIANCE', 'quantity': 40, 'price': 0, 'side': 'SELL'}
+
+
+def _source():
+    return TranscriptSource('call_0930.wav', CONTENT, TURNS)
+
+
+def test_mentioned_orders_are_windowed():
+    text, stats = build_transcript_excerpt([_source()], [TATAMOTORS])
+    assert stats['windowed'], stats['reason']
+    assert 'TATAMOTORS 200 at 950' in text
+    assert stats['kept_turns'] < stats['total_turns']
+
+
+def test_unmentioned_order_sends_full_transcript():
+    text, stats = build_transcript_excerpt([_source()], [TATAMOTORS, RELIANCE])
+    assert not stats['windowed']
+    assert 'RELIANCE' in stats['reason']
+    assert 'RIL poora nikal do' in text
+    assert stats['unmentioned'] == ['RELIANCE']
+
+
+def test_short_transcript_reports_unmentioned_orders():
+    turns = TURNS[-8:-6]
+    content = "\n".join(f"{t['speaker']}: {t['text']}" for t in turns)
+    _, stats = build_transcript_excerpt([TranscriptSource('call_0931.wav', content, turns)], [RELIANCE])
+    assert stats['reason'] == 'short transcript'
+    assert stats['unmentioned'] == ['RELIANCE']
+
+
+def test_unmentioned_order_is_routed_to_strong_model():
+    try:
+        from transcript_analysis_router import TranscriptAnalysisRouter
+    except ImportError as e:  # the router needs openai
+        print(f"⚠️  Skipping router check: {e}")
+        return
+    _, stats = build_transcript_excerpt([_source()], [RELIANCE])
+    tier, reason = TranscriptAnalysisRouter().choose_tier(1, stats['prompt_tokens'],
+                                                          unmentioned_orders=len(stats['unmentioned']))
+    assert tier == 'strong', reason
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
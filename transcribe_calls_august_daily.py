@@ -1,9 +1,20 @@
 import os
-import glob
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from vertexai.generative_models import GenerativeModel, Part
 import vertexai
-from audio_utils import get_audio_file_for_processing, cleanup_converted_file
+from audio_preprocessing import preprocess_audio, to_original_time
+from audio_metadata import audio_duration
+from ai_concurrency import call_with_retry
+from transcript_store import open_store, stitch_turns, format_turns, turns_file_for, write_turns_file
+from audio_catalog import recordings_for_date
+from audio_utils import evict_audio_cache
+
+# Segments of one long call transcribed in parallel
+SEGMENT_CONCURRENCY = int(os.getenv('TRANSCRIBE_SEGMENT_CONCURRENCY', '4'))
+
 
 def transcribe_calls_for_date(date_str):
     """
@@ -52,12 +63,8 @@ def transcribe_calls_for_date(date_str):
         print(f"Call records directory not found: {call_records_path}")
         return None
     
-    # Get all audio files for the specific date (including .729 files)
-    audio_files = (
-        glob.glob(os.path.join(call_records_path, "*.wav")) + 
-        glob.glob(os.path.join(call_records_path, "*.mp3")) +
-        glob.glob(os.path.join(call_records_path, "*.729"))
-    )
+    # Get all audio files for the specific date (including .729 files) from the audio catalog
+    audio_files = [recording['local_path'] for recording in recordings_for_date(date_str, local_only=True)]
     
     if not audio_files:
         print(f"No audio files found in {call_records_path}")
@@ -81,20 +88,83 @@ Dealer: <...>
 """
         )
     
-    # Transcribe a single file
-    def transcribe_file(audio_path):
-        with open(audio_path, "rb") as f:
-            audio_bytes = f.read()
-        audio_content = Part.from_data(data=audio_bytes, mime_type="audio/wav")
-        prompt = get_prompt()
-        contents = [audio_content, prompt]
-        response = model.generate_content(contents=contents)
-        return response.text.strip()
+    # Part-of-call note for segmented recordings (keeps speaker roles consistent across segments)
+    def get_segment_note(index, total):
+        return (
+            f"\nThis audio is part {index} of {total} of one continuous call; the same client and dealer "
+            "speak throughout. It may start or end mid-sentence. Transcribe only this part, with no "
+            "introduction, summary or closing remarks.\n"
+        )
+    
+    # Transcribe one segment, reusing its cached transcript if an earlier run got that far
+    def transcribe_segment(segment, index, total, segment_cache_dir):
+        # Keyed on the PCM, not the encoded upload: the Ogg muxer writes a random stream serial
+        cache_file = os.path.join(segment_cache_dir, f"segment_{index:03d}_of_{total:03d}_{segment['content_key']}.txt")
+        if os.path.exists(cache_file):
+            with open(cache_file, "r", encoding='utf-8') as f:
+                return f.read()
+        audio_content = Part.from_data(data=segment['data'], mime_type=segment['mime_type'])
+        prompt = get_prompt() + (get_segment_note(index, total) if total > 1 else "")
+        response = call_with_retry(model.generate_content, contents=[audio_content, prompt],
+                                   description=f"Transcription of segment {index}/{total}")
+        text = response.text.strip()
+        os.makedirs(segment_cache_dir, exist_ok=True)
+        with open(cache_file, "w", encoding='utf-8') as f:
+            f.write(text)
+        return text
+    
+    # Transcribe a single file: silence trimmed, long calls split, segments transcribed concurrently.
+    # Returns the dialogue text and its speaker turns with offsets into the original recording.
+    def transcribe_file(audio_path, timestamp_map_file, segment_cache_dir):
+        audio = preprocess_audio(audio_path)
+        segments = audio['segments']
+        if audio['trimmed']:
+            print(f"  Trimmed {audio['original_seconds']}s -> {audio['kept_seconds']}s, "
+                  f"{audio['original_bytes']:,} -> {audio['encoded_bytes']:,} bytes ({segments[0]['mime_type']})")
+            # Offsets in the transcript refer to the trimmed audio; keep the map back to the recording
+            with open(timestamp_map_file, "w", encoding='utf-8') as f:
+                json.dump({
+                    'audio_file': os.path.basename(audio_path),
+                    'original_seconds': audio['original_seconds'],
+                    'kept_seconds': audio['kept_seconds'],
+                    'spans': audio['timestamp_map'],
+                    'segments': [{'start': segment['start'], 'end': segment['end']} for segment in segments]
+                }, f, indent=2)
+        
+        # Segment spans for turn offsets (an untrimmed file is one segment of its header duration)
+        spans = [(segment['start'], segment['end'] if segment['end'] is not None else audio_duration(audio_path))
+                 for segment in segments]
+        to_original = (lambda seconds: to_original_time(seconds, audio['timestamp_map'])) if audio['trimmed'] else None
+        
+        total = len(segments)
+        if total == 1:
+            text = transcribe_segment(segments[0], 1, 1, segment_cache_dir).strip()
+            return text, stitch_turns([text], spans, to_original)
+        
+        print(f"  Split into {total} segments, transcribing {min(total, SEGMENT_CONCURRENCY)} at a time")
+        with ThreadPoolExecutor(max_workers=min(total, SEGMENT_CONCURRENCY)) as executor:
+            futures = [executor.submit(transcribe_segment, segment, index, total, segment_cache_dir)
+                       for index, segment in enumerate(segments, 1)]
+            parts = []
+            failed = []
+            for index, future in enumerate(futures, 1):
+                try:
+                    parts.append(future.result())
+                except Exception as e:
+                    failed.append(index)
+                    print(f"  Segment {index}/{total} failed: {e}")
+        if failed:
+            # Finished segments stay cached; the next run only retries these
+            raise RuntimeError(f"{len(failed)} of {total} segments failed ({failed})")
+        turns = stitch_turns(parts, spans, to_original)
+        return format_turns(turns), turns
     
     # Process each audio file
     for audio_file in audio_files:
         filename = os.path.basename(audio_file)
         transcript_file = os.path.join(transcripts_path, filename + ".txt")
+        timestamp_map_file = os.path.join(transcripts_path, filename + ".timemap.json")
+        segment_cache_dir = os.path.join(transcripts_path, ".segments", filename)
         
         # Skip if transcript already exists
         if os.path.exists(transcript_file):
@@ -103,27 +173,25 @@ Dealer: <...>
         
         print(f"Transcribing {filename}...")
         
-        # Convert .729 files to WAV if needed
-        converted_file = None
         try:
-            processing_file = get_audio_file_for_processing(audio_file, convert_to_wav=True)
-            if processing_file != audio_file:
-                converted_file = processing_file
-                print(f"  Converted .729 file to WAV: {os.path.basename(converted_file)}")
-            
-            transcript = transcribe_file(processing_file)
+            transcript, turns = transcribe_file(audio_file, timestamp_map_file, segment_cache_dir)
+            # Turns first: the .txt marks the file as done
+            write_turns_file(turns_file_for(transcript_file), turns)
             with open(transcript_file, "w", encoding='utf-8') as f:
                 f.write(transcript)
-            print(f"  Transcript saved: {transcript_file}")
+            print(f"  Transcript saved: {transcript_file} ({len(turns)} speaker turns)")
+            shutil.rmtree(segment_cache_dir, ignore_errors=True)
+            try:
+                open_store().put(date_str, filename, transcript, source_path=transcript_file, turns=turns)
+            except Exception as e:
+                print(f"  Could not index transcript (will be picked up on next read): {e}")
             
         except Exception as e:
             print(f"  Error transcribing {filename}: {e}")
             continue
-        finally:
-            # Clean up converted file if it was created
-            if converted_file and converted_file != audio_file:
-                cleanup_converted_file(converted_file)
     
+    # Decoded .729 audio is only needed while transcribing; keep the cache bounded
+    evict_audio_cache()
     print(f"Transcription completed for {date_str}")
     return transcripts_path
 
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Model-tier routing for order / call transcript analysis.
+
+Most order groups are one order on one short call, where a fast model gives
+the same answer as o3 without the reasoning latency. Each group is routed:
+
+- fast tier (TRANSCRIPT_FAST_MODEL): one order, one call, transcript of at
+  most TRANSCRIPT_FAST_MAX_TOKENS
+- strong tier (TRANSCRIPT_STRONG_MODEL): multi-order or clustered groups and
+  transcripts with no passage mentioning the orders (ambiguous)
+
+Fast results are escalated to the strong tier when a result has confidence
+below TRANSCRIPT_MIN_CONFIDENCE, results are missing, or the call fails.
+Both tiers use structured output (a strict JSON schema), so there are no
+parse retries; transient API errors are retried with backoff
+(ai_concurrency.call_with_retry). Each tier has a request timeout (latency
+budget), and TRANSCRIPT_STRONG_TOKEN_BUDGET optionally caps the tokens a run
+may spend on the strong tier, after which groups stay on the fast tier.
+
+Per-model calls, failures, latency and token usage plus the escalation rate
+are kept in RouterStats; summary() returns them for the run log.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import openai
+
+from ai_concurrency import call_with_retry
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_FAST_MODEL = os.getenv('TRANSCRIPT_FAST_MODEL', 'gpt-4.1-mini')
+TRANSCRIPT_STRONG_MODEL = os.getenv('TRANSCRIPT_STRONG_MODEL', 'o3')
+# Groups up to this size (orders, transcript tokens) start on the fast tier
+TRANSCRIPT_FAST_MAX_ORDERS = int(os.getenv('TRANSCRIPT_FAST_MAX_ORDERS', '1'))
+TRANSCRIPT_FAST_MAX_TOKENS = int(os.getenv('TRANSCRIPT_FAST_MAX_TOKENS', '2000'))
+# Fast results below this confidence are re-run on the strong tier
+TRANSCRIPT_MIN_CONFIDENCE = float(os.getenv('TRANSCRIPT_MIN_CONFIDENCE', '0.7'))
+# Latency budget per request, in seconds
+TRANSCRIPT_FAST_TIMEOUT_SECONDS = float(os.getenv('TRANSCRIPT_FAST_TIMEOUT_SECONDS', '60'))
+TRANSCRIPT_STRONG_TIMEOUT_SECONDS = float(os.getenv('TRANSCRIPT_STRONG_TIMEOUT_SECONDS', '300'))
+# Strong-tier tokens allowed per run (0 = no limit)
+TRANSCRIPT_STRONG_TOKEN_BUDGET = int(os.getenv('TRANSCRIPT_STRONG_TOKEN_BUDGET', '0'))
+
+SYSTEM_PROMPT = ("You are an expert financial compliance analyst. Analyze trading orders and call transcripts "
+                 "for compliance and audit purposes.")
+
+_ORDER_RESULT_FIELDS = {
+    'order_id': {'type': 'string'},
+    'symbol': {'type': 'string'},
+    'qty': {'type': 'string'},
+    'price': {'type': 'string'},
+    'buy_sell': {'type': 'string'},
+    'order_time': {'type': 'string'},
+    'audio_mapped': {'type': 'string', 'enum': ['yes']},
+    'order_discussed': {'type': 'string', 'enum': ['yes', 'no']},
+    'discrepancy': {'type': 'string'},
+    'complaint': {'type': 'string'},
+    'action': {'type': 'string', 'enum': ['none', 'review', 'investigate', 'reverse']},
+    'ai_reasoning': {'type': 'string'},
+    'confidence': {'type': 'number'}
+}
+
+ORDER_ANALYSIS_SCHEMA = {
+    'name': 'order_transcript_analysis',
+    'strict': True,
+    'schema': {
+        'type': 'object',
+        'properties': {
+            'orders': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': _ORDER_RESULT_FIELDS,
+                    'required': list(_ORDER_RESULT_FIELDS),
+                    'additionalProperties': False
+                }
+            }
+        },
+        'required': ['orders'],
+        'additionalProperties': False
+    }
+}
+
+
+class RouterStats:
+    """Per-model call counts, latency and token usage, plus escalations"""
+
+    def __init__(self):
+        self.models: Dict[str, Dict] = {}
+        self.groups = 0
+        self.escalations = 0
+        self.escalation_reasons: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_call(self, model: str, seconds: float, usage=None, failed: bool = False):
+        with self._lock:
+            entry = self.models.setdefault(model, {
+                'calls': 0, 'failures': 0, 'latency_seconds': 0.0, 'max_latency_seconds': 0.0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'reasoning_tokens': 0})
+            entry['calls'] += 1
+            entry['failures'] += int(failed)
+            entry['latency_seconds'] += seconds
+            entry['max_latency_seconds'] = max(entry['max_latency_seconds'], seconds)
+            if usage is not None:
+                entry['prompt_tokens'] += getattr(usage, 'prompt_tokens', 0) or 0
+                entry['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+                details = getattr(usage, 'completion_tokens_details', None)
+                entry['reasoning_tokens'] += getattr(details, 'reasoning_tokens', 0) or 0
+
+    def record_group(self, escalation_reason: Optional[str] = None):
+        with self._lock:
+            self.groups += 1
+            if escalation_reason:
+                self.escalations += 1
+                self.escalation_reasons[escalation_reason] = self.escalation_reasons.get(escalation_reason, 0) + 1
+
+    def tokens_used(self, model: str) -> int:
+        with self._lock:
+            entry = self.models.get(model, {})
+            return entry.get('prompt_tokens', 0) + entry.get('completion_tokens', 0)
+
+    def summary(self) -> Dict:
+        """Stats for the run log: per model averages and the escalation rate"""
+        with self._lock:
+            models = {}
+            for model, entry in self.models.items():
+                models[model] = dict(entry, latency_seconds=round(entry['latency_seconds'], 2),
+                                     max_latency_seconds=round(entry['max_latency_seconds'], 2),
+                                     avg_latency_seconds=round(entry['latency_seconds'] / max(entry['calls'], 1), 2))
+            return {
+                'groups': self.groups,
+                'escalations': self.escalations,
+                'escalation_rate': round(self.escalations / self.groups, 3) if self.groups else 0.0,
+                'escalation_reasons': dict(self.escalation_reasons),
+                'models': models
+            }
+
+
+def _align_results(results: List[Dict], order_group: List[Dict]) -> Optional[List[Dict]]:
+    """Results in order_group order (matched by order_id); None when an order has no result"""
+    by_id = {str(result.get('order_id', '')).strip(): result for result in results}
+    aligned = [by_id.get(str(order.get('order_id', '')).strip()) for order in order_group]
+    if all(result is not None for result in aligned):
+        return aligned
+    # Some models echo order ids reformatted (e.g. scientific notation) - fall back to position
+    if len(results) == len(order_group):
+        return results
+    return None
+
+
+class TranscriptAnalysisRouter:
+    """Routes order-group analyses between the fast and strong model tiers"""
+
+    def __init__(self, fast_model: str = None, strong_model: str = None):
+        self.fast_model = fast_model or TRANSCRIPT_FAST_MODEL
+        self.strong_model = strong_model or TRANSCRIPT_STRONG_MODEL
+        self.stats = RouterStats()
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = openai.OpenAI()
+        return self._client
+
+    def choose_tier(self, order_count: int, transcript_tokens: int, source_count: int = 1,
+                    unmentioned_orders: int = 0) -> Tuple[str, str]:
+        """
+        Initial tier for a group.
+
+        Args:
+            order_count: Orders in the group
+            transcript_tokens: Estimated tokens of the transcript text in the prompt
+            source_count: Audio files whose transcripts are in the prompt
+            unmentioned_orders: Orders no transcript turn mentions (transcript_windows stats['unmentioned'])
+
+        Returns:
+            ('fast' | 'strong', reason)
+        """
+        if order_count > TRANSCRIPT_FAST_MAX_ORDERS:
+            return 'strong', 'multi-order group'
+        if source_count > 1:
+            return 'strong', 'clustered calls'
+        if unmentioned_orders:
+            return 'strong', 'order not located in transcript'
+        if transcript_tokens > TRANSCRIPT_FAST_MAX_TOKENS:
+            return 'strong', 'long transcript'
+        return 'fast', 'simple group'
+
+    def _strong_budget_left(self) -> bool:
+        return not TRANSCRIPT_STRONG_TOKEN_BUDGET or \
+            self.stats.tokens_used(self.strong_model) < TRANSCRIPT_STRONG_TOKEN_BUDGET
+
+    def _call(self, model: str, prompt: str, order_group: List[Dict], label: str) -> Optional[List[Dict]]:
+        """One structured-output request; None when it fails or returns unusable results"""
+        timeout = TRANSCRIPT_STRONG_TIMEOUT_SECONDS if model == self.strong_model else TRANSCRIPT_FAST_TIMEOUT_SECONDS
+        print(f"  [AI] Analyzing {label} with {len(order_group)} orders... (Model: {model})")
+        started = time.time()
+        try:
+            response = call_with_retry(
+                self.client.with_options(timeout=timeout).chat.completions.create,
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={'type': 'json_schema', 'json_schema': ORDER_ANALYSIS_SCHEMA},
+                description=f"{model} analysis of {label}")
+        except Exception as e:
+            self.stats.record_call(model, time.time() - started, failed=True)
+            print(f"  [AI] {model} request failed for {label}: {e}")
+            return None
+        elapsed = time.time() - started
+        content = response.choices[0].message.content or ''
+        try:
+            results = _align_results(json.loads(content).get('orders', []), order_group)
+        except (ValueError, AttributeError) as e:
+            results = None
+            print(f"  [AI] Unparseable {model} response for {label} ({len(prompt)} char prompt): {e}; "
+                  f"response starts: {content[:200]!r}")
+        self.stats.record_call(model, elapsed, getattr(response, 'usage', None), failed=results is None)
+        if results is None:
+            print(f"  [AI] {model} returned no usable result for every order in {label}")
+            return None
+        print(f"  [AI] Analysis complete ({model}, {elapsed:.1f}s).")
+        return results
+
+    def analyze(self, prompt: str, order_group: List[Dict], label: str, transcript_tokens: int,
+                source_count: int = 1, unmentioned_orders: int = 0) -> List[Dict]:
+        """
+        Analyze one order group, escalating to the strong tier when needed.
+
+        Args:
+            prompt: Full analysis prompt
+            order_group: The group's orders (results come back in this order)
+            label: Audio file(s) for log messages
+            transcript_tokens: Estimated tokens of the transcript text in the prompt
+            source_count: Audio files whose transcripts are in the prompt
+            unmentioned_orders: Orders no transcript turn mentions (transcript_windows stats['unmentioned'])
+
+        Returns:
+            One result dict per order (a 'not discussed' placeholder when every tier failed)
+        """
+        tier, reason = self.choose_tier(len(order_group), transcript_tokens, source_count, unmentioned_orders)
+        if tier == 'strong' and not self._strong_budget_left():
+            print(f"  [AI] Strong-tier token budget used up, keeping {label} on {self.fast_model} ({reason})")
+            tier = 'fast'
+
+        results = None
+        escalation_reason = None
+        tried = []
+        if tier == 'fast':
+            tried.append(self.fast_model)
+            results = self._call(self.fast_model, prompt, order_group, label)
+            if results is None:
+                escalation_reason = 'fast model failed'
+            elif any((result.get('confidence') or 0) < TRANSCRIPT_MIN_CONFIDENCE for result in results):
+                escalation_reason = 'low confidence'
+            if escalation_reason and not self._strong_budget_left():
+                print(f"  [AI] Not escalating {label} ({escalation_reason}): strong-tier token budget used up")
+                escalation_reason = None
+            if escalation_reason:
+                print(f"  [AI] Escalating {label} to {self.strong_model} ({escalation_reason})")
+        else:
+            print(f"  [AI] Routing {label} to {self.strong_model} ({reason})")
+
+        if tier == 'strong' or escalation_reason:
+            tried.append(self.strong_model)
+            strong_results = self._call(self.strong_model, prompt, order_group, label)
+            results = strong_results or results
+        self.stats.record_group(escalation_reason)
+
+        if results is None:
+            print(f"  [AI] All models failed for {label}.")
+            return [{
+                'order_id': order.get('order_id', ''),
+                'audio_mapped': 'yes',
+                'order_discussed': 'no',
+                'discrepancy': 'none',
+                'complaint': 'none',
+                'action': 'none',
+                'ai_reasoning': f"AI response empty or invalid on {' and '.join(tried)}."
+            } for order in order_group]
+        return results
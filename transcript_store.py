@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+SQLite transcript store with a full-text index.
+
+Call transcripts are written as loose {audio}.txt files under
+{Month}/Daily_Reports/{date}/transcripts_{date}/. This module keeps one row per
+transcript (date, audio filename, client ids, speaker turns, content hash) in
+TRANSCRIPT_STORE_FILE, with an FTS5 index over the text, so that:
+
+- the order/transcript analysis, the Call Extract column and the dashboard
+  read transcripts with one indexed lookup (the .txt file is only re-read
+  when its size or mtime changed), and
+- keyword searches across months ("RELIANCE OR \"stop loss\"") do not scan
+  thousands of files.
+
+The transcriber also writes {audio}.turns.jsonl next to each .txt: one
+{"turn", "speaker", "text", "offset"} object per speaker turn, with the offset
+in seconds into the original recording. The store keeps these turns so prompt
+builders and the dashboard can work on turns instead of the free text.
+
+The .txt files stay the source of truth; the store is refreshed from them on
+read and by ingest_directory(). When the SQLite build has no FTS5, search()
+falls back to LIKE matching.
+
+    python transcript_store.py ingest [--month August]
+    python transcript_store.py search 'RELIANCE OR "stop loss"' --from 2025-08-01 --to 2025-08-31
+"""
+import os
+import re
+import glob
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_STORE_FILE = os.getenv(
+    'TRANSCRIPT_STORE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcript_store.sqlite')
+)
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.729')
+
+# Structured speaker turns written by the transcriber next to each {audio}.txt
+TURNS_SUFFIX = '.turns.jsonl'
+
+SPEAKER_LINE = re.compile(r'^[\W_]*(client|dealer)[\s*_]*:[\s*_]*(.*)$', re.IGNORECASE)
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS transcripts ("
+    "id INTEGER PRIMARY KEY, date TEXT NOT NULL, call_date TEXT, audio_filename TEXT NOT NULL, "
+    "client_ids TEXT, turns TEXT, turn_count INTEGER, content TEXT, content_hash TEXT, "
+    "source_path TEXT, source_mtime REAL, source_size INTEGER, updated TEXT, "
+    "UNIQUE (date, audio_filename))",
+    "CREATE INDEX IF NOT EXISTS transcripts_call_date ON transcripts (call_date)",
+]
+
+# External-content FTS5 index kept in sync with the transcripts table by triggers
+_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5("
+    "audio_filename, content, content='transcripts', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS transcripts_ai AFTER INSERT ON transcripts BEGIN "
+    "INSERT INTO transcripts_fts (rowid, audio_filename, content) VALUES (new.id, new.audio_filename, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS transcripts_ad AFTER DELETE ON transcripts BEGIN "
+    "INSERT INTO transcripts_fts (transcripts_fts, rowid, audio_filename, content) "
+    "VALUES ('delete', old.id, old.audio_filename, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS transcripts_au AFTER UPDATE OF content ON transcripts BEGIN "
+    "INSERT INTO transcripts_fts (transcripts_fts, rowid, audio_filename, content) "
+    "VALUES ('delete', old.id, old.audio_filename, old.content); "
+    "INSERT INTO transcripts_fts (rowid, audio_filename, content) VALUES (new.id, new.audio_filename, new.content); END",
+]
+
+
+def stitch_turns(parts: List[str], spans: Optional[List[tuple]] = None,
+                 to_original: Optional[Callable[[float], float]] = None) -> List[Dict]:
+    """
+    Speaker turns of a (possibly segmented) 'Client: ... / Dealer: ...' transcript.
+
+    Speaker labels are normalised ('**CLIENT:**' -> 'Client'), unlabelled lines
+    are appended to the previous turn, and when a segment cut fell inside one
+    speaker's turn, the first line of the next part is merged into that turn.
+
+    Args:
+        parts: Transcript text of each audio segment, in order
+        spans: (start, end) seconds of each segment; a turn's offset is
+            interpolated from its character position within its part
+        to_original: Maps a segment offset to the original recording (trimmed audio)
+
+    Returns:
+        [{'speaker': 'Client' | 'Dealer' | None, 'text': ..., 'offset': seconds or None}, ...]
+    """
+    turns: List[Dict] = []
+    for index, part in enumerate(parts):
+        start, end = spans[index] if spans and index < len(spans) else (None, None)
+        position = 0
+        first_line_of_part = True
+        for raw_line in part.splitlines(keepends=True):
+            line_position = position
+            position += len(raw_line)
+            line = raw_line.strip()
+            if not line:
+                continue
+            offset = None
+            if start is not None and end is not None and part:
+                offset = start + (end - start) * line_position / len(part)
+                if to_original is not None:
+                    offset = to_original(offset)
+                offset = round(offset, 1)
+            match = SPEAKER_LINE.match(line)
+            if match:
+                speaker, text = match.group(1).capitalize(), match.group(2).strip()
+                if first_line_of_part and turns and turns[-1]['speaker'] == speaker:
+                    turns[-1]['text'] = f"{turns[-1]['text']} {text}".strip()
+                else:
+                    turns.append({'speaker': speaker, 'text': text, 'offset': offset})
+            elif turns:
+                # Continuation line without a label belongs to the previous speaker
+                turns[-1]['text'] = f"{turns[-1]['text']} {line}".strip()
+            else:
+                turns.append({'speaker': None, 'text': line, 'offset': offset})
+            first_line_of_part = False
+    return turns
+
+
+def format_turns(turns: List[Dict]) -> str:
+    """Turns back to 'Speaker: text' dialogue lines"""
+    return "\n".join(f"{turn['speaker']}: {turn['text']}" if turn['speaker'] else turn['text'] for turn in turns)
+
+
+def parse_speaker_turns(content: str) -> List[Dict]:
+    """Speaker turns of a plain transcript (no offsets)"""
+    return stitch_turns([content])
+
+
+def turns_file_for(transcript_file: str) -> str:
+    """{audio}.turns.jsonl next to {audio}.txt"""
+    base = transcript_file[:-len('.txt')] if transcript_file.endswith('.txt') else transcript_file
+    return base + TURNS_SUFFIX
+
+
+def write_turns_file(path: str, turns: List[Dict]):
+    """One JSON object per turn: turn number, speaker, text, offset (seconds into the recording)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for number, turn in enumerate(turns, 1):
+            f.write(json.dumps({'turn': number, 'speaker': turn['speaker'], 'text': turn['text'],
+                                'offset': turn.get('offset')}, ensure_ascii=False))
+            f.write('\n')
+
+
+def read_turns_file(path: str) -> Optional[List[Dict]]:
+    """Turns from a .turns.jsonl file, or None if it is missing or unreadable"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable turns file {path}: {e}")
+        return None
+
+
+def transcript_date(transcripts_path: str) -> Optional[str]:
+    """DDMMYYYY date of a transcripts_{date} directory"""
+    name = os.path.basename(os.path.normpath(transcripts_path))
+    return name[len('transcripts_'):] if name.startswith('transcripts_') else None
+
+
+def _call_date(date_str: str) -> Optional[str]:
+    """DDMMYYYY -> YYYY-MM-DD (for range queries across months)"""
+    try:
+        return datetime.strptime(date_str, '%d%m%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def transcript_candidates(audio_filename: str) -> List[str]:
+    """
+    Audio filenames a transcript may be stored under.
+    Reports sometimes drop the extension (transcripts are named {audio}.mp3.txt)
+    or carry the .txt suffix.
+    """
+    name = audio_filename.strip()
+    if name.endswith('.txt'):
+        name = name[:-len('.txt')]
+    if name.lower().endswith(AUDIO_EXTENSIONS):
+        return [name]
+    return [name + '.mp3', name]
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def load_call_client_ids(call_info_file: str) -> Dict[str, List[str]]:
+    """
+    Audio filename -> client ids from a call_info_output_{date}.xlsx file.
+
+    Returns:
+        {} when the file is missing or unreadable
+    """
+    if not os.path.exists(call_info_file):
+        return {}
+    try:
+        import pandas as pd
+        df = pd.read_excel(call_info_file, usecols=['filename', 'client_id'])
+    except Exception as e:
+        logger.warning(f"Could not read client ids from {call_info_file}: {e}")
+        return {}
+    client_ids: Dict[str, List[str]] = {}
+    for filename, client_id in zip(df['filename'], df['client_id']):
+        if pd.isna(filename) or pd.isna(client_id) or not str(client_id).strip():
+            continue
+        ids = client_ids.setdefault(str(filename), [])
+        if str(client_id) not in ids:
+            ids.append(str(client_id))
+    return client_ids
+
+
+class TranscriptStore:
+    """
+    One SQLite connection shared by the threads of a process (the dashboard
+    serves requests concurrently), serialised with a lock.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or TRANSCRIPT_STORE_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+        self.fts = True
+        try:
+            with self._conn:
+                for statement in _FTS_SCHEMA:
+                    self._conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 unavailable, transcript search falls back to LIKE: {e}")
+            self.fts = False
+
+    def close(self):
+        self._conn.close()
+
+    def _row(self, date: str, audio_filename: str) -> Optional[sqlite3.Row]:
+        return self._conn.execute(
+            "SELECT * FROM transcripts WHERE date = ? AND audio_filename = ?", (date, audio_filename)
+        ).fetchone()
+
+    def put(self, date: str, audio_filename: str, content: str, client_ids: Optional[List[str]] = None,
+            source_path: Optional[str] = None, turns: Optional[List[Dict]] = None,
+            source_mtime: Optional[float] = None, source_size: Optional[int] = None) -> bool:
+        """
+        Insert or refresh one transcript.
+
+        Args:
+            date: DDMMYYYY date of the transcripts directory
+            audio_filename: Audio file name (without the .txt suffix)
+            content: Transcript text
+            client_ids: Client ids of the call (None keeps the stored ones)
+            source_path: .txt file the content was read from
+            turns: Structured turns (from the .turns.jsonl file); parsed from the text if None
+            source_mtime: Modification time of a source that is not a local file (e.g. S3 LastModified)
+            source_size: Size of a source that is not a local file
+
+        Returns:
+            True if the content changed (and was re-indexed)
+        """
+        digest = content_hash(content)
+        if source_path and os.path.exists(source_path):
+            stat = os.stat(source_path)
+            source_mtime, source_size = stat.st_mtime, stat.st_size
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            existing = self._row(date, audio_filename)
+            if client_ids is None and existing is not None:
+                client_ids_json = existing['client_ids']
+            else:
+                client_ids_json = json.dumps(client_ids or [])
+            if existing is not None and existing['content_hash'] == digest:
+                # Same text: only the file metadata / client ids / turn offsets move (no re-index)
+                turns_json = json.dumps(turns, ensure_ascii=False) if turns is not None else existing['turns']
+                self._conn.execute(
+                    "UPDATE transcripts SET client_ids = ?, turns = ?, source_path = ?, source_mtime = ?, "
+                    "source_size = ? WHERE id = ?",
+                    (client_ids_json, turns_json, source_path, source_mtime, source_size, existing['id'])
+                )
+                return False
+            if turns is None:
+                turns = parse_speaker_turns(content)
+            values = (client_ids_json, json.dumps(turns, ensure_ascii=False), len(turns), content, digest,
+                      source_path, source_mtime, source_size, now)
+            if existing is None:
+                self._conn.execute(
+                    "INSERT INTO transcripts (date, call_date, audio_filename, client_ids, turns, turn_count, "
+                    "content, content_hash, source_path, source_mtime, source_size, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (date, _call_date(date), audio_filename) + values
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE transcripts SET client_ids = ?, turns = ?, turn_count = ?, content = ?, "
+                    "content_hash = ?, source_path = ?, source_mtime = ?, source_size = ?, updated = ? "
+                    "WHERE id = ?",
+                    values + (existing['id'],)
+                )
+            return True
+
+    def _refresh_from_file(self, date: str, audio_filename: str, source_path: str,
+                           client_ids: Optional[List[str]] = None) -> Optional[str]:
+        """Stored content for a .txt file, re-reading the file only if it changed on disk"""
+        stat = os.stat(source_path)
+        with self._lock:
+            row = self._row(date, audio_filename)
+        if row is not None and row['source_mtime'] == stat.st_mtime and row['source_size'] == stat.st_size \
+                and (client_ids is None or json.loads(row['client_ids'] or '[]') == client_ids):
+            return row['content']
+        with open(source_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        turns = read_turns_file(turns_file_for(source_path))
+        self.put(date, audio_filename, content, client_ids, source_path, turns)
+        return content
+
+    def get_stored(self, date: str, audio_filename: str) -> Optional[Dict]:
+        """Stored transcript row (content, turns, client ids, ...) without touching the file system"""
+        with self._lock:
+            for name in transcript_candidates(audio_filename):
+                row = self._row(date, name)
+                if row is not None:
+                    record = dict(row)
+                    record['client_ids'] = json.loads(record['client_ids'] or '[]')
+                    record['turns'] = json.loads(record['turns'] or '[]')
+                    return record
+        return None
+
+    def get_transcript(self, audio_filename: str, transcripts_path: Optional[str] = None,
+                       date: Optional[str] = None) -> Optional[str]:
+        """
+        Transcript text for one audio file.
+
+        Args:
+            audio_filename: Audio file name as written in the reports (extension optional)
+            transcripts_path: transcripts_{date} directory holding the .txt files
+            date: DDMMYYYY date (defaults to the one in transcripts_path)
+
+        Returns:
+            Transcript text, or None if there is no transcript
+        """
+        date = date or (transcript_date(transcripts_path) if transcripts_path else None)
+        if not date:
+            raise ValueError(f"No date given for transcript lookup of {audio_filename}")
+        for name in transcript_candidates(audio_filename):
+            source_path = os.path.join(transcripts_path, name + '.txt') if transcripts_path else None
+            if source_path and os.path.exists(source_path):
+                return self._refresh_from_file(date, name, source_path)
+            with self._lock:
+                row = self._row(date, name)
+            if row is not None:
+                return row['content']
+        return None
+
+    def get_turns(self, audio_filename: str, transcripts_path: Optional[str] = None,
+                  date: Optional[str] = None) -> Optional[List[Dict]]:
+        """
+        Structured speaker turns of one transcript (see get_transcript for the arguments).
+
+        Returns:
+            [{'turn', 'speaker', 'text', 'offset'}, ...], or None if there is no transcript
+        """
+        date = date or (transcript_date(transcripts_path) if transcripts_path else None)
+        if self.get_transcript(audio_filename, transcripts_path, date) is None:
+            return None
+        stored = self.get_stored(date, audio_filename)
+        if stored is None:
+            return None
+        return [{'turn': number, 'speaker': turn.get('speaker'), 'text': turn.get('text'),
+                 'offset': turn.get('offset')} for number, turn in enumerate(stored['turns'], 1)]
+
+    def ingest_directory(self, transcripts_path: str, date: Optional[str] = None,
+                         client_ids: Optional[Dict[str, List[str]]] = None) -> int:
+        """
+        Bring the store up to date with a transcripts_{date} directory.
+        Only files whose size/mtime changed are read.
+
+        Args:
+            transcripts_path: Directory of {audio}.txt transcripts
+            date: DDMMYYYY date (defaults to the one in the directory name)
+            client_ids: Optional audio filename -> client ids (see load_call_client_ids)
+
+        Returns:
+            Number of transcripts read from disk
+        """
+        date = date or transcript_date(transcripts_path)
+        if not date or not os.path.isdir(transcripts_path):
+            return 0
+        client_ids = client_ids or {}
+        read = 0
+        for entry in os.scandir(transcripts_path):
+            if not entry.is_file() or not entry.name.endswith('.txt'):
+                continue
+            audio_filename = entry.name[:-len('.txt')]
+            with self._lock:
+                row = self._row(date, audio_filename)
+            stat = entry.stat()
+            wanted_ids = client_ids.get(audio_filename)
+            if row is not None and row['source_mtime'] == stat.st_mtime and row['source_size'] == stat.st_size \
+                    and (wanted_ids is None or json.loads(row['client_ids'] or '[]') == wanted_ids):
+                continue
+            try:
+                self._refresh_from_file(date, audio_filename, entry.path, wanted_ids)
+                read += 1
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Could not ingest transcript {entry.path}: {e}")
+        return read
+
+    def search(self, query: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+               client_id: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """
+        Keyword search across all stored transcripts.
+
+        Args:
+            query: FTS5 query, e.g. 'RELIANCE OR "stop loss"'
+            date_from: First call date (YYYY-MM-DD), inclusive
+            date_to: Last call date (YYYY-MM-DD), inclusive
+            client_id: Only calls linked to this client id
+            limit: Maximum number of results
+
+        Returns:
+            [{'date', 'call_date', 'audio_filename', 'client_ids', 'snippet'}, ...], best match first
+        """
+        filters, params = [], []
+        if date_from:
+            filters.append("t.call_date >= ?")
+            params.append(date_from)
+        if date_to:
+            filters.append("t.call_date <= ?")
+            params.append(date_to)
+        if client_id:
+            filters.append("EXISTS (SELECT 1 FROM json_each(t.client_ids) WHERE value = ?)")
+            params.append(client_id)
+        where = ''.join(f" AND {condition}" for condition in filters)
+
+        if self.fts:
+            sql = ("SELECT t.date, t.call_date, t.audio_filename, t.client_ids, "
+                   "snippet(transcripts_fts, 1, '[', ']', '...', 16) AS snippet "
+                   "FROM transcripts_fts JOIN transcripts t ON t.id = transcripts_fts.rowid "
+                   f"WHERE transcripts_fts MATCH ?{where} ORDER BY rank LIMIT ?")
+            params = [query] + params + [limit]
+        else:
+            # Without FTS5: any of the OR-separated terms/phrases as a substring
+            terms = [term.strip().strip('"') for term in re.split(r'\s+OR\s+', query) if term.strip()]
+            match = ' OR '.join("t.content LIKE ?" for _ in terms) or '0'
+            sql = ("SELECT t.date, t.call_date, t.audio_filename, t.client_ids, substr(t.content, 1, 200) AS snippet "
+                   f"FROM transcripts t WHERE ({match}){where} ORDER BY t.call_date DESC LIMIT ?")
+            params = [f"%{term}%" for term in terms] + params + [limit]
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            result['client_ids'] = json.loads(result['client_ids'] or '[]')
+            results.append(result)
+        return results
+
+
+_stores: Dict[str, TranscriptStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path: str = None) -> TranscriptStore:
+    """Process-wide store for path (defaults to TRANSCRIPT_STORE_FILE)"""
+    path = path or TRANSCRIPT_STORE_FILE
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TranscriptStore(path)
+        return _stores[path]
+
+
+def get_transcript(audio_filename: str, transcripts_path: Optional[str] = None,
+                   date: Optional[str] = None) -> Optional[str]:
+    """
+    Transcript text through the store; reads the .txt file directly if the
+    store cannot be used (locked, read-only or corrupt database).
+    """
+    try:
+        return open_store().get_transcript(audio_filename, transcripts_path, date)
+    except sqlite3.Error as e:
+        logger.warning(f"Transcript store unavailable ({e}), reading {audio_filename} from disk")
+    if not transcripts_path:
+        return None
+    for name in transcript_candidates(audio_filename):
+        source_path = os.path.join(transcripts_path, name + '.txt')
+        if os.path.exists(source_path):
+            with open(source_path, 'r', encoding='utf-8') as f:
+                return f.read()
+    return None
+
+
+def get_turns(audio_filename: str, transcripts_path: Optional[str] = None,
+              date: Optional[str] = None) -> Optional[List[Dict]]:
+    """Speaker turns through the store; parsed from the transcript file if the store cannot be used"""
+    try:
+        return open_store().get_turns(audio_filename, transcripts_path, date)
+    except sqlite3.Error as e:
+        logger.warning(f"Transcript store unavailable ({e}), parsing turns of {audio_filename} from disk")
+    content = get_transcript(audio_filename, transcripts_path, date)
+    if content is None:
+        return None
+    return [dict(turn, turn=number) for number, turn in enumerate(parse_speaker_turns(content), 1)]
+
+
+def ingest_date(date_dir: str, client_ids: Optional[Dict[str, List[str]]] = None) -> int:
+    """
+    Ingest {Month}/Daily_Reports/{date}: its transcripts and, when present,
+    the client ids from call_info_output_{date}.xlsx.
+    """
+    date_str = os.path.basename(os.path.normpath(date_dir))
+    if client_ids is None:
+        client_ids = load_call_client_ids(os.path.join(date_dir, f"call_info_output_{date_str}.xlsx"))
+    return open_store().ingest_directory(os.path.join(date_dir, f"transcripts_{date_str}"), date_str, client_ids)
+
+
+def _daily_report_dirs(base_dir: str, months: Optional[Iterable[str]] = None) -> List[str]:
+    pattern_months = list(months) if months else ['*']
+    dirs = []
+    for month in pattern_months:
+        dirs.extend(glob.glob(os.path.join(base_dir, month, 'Daily_Reports', '*', 'transcripts_*')))
+    return sorted(os.path.dirname(path) for path in dirs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Transcript store: ingest transcripts and search them")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help="Index transcripts_{date} directories")
+    ingest_parser.add_argument('--base-dir', default='.', help="Directory holding the {Month} folders")
+    ingest_parser.add_argument('--month', action='append', help="Month folder to ingest (repeatable, default all)")
+    search_parser = subparsers.add_parser('search', help="Keyword search")
+    search_parser.add_argument('query', help='FTS5 query, e.g. \'RELIANCE OR "stop loss"\'')
+    search_parser.add_argument('--from', dest='date_from', help="First call date (YYYY-MM-DD)")
+    search_parser.add_argument('--to', dest='date_to', help="Last call date (YYYY-MM-DD)")
+    search_parser.add_argument('--client', help="Client id")
+    search_parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        total = 0
+        for date_dir in _daily_report_dirs(args.base_dir, args.month):
+            read = ingest_date(date_dir)
+            total += read
+            print(f"{date_dir}: {read} transcript(s) updated")
+        print(f"Ingested {total} transcript(s) into {TRANSCRIPT_STORE_FILE}")
+    else:
+        results = open_store().search(args.query, args.date_from, args.date_to, args.client, args.limit)
+        for result in results:
+            clients = ', '.join(result['client_ids']) or '-'
+            print(f"{result['call_date'] or result['date']}  {result['audio_filename']}  [{clients}]")
+            print(f"    {result['snippet']}")
+        print(f"{len(results)} match(es)")
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Relevance-windowed transcripts for order analysis prompts.
+
+A call (or a cluster of calls) often runs to thousands of words while the
+orders mapped to it are discussed in a handful of turns. Instead of sending
+the whole transcript, each transcript's speaker turns are indexed locally -
+symbol names and aliases, numbers (quantities, prices, strikes) and buy/sell
+wording - and only the turns that mention the group's orders are kept, with
+TRANSCRIPT_WINDOW_CONTEXT_TURNS turns of context on each side and the
+opening turns of the call. Omitted stretches are marked in the excerpt.
+
+The full transcript is used when any of the orders has no matching turn,
+when the transcript is already short, or when the excerpt would keep most of
+it anyway.
+"""
+import os
+import re
+import logging
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from instrument_resolver import get_resolver, name_key, symbol_key
+from transcript_store import format_turns, parse_speaker_turns
+
+logger = logging.getLogger(__name__)
+
+# Turns kept on each side of a matching turn
+TRANSCRIPT_WINDOW_CONTEXT_TURNS = int(os.getenv('TRANSCRIPT_WINDOW_CONTEXT_TURNS', '2'))
+# Opening turns always kept (greeting, client identification)
+TRANSCRIPT_WINDOW_OPENING_TURNS = int(os.getenv('TRANSCRIPT_WINDOW_OPENING_TURNS', '2'))
+# Transcripts shorter than this are sent whole
+TRANSCRIPT_WINDOW_MIN_TOKENS = int(os.getenv('TRANSCRIPT_WINDOW_MIN_TOKENS', '300'))
+# Excerpts keeping more than this share of the turns are not worth it
+TRANSCRIPT_WINDOW_MAX_KEPT_RATIO = float(os.getenv('TRANSCRIPT_WINDOW_MAX_KEPT_RATIO', '0.8'))
+
+# Turn scores: a symbol mention anchors a window on its own, a number does
+# too (quantity / price / strike), side wording only adds weight
+SYMBOL_SCORE = 3
+NUMBER_SCORE = 2
+SIDE_SCORE = 1
+ANCHOR_SCORE = 2
+
+SIDE_WORDS = {
+    'BUY': {'buy', 'buying', 'bought', 'purchase', 'purchased', 'accumulate', 'add', 'long', 'kharid', 'kharido', 'lelo'},
+    'SELL': {'sell', 'selling', 'sold', 'exit', 'square', 'squareoff', 'book', 'short', 'bech', 'becho', 'bechna', 'nikal', 'nikalo'}
+}
+OPTION_WORDS = {'CE': {'ce', 'call', 'calls'}, 'PE': {'pe', 'put', 'puts'}, 'FUT': {'fut', 'future', 'futures'}}
+# Trailing words of compact symbols that are dropped in speech (HDFCBANK -> hdfc)
+SYMBOL_SUFFIX_WORDS = ('bank', 'fin', 'finance', 'motors', 'steel', 'power', 'ind', 'infra', 'pharma', 'ltd')
+NUMBER_MULTIPLIERS = {'k': 1e3, 'thousand': 1e3, 'hazar': 1e3, 'lakh': 1e5, 'lakhs': 1e5, 'lac': 1e5, 'crore': 1e7, 'cr': 1e7}
+
+# Derivative trading symbols: NIFTY25AUG24500CE, BANKNIFTY28AUG2025FUT, RELIANCE 1400 PE
+DERIVATIVE_SYMBOL = re.compile(
+    r'^(?P<root>[A-Z&]+?)\s*(?:\d{1,2}\s*[A-Z]{3}\s*(?:\d{2,4})?)?\s*(?P<strike>\d+(?:\.\d+)?)?\s*(?P<kind>CE|PE|FUT)$')
+NUMBER_PATTERN = re.compile(r'(?<![\w.])(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|hazar|lakhs?|lac|crore|cr)?\b', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+# Numbers this small ("1 minute", "2 lots") match far too many turns
+MIN_MATCH_NUMBER = 10
+
+
+class TranscriptSource(NamedTuple):
+    audio_file: str
+    content: str
+    turns: List[Dict]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text or '') // 4
+
+
+def _numbers_in(text: str) -> Set[float]:
+    numbers = set()
+    for digits, unit in NUMBER_PATTERN.findall(text):
+        try:
+            value = float(digits.replace(',', ''))
+        except ValueError:
+            continue
+        if unit:
+            value *= NUMBER_MULTIPLIERS.get(unit.lower(), 1)
+        numbers.add(value)
+    return numbers
+
+
+def _to_number(value) -> Optional[float]:
+    try:
+        number = float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+    return number if number == number and number > 0 else None  # drops NaN / market-order 0
+
+
+def symbol_aliases(symbol: str) -> Tuple[Set[str], Set[str]]:
+    """
+    Ways a symbol may be said on a call.
+
+    Args:
+        symbol: OrderBook symbol (cash or derivative)
+
+    Returns:
+        (compact aliases matched against turn text without spaces, e.g. 'hdfcbank',
+        word aliases matched as whole words, e.g. 'ce' / 'call' for option symbols)
+    """
+    symbol = str(symbol or '').strip().upper()
+    compact: Set[str] = set()
+    words: Set[str] = set()
+    if not symbol or symbol == 'NAN':
+        return compact, words
+
+    derivative = DERIVATIVE_SYMBOL.match(symbol)
+    root = symbol_key(derivative.group('root')) if derivative else symbol_key(symbol)
+    if root:
+        compact.add(root)
+        for suffix in SYMBOL_SUFFIX_WORDS:
+            if root.endswith(suffix) and len(root) - len(suffix) >= 3:
+                compact.add(root[:-len(suffix)])
+    if derivative:
+        words |= OPTION_WORDS.get(derivative.group('kind'), set())
+    try:
+        for name in get_resolver().names_for(derivative.group('root') if derivative else symbol):
+            compact.add(name.replace(' ', ''))
+    except Exception as e:
+        logger.debug(f"Instrument aliases unavailable for {symbol}: {e}")
+    return {alias for alias in compact if len(alias) >= 3}, words
+
+
+class TranscriptIndex:
+    """Per-turn words, compact text, numbers and sides of one transcript"""
+
+    def __init__(self, turns: List[Dict]):
+        self.turns = turns
+        self.compact: List[str] = []
+        self.numbers: Dict[float, Set[int]] = {}
+        self.words: Dict[str, Set[int]] = {}
+        self.sides: Dict[str, Set[int]] = {side: set() for side in SIDE_WORDS}
+        for position, turn in enumerate(turns):
+            text = str(turn.get('text') or '')
+            key = name_key(text)
+            self.compact.append(key.replace(' ', ''))
+            turn_words = set(WORD_PATTERN.findall(key))
+            for word in turn_words:
+                self.words.setdefault(word, set()).add(position)
+            for side, side_words in SIDE_WORDS.items():
+                if turn_words & side_words:
+                    self.sides[side].add(position)
+            for number in _numbers_in(text):
+                self.numbers.setdefault(number, set()).add(position)
+
+    def _number_hits(self, value: Optional[float], tolerance: float) -> Set[int]:
+        if value is None or value < MIN_MATCH_NUMBER:
+            return set()
+        hits: Set[int] = set()
+        for number, positions in self.numbers.items():
+            if abs(number - value) <= tolerance:
+                hits |= positions
+        return hits
+
+    def score(self, order: Dict) -> Dict[int, int]:
+        """Relevance score per turn position for one order"""
+        scores: Dict[int, int] = {}
+
+        def add(positions, points):
+            for position in positions:
+                scores[position] = scores.get(position, 0) + points
+
+        compact_aliases, word_aliases = symbol_aliases(order.get('symbol'))
+        add({position for position, text in enumerate(self.compact)
+             if any(alias in text for alias in compact_aliases)}, SYMBOL_SCORE)
+        for word in word_aliases:
+            add(self.words.get(word, ()), SIDE_SCORE)
+
+        quantity = _to_number(order.get('quantity'))
+        price = _to_number(order.get('price'))
+        add(self._number_hits(quantity, 0), NUMBER_SCORE)
+        # Prices are said rounded ("1520" for 1519.85)
+        add(self._number_hits(price, max(1.0, price * 0.005) if price else 0), NUMBER_SCORE)
+        derivative = DERIVATIVE_SYMBOL.match(str(order.get('symbol') or '').strip().upper())
+        if derivative and derivative.group('strike'):
+            add(self._number_hits(_to_number(derivative.group('strike')), 0), NUMBER_SCORE)
+
+        side = str(order.get('side') or '').strip().upper()[:1]
+        side = {'B': 'BUY', 'S': 'SELL'}.get(side)
+        if side:
+            add(self.sides[side], SIDE_SCORE)
+        return scores
+
+
+def order_anchors(turns: List[Dict], orders: List[Dict]) -> List[Set[int]]:
+    """Positions of the turns that mention each order (one set per order, empty when unmentioned)"""
+    index = TranscriptIndex(turns)
+    return [{position for position, points in index.score(order).items() if points >= ANCHOR_SCORE}
+            for order in orders]
+
+
+def select_turns(turns: List[Dict], orders: List[Dict], context_turns: int = None) -> List[int]:
+    """
+    Positions of the turns relevant to any of the orders, with context.
+
+    Args:
+        turns: Speaker turns of one transcript
+        orders: Order dicts with symbol, quantity, price and side
+        context_turns: Turns kept on each side of a match (defaults to TRANSCRIPT_WINDOW_CONTEXT_TURNS)
+
+    Returns:
+        Sorted turn positions; empty when no turn mentions the orders
+    """
+    context_turns = TRANSCRIPT_WINDOW_CONTEXT_TURNS if context_turns is None else context_turns
+    anchors: Set[int] = set().union(*order_anchors(turns, orders))
+    if not anchors:
+        return []
+    selected = set(range(min(TRANSCRIPT_WINDOW_OPENING_TURNS, len(turns))))
+    for anchor in anchors:
+        selected.update(range(max(0, anchor - context_turns), min(len(turns), anchor + context_turns + 1)))
+    return sorted(selected)
+
+
+def format_excerpt(turns: List[Dict], positions: List[int]) -> str:
+    """Selected turns as dialogue lines, with gaps marked"""
+    lines = []
+    previous = -1
+    for position in positions:
+        if position > previous + 1:
+            lines.append(f"[... {position - previous - 1} turn(s) omitted ...]")
+        lines.append(format_turns([turns[position]]))
+        previous = position
+    if previous < len(turns) - 1:
+        lines.append(f"[... {len(turns) - previous - 1} turn(s) omitted ...]")
+    return "\n".join(lines)
+
+
+def _join_sources(parts: List[Tuple[str, str]]) -> str:
+    """Single transcript as is; several under '=== audio file ===' headers (as combined before)"""
+    if len(parts) == 1:
+        return parts[0][1]
+    combined = []
+    for audio_file, text in parts:
+        combined.extend([f"=== {audio_file} ===", text, ""])
+    return "\n".join(combined)
+
+
+def build_transcript_excerpt(sources: List[TranscriptSource], orders: List[Dict]) -> Tuple[str, Dict]:
+    """
+    Transcript text for one order group's prompt.
+
+    Args:
+        sources: Transcripts of the group's audio file(s) with their speaker turns
+        orders: The group's orders
+
+    Returns:
+        (transcript text, stats) where stats has 'windowed', 'reason', 'full_tokens',
+        'prompt_tokens', 'kept_turns', 'total_turns' and 'unmentioned' (symbols of the
+        orders no turn mentions)
+    """
+    sources = [source if source.turns else source._replace(turns=parse_speaker_turns(source.content))
+               for source in sources if source.content]
+    full_text = _join_sources([(source.audio_file, source.content) for source in sources])
+    total_turns = sum(len(source.turns) for source in sources)
+    stats = {'windowed': False, 'reason': None, 'full_tokens': estimate_tokens(full_text),
+             'prompt_tokens': estimate_tokens(full_text), 'kept_turns': total_turns, 'total_turns': total_turns,
+             'unmentioned': []}
+
+    # An order no turn mentions may still be on the call in words the index does not
+    # know ("RIL poora nikal do") - dropping those turns would hide it from the model
+    mentioned = [False] * len(orders)
+    for source in sources:
+        for i, anchors in enumerate(order_anchors(source.turns, orders)):
+            mentioned[i] = mentioned[i] or bool(anchors)
+    unmentioned = [str(order.get('symbol') or '?') for order, found in zip(orders, mentioned) if not found]
+    stats['unmentioned'] = unmentioned
+
+    if stats['full_tokens'] < TRANSCRIPT_WINDOW_MIN_TOKENS:
+        stats['reason'] = 'short transcript'
+        return full_text, stats
+    if unmentioned:
+        stats['reason'] = f"no relevant passage for {', '.join(unmentioned)}"
+        return full_text, stats
+
+    parts = []
+    kept_turns = 0
+    for source in sources:
+        positions = select_turns(source.turns, orders)
+        kept_turns += len(positions)
+        if positions:
+            parts.append((source.audio_file, format_excerpt(source.turns, positions)))
+        elif len(sources) > 1:
+            parts.append((source.audio_file, "[no passage mentions these orders]"))
+    if not kept_turns:
+        stats['reason'] = 'no relevant passages found'
+        return full_text, stats
+    if kept_turns > total_turns * TRANSCRIPT_WINDOW_MAX_KEPT_RATIO:
+        stats['reason'] = 'most of the transcript is relevant'
+        return full_text, stats
+
+    excerpt = _join_sources(parts)
+    stats.update(windowed=True, reason='relevant passages', prompt_tokens=estimate_tokens(excerpt),
+                 kept_turns=kept_turns)
+    return excerpt, stats